@@ -4,6 +4,9 @@ from main import MainWindow, GraphingCalculator
 from PyQt6.QtWidgets import QApplication, QMessageBox
 import sys
 
+import metrics
+import query_profiler
+
 
 class CalculatorApp:
     def __init__(self):
@@ -34,6 +37,8 @@ class CalculatorApp:
 
 
 def main():
+    metrics.configure_from_env()
+    query_profiler.configure_from_env()
     app = CalculatorApp()
     sys.exit(app.run())
 
@@ -0,0 +1,120 @@
+# async_database.py
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from PyQt6.QtCore import QObject, pyqtSignal
+
+from database import AdvancedDatabase
+
+
+class AsyncDatabase(QObject):
+    """
+    Non-blocking facade over AdvancedDatabase for the GUI thread.
+
+    Every public AdvancedDatabase method is available under the same name but
+    returns a concurrent.futures.Future (use asyncio.wrap_future to await it).
+    Calls run one at a time on a dedicated database thread; results come back
+    on the Qt thread through callback/errback and the result_ready/error signals.
+    Passing a channel makes the call supersede the previous one on that channel:
+    it is cancelled if it has not started, and its result is dropped otherwise.
+    """
+    result_ready = pyqtSignal(str, object)  # channel, result
+    error = pyqtSignal(str, str)  # channel, message
+    _finished = pyqtSignal(object)
+
+    def __init__(self, db_file="calculator.db", parent=None):
+        super().__init__(parent)
+        self.db_file = db_file
+        self.db = None
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='database')
+        self.latest = {}
+        self._in_flight = 0
+        self._closed = False
+        self._lock = threading.Lock()
+        self._finished.connect(self._deliver)
+        # Schema setup runs on the database thread as well, ahead of any query
+        self.executor.submit(self._open, db_file)
+
+    def _open(self, db_file):
+        self.db = AdvancedDatabase(db_file)
+
+    def __getattr__(self, name):
+        if name.startswith('_') or not callable(getattr(AdvancedDatabase, name, None)):
+            raise AttributeError(name)
+
+        def call(*args, channel=None, callback=None, errback=None, **kwargs):
+            return self.submit(name, *args, channel=channel, callback=callback, errback=errback, **kwargs)
+        call.__name__ = name
+        call.__doc__ = getattr(AdvancedDatabase, name).__doc__
+        return call
+
+    def submit(self, method_name, *args, channel=None, callback=None, errback=None, **kwargs):
+        """Queue db.<method_name>(*args, **kwargs) on the database thread and return its Future"""
+        with self._lock:
+            if self._closed:
+                # Late work (e.g. a thumbnail finishing after its window closed) is dropped
+                logging.debug(f"Database closed; dropping {method_name}")
+                future = Future()
+                future.cancel()
+                return future
+            self._in_flight += 1
+        future = self.executor.submit(self._run, method_name, args, kwargs)
+        previous = self.latest.get(channel) if channel else None
+        if channel:
+            self.latest[channel] = future
+        future.add_done_callback(
+            lambda done: self._done(channel, done, callback, errback))
+        if previous is not None:
+            previous.cancel()
+        return future
+
+    def _done(self, channel, future, callback, errback):
+        with self._lock:
+            self._in_flight -= 1
+        self._finished.emit((channel, future, callback, errback))
+
+    def _run(self, method_name, args, kwargs):
+        return getattr(self.db, method_name)(*args, **kwargs)
+
+    def pending(self):
+        """Number of queued or running database calls"""
+        return self._in_flight
+
+    def _deliver(self, payload):
+        channel, future, callback, errback = payload
+        if channel:
+            if self.latest.get(channel) is not future:
+                return  # superseded by a newer call on the same channel
+            del self.latest[channel]
+        if future.cancelled():
+            return
+        exception = future.exception()
+        if exception is not None:
+            logging.error(f"Database call failed: {str(exception)}")
+            if errback:
+                errback(exception)
+            self.error.emit(channel or '', str(exception))
+            return
+        result = future.result()
+        if callback:
+            callback(result)
+        self.result_ready.emit(channel or '', result)
+
+    def shutdown(self, wait=True):
+        """Stop accepting work and let queued calls finish"""
+        self.executor.shutdown(wait=wait)
+
+    def close(self):
+        """Finish queued calls, then close the database and stop the database thread"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        self.executor.submit(self._close)
+        self.executor.shutdown(wait=True)
+
+    def _close(self):
+        if self.db is not None:
+            self.db.close()
+            self.db = None
@@ -21,7 +21,20 @@ class User:
 
 class DatabaseHandler:
     def __init__(self):
-        self.db = AdvancedDatabase()
+        self._db = None
+
+    @property
+    def db(self):
+        # Opened on first use and again after close(), since the window can be shown again
+        if self._db is None:
+            self._db = AdvancedDatabase()
+        return self._db
+
+    def close(self):
+        """Stop the database's writer thread and close its connection"""
+        if self._db is not None:
+            self._db.close()
+            self._db = None
 
     def add_user(self, username, password, role, full_name, email):
         return self.db.add_user(username, password, role, full_name, email)
@@ -151,6 +164,10 @@ class AuthWindow(QMainWindow):
         self.db = DatabaseHandler()
         self.init_ui()
 
+    def closeEvent(self, event):
+        self.db.close()
+        super().closeEvent(event)
+
     def init_ui(self):
         self.setWindowTitle('Advanced Graphing Calculator - Authentication')
         self.setMinimumSize(400, 600)
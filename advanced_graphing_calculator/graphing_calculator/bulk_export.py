@@ -0,0 +1,245 @@
+# bulk_export.py
+"""
+Headless export of saved graphs to PNG/SVG images.
+
+Graphs are streamed from the database in id order, rendered with the Agg
+backend in a process pool and written in order into a directory tree
+(<output>/<username>/<id>_<name>.<format>) or a zip archive. The id of the
+last graph written with no failure before it is checkpointed every few
+seconds, so an interrupted export resumes where it stopped and retries
+graphs that failed.
+
+    python bulk_export.py --output exports/ --format svg
+    python bulk_export.py --output term1.zip --student alice
+"""
+import argparse
+import io
+import logging
+import os
+import re
+import sys
+import time
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from database import AdvancedDatabase
+
+FORMATS = ('png', 'svg')
+# The checkpoint is rewritten after this many graphs or seconds, whichever comes first
+CHECKPOINT_EVERY_GRAPHS = 200
+CHECKPOINT_EVERY_SECONDS = 5.0
+
+
+def safe_filename(text):
+    """Make a graph or user name usable as a path component"""
+    cleaned = re.sub(r'[^A-Za-z0-9._-]+', '_', str(text or '')).strip('._')
+    return cleaned[:80] or 'unnamed'
+
+
+def export_path(graph, fmt):
+    """Relative output path of a graph inside the directory tree or archive"""
+    return f"{safe_filename(graph['username'])}/{graph['id']}_{safe_filename(graph['name'])}.{fmt}"
+
+
+def render_graph(graph, fmt='png', dpi=100):
+    """Render one saved graph to image bytes (runs inside a worker process)"""
+    import numpy as np
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    import expression_engine
+
+    fig = Figure(figsize=(8, 6), dpi=dpi)
+    FigureCanvasAgg(fig)
+    fig.patch.set_facecolor('#1e1e1e')
+    axes = fig.add_subplot(111)
+    axes.set_facecolor('#1e1e1e')
+    axes.grid(True, color='#404040', linestyle='--', alpha=0.3)
+    axes.tick_params(axis='x', colors='#ecf0f1')
+    axes.tick_params(axis='y', colors='#ecf0f1')
+    for spine in axes.spines.values():
+        spine.set_color('#3498db')
+
+    x_min = float(graph['x_min'] if graph['x_min'] is not None else -10)
+    x_max = float(graph['x_max'] if graph['x_max'] is not None else 10)
+    if graph['scale_type'] == 'log':
+        x_min = max(1e-10, x_min)
+        x = np.logspace(np.log10(x_min), np.log10(x_max), 1000)
+        axes.set_xscale('log')
+    else:
+        x = np.linspace(x_min, x_max, 1000)
+
+    expression = graph['expression']
+    sides = [side.strip() for side in expression.split('=', 1)]
+    colors = ('#3498db', '#e74c3c')
+    with np.errstate(all='ignore'):
+        for side, color in zip(sides, colors):
+            try:
+                y = np.real(expression_engine.compile_expression(side, graph['variable'] or 'x')(x))
+                axes.plot(x, y, label=side, linewidth=2.5, color=color)
+            except Exception as e:
+                axes.text(0.5, 0.5, f"Could not evaluate {side}: {e}", transform=axes.transAxes,
+                          ha='center', color='#e74c3c', wrap=True)
+
+    axes.set_xlim(x_min, x_max)
+    if graph['y_min'] is not None and graph['y_max'] is not None and graph['y_min'] < graph['y_max']:
+        axes.set_ylim(graph['y_min'], graph['y_max'])
+    axes.set_title(f"{graph['name']}: {expression}", color='#ecf0f1')
+    if axes.get_legend_handles_labels()[0]:
+        axes.legend(facecolor='#2c3e50', edgecolor='#ecf0f1', labelcolor='#ecf0f1')
+
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format=fmt, facecolor=fig.get_facecolor(), edgecolor='none')
+    return buffer.getvalue()
+
+
+class DirectoryWriter:
+    """Writes images into a directory tree, atomically per file"""
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def write(self, relative_path, data):
+        path = os.path.join(self.root, *relative_path.split('/'))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + '.part'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def close(self):
+        pass
+
+
+class ZipWriter:
+    """Streams images into a zip archive, appending when resuming"""
+    def __init__(self, path, resume):
+        mode = 'a' if resume and zipfile.is_zipfile(path) else 'w'
+        self.archive = zipfile.ZipFile(path, mode, compression=zipfile.ZIP_DEFLATED)
+        self.resumed = mode == 'a'
+        self.names = set(self.archive.namelist())
+
+    def write(self, relative_path, data):
+        # Graphs exported after a failure are exported again on resume; keep the first copy
+        if relative_path in self.names:
+            return
+        self.names.add(relative_path)
+        # PNG is already compressed; only deflate text formats
+        compress = zipfile.ZIP_STORED if relative_path.endswith('.png') else zipfile.ZIP_DEFLATED
+        self.archive.writestr(relative_path, data, compress_type=compress)
+
+    def close(self):
+        self.archive.close()
+
+
+def read_checkpoint(path):
+    try:
+        with open(path) as f:
+            return int(f.read().strip() or 0)
+    except (OSError, ValueError):
+        return 0
+
+
+def write_checkpoint(path, graph_id):
+    tmp_path = path + '.part'
+    with open(tmp_path, 'w') as f:
+        f.write(str(graph_id))
+    os.replace(tmp_path, path)
+
+
+def export_graphs(db_file, output, fmt='png', student_username=None, workers=None,
+                  dpi=100, resume=True, report_every=500):
+    """Export every matching graph and return (exported, failed, seconds)"""
+    if fmt not in FORMATS:
+        raise ValueError(f"Unsupported format: {fmt}")
+    use_zip = output.endswith('.zip')
+    checkpoint = (output + '.progress') if use_zip else os.path.join(output, '.export_progress')
+    if not use_zip:
+        os.makedirs(output, exist_ok=True)
+
+    writer = ZipWriter(output, resume) if use_zip else DirectoryWriter(output)
+    # An unreadable archive cannot be appended to, so it is rebuilt from scratch
+    after_id = read_checkpoint(checkpoint) if resume and (not use_zip or writer.resumed) else 0
+    if after_id:
+        logging.info(f"Resuming export after graph id {after_id}")
+
+    workers = workers or os.cpu_count() or 1
+    max_in_flight = workers * 4
+    db = AdvancedDatabase(db_file)
+    exported = 0
+    failed = 0
+    started = time.perf_counter()
+    pending = deque()
+    # Resume point: the last id with no failure at or before it, and what is on disk
+    safe_id = saved_id = after_id
+    saved_at = started
+    unsaved = 0
+
+    def save_checkpoint(force=False):
+        nonlocal saved_id, saved_at, unsaved
+        now = time.perf_counter()
+        if safe_id != saved_id and (force or unsaved >= CHECKPOINT_EVERY_GRAPHS
+                                    or now - saved_at >= CHECKPOINT_EVERY_SECONDS):
+            write_checkpoint(checkpoint, safe_id)
+            saved_id = safe_id
+            saved_at = now
+            unsaved = 0
+
+    def drain(limit):
+        nonlocal exported, failed, safe_id, unsaved
+        while len(pending) > limit:
+            graph, future = pending.popleft()
+            try:
+                writer.write(export_path(graph, fmt), future.result())
+            except Exception as e:
+                logging.error(f"Error exporting graph {graph['id']}: {str(e)}")
+                failed += 1
+                continue
+            exported += 1
+            if not failed:
+                safe_id = graph['id']
+                unsaved += 1
+                save_checkpoint()
+            if exported % report_every == 0:
+                elapsed = time.perf_counter() - started
+                logging.info(f"Exported {exported} graphs ({exported / elapsed:.1f} graphs/s), {failed} failed")
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for graph in db.iter_graphs(student_username=student_username, after_id=after_id):
+                pending.append((graph, pool.submit(render_graph, graph, fmt, dpi)))
+                drain(max_in_flight)
+            drain(0)
+    finally:
+        writer.close()
+        save_checkpoint(force=True)
+        db.close()
+
+    elapsed = time.perf_counter() - started
+    rate = exported / elapsed if elapsed > 0 else 0.0
+    logging.info(f"Exported {exported} graphs in {elapsed:.1f}s ({rate:.1f} graphs/s), {failed} failed")
+    if failed:
+        logging.info("Re-run the same command to retry the failed graphs")
+    return exported, failed, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export saved graphs to images")
+    parser.add_argument('--db', default='calculator.db', help="SQLite database file")
+    parser.add_argument('--output', required=True, help="Output directory, or a path ending in .zip")
+    parser.add_argument('--format', choices=FORMATS, default='png')
+    parser.add_argument('--student', help="Only export this student's graphs")
+    parser.add_argument('--workers', type=int, default=None, help="Render processes (default: CPU count)")
+    parser.add_argument('--dpi', type=int, default=100)
+    parser.add_argument('--restart', action='store_true', help="Ignore the checkpoint and export everything")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s')
+    exported, failed, elapsed = export_graphs(args.db, args.output, fmt=args.format,
+                                              student_username=args.student, workers=args.workers,
+                                              dpi=args.dpi, resume=not args.restart)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
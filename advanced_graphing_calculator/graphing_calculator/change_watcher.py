@@ -0,0 +1,125 @@
+# change_watcher.py
+import logging
+import sqlite3
+
+from PyQt6.QtCore import QObject, QRunnable, QThreadPool, QTimer, pyqtSignal
+
+POLL_INTERVAL_MS = 500
+
+_pool = None
+
+
+def check_pool():
+    """The one-thread pool every watcher's checks run on, in order"""
+    global _pool
+    if _pool is None:
+        _pool = QThreadPool()
+        _pool.setMaxThreadCount(1)
+    return _pool
+
+
+class ChangeCheck(QRunnable):
+    """One poll of the database on the watcher's pool thread"""
+    def __init__(self, watcher, generation):
+        super().__init__()
+        self.watcher = watcher
+        self.generation = generation
+
+    def run(self):
+        self.watcher.checked.emit(self.generation, self.watcher.check())
+
+
+class ChangeWatcher(QObject):
+    """
+    Polls the database on a timer and signals which tracked tables changed.
+
+    Each tick reads PRAGMA data_version on a connection of its own, which only
+    moves when another connection commits. Only then are the per-table versions
+    in change_counters (bumped by triggers, see
+    AdvancedDatabase._init_change_counters) read and compared with the last
+    ones seen, so an idle database costs one pragma per tick. The first
+    successful poll records a baseline and signals nothing.
+
+    The database is only touched on a single-thread pool shared by all watchers
+    (check_pool), one poll at a time, so a slow disk never blocks the GUI
+    thread; the changed table names come back through `checked` and only the
+    signal dispatch runs on the GUI thread.
+    """
+    users_changed = pyqtSignal()
+    graphs_changed = pyqtSignal()
+    comments_changed = pyqtSignal()
+    checked = pyqtSignal(int, list)  # generation, changed table names
+
+    def __init__(self, db_file="calculator.db", interval_ms=POLL_INTERVAL_MS, parent=None):
+        super().__init__(parent)
+        self.db_file = db_file
+        # Only used on the pool thread
+        self.conn = None
+        self.data_version = None
+        self.versions = None
+        self.signals = {
+            'users': self.users_changed,
+            'graphs': self.graphs_changed,
+            'comments': self.comments_changed
+        }
+        self.generation = 0
+        self.in_flight = False
+        self.pool = check_pool()
+        self.checked.connect(self.dispatch)
+        self.timer = QTimer(self)
+        self.timer.setInterval(interval_ms)
+        self.timer.timeout.connect(self.poll)
+
+    def start(self):
+        self.timer.start()
+
+    def stop(self):
+        """Stop polling and close the connection; start() picks up with a fresh baseline"""
+        self.timer.stop()
+        # Results of a poll still running are ignored, and the reset queues up behind it
+        self.generation += 1
+        self.in_flight = False
+        self.pool.start(self.reset)
+
+    def reset(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+        self.data_version = None
+        self.versions = None
+
+    def poll(self):
+        """Start a check on the pool thread unless one is still running"""
+        if self.in_flight:
+            return
+        self.in_flight = True
+        self.pool.start(ChangeCheck(self, self.generation))
+
+    def dispatch(self, generation, changed):
+        """Emit the signal of every changed table (GUI thread)"""
+        if generation != self.generation:
+            return
+        self.in_flight = False
+        for table in changed:
+            if table in self.signals:
+                self.signals[table].emit()
+
+    def check(self):
+        """Names of the tables changed since the last check (pool thread)"""
+        try:
+            if self.conn is None:
+                # A check that meets a commit in progress gives up quickly and waits for the next tick
+                self.conn = sqlite3.connect(self.db_file, timeout=0.05, check_same_thread=False)
+            data_version = self.conn.execute('PRAGMA data_version').fetchone()[0]
+            if data_version == self.data_version:
+                return []
+            versions = dict(self.conn.execute('SELECT table_name, version FROM change_counters').fetchall())
+        except sqlite3.Error as e:
+            # Also the case until AdvancedDatabase has created change_counters
+            logging.debug(f"Change check skipped: {e}")
+            return []
+        self.data_version = data_version
+        previous, self.versions = self.versions, versions
+        if previous is None:
+            return []
+        return [table for table, version in versions.items() if version != previous.get(table)]
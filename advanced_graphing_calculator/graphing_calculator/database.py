@@ -1,15 +1,357 @@
 # database.py
+import functools
+import inspect
+import logging
+import queue
 import sqlite3
+import sys
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from concurrent.futures import Future
+
+import expression_engine
+import metrics
+import query_profiler
+from graph_table import GraphTable
+
+QUERY_SECONDS = metrics.REGISTRY.histogram(
+    'calculator_db_query_seconds', 'AdvancedDatabase call duration by method', ('method',))
+ROWS_RETURNED = metrics.REGISTRY.counter(
+    'calculator_db_rows_returned_total', 'Rows returned by AdvancedDatabase read methods', ('method',))
+
+# Open AdvancedDatabase instances; close() takes a database out
+_live_databases = weakref.WeakSet()
+
+
+def _cache_lookups():
+    hits = misses = 0
+    for db in list(_live_databases):
+        stats = db.query_cache.stats()
+        hits += stats['hits']
+        misses += stats['misses']
+    return {('hit',): hits, ('miss',): misses}
+
+
+metrics.REGISTRY.callback('calculator_db_query_cache_lookups_total', 'Read-query cache lookups of open databases',
+                          _cache_lookups, kind='counter', labelnames=('result',))
+
+
+def _estimate_size(value):
+    """Rough in-memory size of a query result in bytes"""
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(_estimate_size(k) + _estimate_size(v) for k, v in value.items())
+    elif isinstance(value, (list, tuple)):
+        size += sum(_estimate_size(v) for v in value)
+    return size
+
+
+class QueryCache:
+    """LRU cache of read-query results bounded by entry count and approximate bytes"""
+    def __init__(self, max_entries=256, max_bytes=4 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # key -> (result, size)
+        self.bytes = 0
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        """Return (found, result) for key"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return False, None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return True, entry[0]
+
+    def put(self, key, result, generation):
+        """Store result unless the cache was invalidated since generation was read"""
+        size = _estimate_size(result)
+        with self.lock:
+            if generation != self.generation or size > self.max_bytes:
+                return
+            self._discard(key)
+            self.entries[key] = (result, size)
+            self.bytes += size
+            while len(self.entries) > self.max_entries or self.bytes > self.max_bytes:
+                self._discard(next(iter(self.entries)))
+
+    def _discard(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.bytes -= entry[1]
+
+    def invalidate(self, *keys):
+        """Drop the given keys"""
+        with self.lock:
+            self.generation += 1
+            for key in keys:
+                if key in self.entries:
+                    self._discard(key)
+                    self.invalidations += 1
+
+    def clear(self):
+        with self.lock:
+            self.generation += 1
+            self.invalidations += len(self.entries)
+            self.entries.clear()
+            self.bytes = 0
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'invalidations': self.invalidations,
+                'entries': len(self.entries),
+                'bytes': self.bytes
+            }
+
+
+class WriteQueue:
+    """
+    Runs every write on one thread over one connection. Jobs that queue up while a
+    commit is in progress, or arrive within window seconds of the first, share a
+    transaction; each job runs in its own savepoint, so a failing job is rolled back
+    alone and only its future gets the exception.
+    """
+    def __init__(self, conn, lock, window=0.001, max_batch=256):
+        self.conn = conn
+        self.lock = lock
+        self.window = window
+        self.max_batch = max_batch
+        self.jobs = queue.Queue()
+        self.batches = 0
+        self.thread = threading.Thread(target=self._run, name='database-writer', daemon=True)
+        self.thread.start()
+
+    def submit(self, function, *args):
+        """Queue function(cursor, *args); the Future resolves to its result once committed"""
+        future = Future()
+        self.jobs.put((function, args, future))
+        return future
+
+    def close(self):
+        """Commit what is queued, then stop the writer thread"""
+        self.jobs.put(None)
+        self.thread.join()
+
+    def _run(self):
+        running = True
+        while running:
+            job = self.jobs.get()
+            if job is None:
+                break
+            batch = [job]
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.max_batch:
+                try:
+                    job = self.jobs.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if job is None:
+                    running = False
+                    break
+                batch.append(job)
+            self._commit(batch)
+
+    def _commit(self, batch):
+        outcomes = []
+        with self.lock:
+            c = self.conn.cursor()
+            try:
+                c.execute('BEGIN IMMEDIATE')
+                for function, args, future in batch:
+                    if not future.set_running_or_notify_cancel():
+                        outcomes.append(None)
+                        continue
+                    c.execute('SAVEPOINT job')
+                    try:
+                        outcomes.append((True, function(c, *args)))
+                        c.execute('RELEASE job')
+                    except Exception as e:
+                        c.execute('ROLLBACK TO job')
+                        c.execute('RELEASE job')
+                        outcomes.append((False, e))
+                self.conn.commit()
+                self.batches += 1
+            except Exception as e:
+                # BEGIN or COMMIT failed (e.g. locked by another process for too long)
+                if self.conn.in_transaction:
+                    self.conn.rollback()
+                outcomes = [(False, e)] * len(batch)
+        for (_, _, future), outcome in zip(batch, outcomes):
+            if outcome is None or future.cancelled():
+                continue
+            ok, value = outcome
+            if ok:
+                future.set_result(value)
+            else:
+                future.set_exception(value)
+
+
+# FTS5 index -> (table it mirrors, indexed columns, tokenizer). '^' is kept inside
+# tokens so x^2 is one term rather than a phrase of the ubiquitous x and 2
+SEARCH_INDEXES = (
+    ('graphs_fts', 'graphs', ('name', 'expression'), "unicode61 tokenchars '^'"),
+    ('comments_fts', 'comments', ('comment_text',), 'unicode61'),
+)
+
+# Matches considered for ranking: the newest this many per index
+SEARCH_CANDIDATES = 1000
+
+# Tables whose inserts, updates and deletes bump a counter in change_counters (see change_watcher.py)
+CHANGE_TRACKED_TABLES = ('users', 'graphs', 'comments')
+
+# (graph_id, param_hash) pairs per get_thumbnails query, well under SQLite's bound-variable limit
+THUMBNAIL_LOOKUP_CHUNK = 400
+
+
+def fts_query(text):
+    """Turn free text into an FTS5 query: all words must match, the last one as a prefix"""
+    words = ['"' + word.replace('"', '""') + '"' for word in text.split()]
+    if words:
+        words[-1] += '*'
+    return ' '.join(words)
+
+
+def _row_count(result):
+    """Rows in a read method's result: lists and tables by length, a single record as one"""
+    if result is None or isinstance(result, (bool, int)):
+        return 0  # writes return ids and flags
+    if isinstance(result, (list, tuple, GraphTable)):
+        return len(result)
+    if isinstance(result, dict) and not all(isinstance(key, str) for key in result):
+        return len(result)  # {graph_id: ...} mappings
+    return 1
+
+
+def timed_query(method):
+    """Record the duration and row count of each call in the metrics registry"""
+    name = method.__name__
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if not metrics.REGISTRY.enabled:
+            return method(self, *args, **kwargs)
+        start = time.perf_counter()
+        result = method(self, *args, **kwargs)
+        QUERY_SECONDS.observe(time.perf_counter() - start, method=name)
+        ROWS_RETURNED.inc(_row_count(result), method=name)
+        return result
+    return wrapper
+
+
+class FrozenDict(dict):
+    """A dict that refuses changes, so one cached result can be shared by every caller"""
+    def _read_only(self, *args, **kwargs):
+        raise TypeError("Cached query results are read-only; copy them with dict() to modify")
+
+    __setitem__ = __delitem__ = __ior__ = _read_only
+    clear = pop = popitem = setdefault = update = _read_only
+
+    def __reduce__(self):
+        # Copies and pickles come back as plain, modifiable dicts
+        return (dict, (dict(self),))
+
+
+def freeze(result):
+    """Make a query result read-only: lists become tuples, dicts FrozenDicts, GraphTables read-only"""
+    if isinstance(result, (list, tuple)):
+        return tuple(freeze(value) for value in result)
+    if isinstance(result, dict):
+        return FrozenDict((key, freeze(value)) for key, value in result.items())
+    if isinstance(result, GraphTable):
+        result.freeze()
+    return result
+
+
+def cached_query(method):
+    """
+    Serve a read method from the instance's QueryCache, keyed by method name and arguments.
+    Results are frozen once when stored and then shared, so hits cost no copying: callers
+    get tuples for lists and FrozenDicts for dicts, and copy them (list(), dict()) to modify.
+    """
+    signature = inspect.signature(method)
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if kwargs:
+            # Arguments passed by name get the same key (and invalidation) as positional ones
+            bound = signature.bind(self, *args, **kwargs)
+            args = bound.args[1:]
+            kwargs = bound.kwargs
+        key = (method.__name__,) + args + (tuple(sorted(kwargs.items())) if kwargs else ())
+        generation = self.check_data_version()
+        found, result = self.query_cache.get(key)
+        if not found:
+            result = freeze(method(self, *args, **kwargs))
+            self.query_cache.put(key, result, generation)
+        return result
+    return wrapper
 
 
 class AdvancedDatabase:
-    def __init__(self):
-        self.db_file = "calculator.db"
+    def __init__(self, db_file="calculator.db", cache_entries=256, cache_bytes=4 * 1024 * 1024, profiler=None,
+                 write_window=0.001):
+        self.db_file = db_file
+        # A query_profiler.QueryProfiler times every statement this instance runs
+        self.profiler = profiler if profiler is not None else query_profiler.DEFAULT
         self.init_database()
+        self.query_cache = QueryCache(cache_entries, cache_bytes)
+        # Writes go through this connection, so its data_version only moves
+        # when another connection (or process) commits
+        self._conn = self._connect(check_same_thread=False, timeout=30)
+        self._conn_lock = threading.Lock()
+        self._data_version = self._read_data_version()
+        self._writer = WriteQueue(self._conn, self._conn_lock, write_window)
+        _live_databases.add(self)
+
+    def _connect(self, **kwargs):
+        """Open a connection to the database, profiled when a profiler is set"""
+        if self.profiler is not None:
+            return self.profiler.connect(self.db_file, **kwargs)
+        return sqlite3.connect(self.db_file, **kwargs)
+
+    def query_report(self, limit=10):
+        """The profiler's top statements by total time, or None when not profiling"""
+        return self.profiler.report(limit) if self.profiler is not None else None
+
+    def _read_data_version(self):
+        with self._conn_lock:
+            return self._conn.execute('PRAGMA data_version').fetchone()[0]
+
+    def check_data_version(self):
+        """Flush the query cache if another connection changed the database; return the cache generation"""
+        version = self._read_data_version()
+        if version != self._data_version:
+            self._data_version = version
+            self.query_cache.clear()
+        return self.query_cache.generation
+
+    def cache_stats(self):
+        """Hit/miss counters and size of the read-query cache"""
+        return self.query_cache.stats()
+
+    def close(self):
+        _live_databases.discard(self)
+        self._writer.close()
+        with self._conn_lock:
+            self._conn.close()
 
     def init_database(self):
         """Initialize the database with required tables"""
-        conn = sqlite3.connect(self.db_file)
+        conn = self._connect()
         c = conn.cursor()
 
         # Create users table
@@ -56,33 +398,277 @@ class AdvancedDatabase:
             )
         ''')
 
+        # Create expressions table (each distinct expression once, keyed by
+        # expression_engine.expression_hash of its sympy canonical form)
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS expressions (
+                hash TEXT PRIMARY KEY,
+                canonical TEXT NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        self._init_expression_hashes(c)
+
+        # Create thumbnails table (one preview per expression and view, see thumbnails.param_hash)
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS expression_thumbnails (
+                expression_hash TEXT NOT NULL,
+                param_hash TEXT NOT NULL,
+                image BLOB NOT NULL,
+                PRIMARY KEY (expression_hash, param_hash),
+                FOREIGN KEY (expression_hash) REFERENCES expressions(hash)
+            )
+        ''')
+
+        # Create samples table (computed plot data per expression and plot settings, see plot_samples.py)
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS expression_samples (
+                expression_hash TEXT NOT NULL,
+                param_hash TEXT NOT NULL,
+                engine_version INTEGER NOT NULL,
+                data BLOB NOT NULL,
+                PRIMARY KEY (expression_hash, param_hash),
+                FOREIGN KEY (expression_hash) REFERENCES expressions(hash)
+            )
+        ''')
+
         # Add default teacher account if not exists
         c.execute('''
             INSERT OR IGNORE INTO users (username, password, role, full_name, email)
             VALUES (?, ?, ?, ?, ?)
         ''', ('teacher1', 'teacher123', 'teacher', 'Default Teacher', 'teacher@example.com'))
 
+        self._init_summaries(c)
+        self.has_search = self._init_search(c)
+        self._init_change_counters(c)
         conn.commit()
         conn.close()
 
+    def _init_expression_hashes(self, c):
+        """Add graphs.expression_hash and fill it (and expressions) for graphs saved without one"""
+        c.execute('PRAGMA table_info(graphs)')
+        if 'expression_hash' not in {row[1] for row in c.fetchall()}:
+            c.execute('ALTER TABLE graphs ADD COLUMN expression_hash TEXT REFERENCES expressions(hash)')
+
+        # Canonicalize each distinct text once, then set every row in a single pass
+        c.execute('SELECT DISTINCT expression FROM graphs WHERE expression_hash IS NULL')
+        hashes = [(row[0], expression_engine.expression_hash(row[0])) for row in c.fetchall()]
+        if hashes:
+            c.executemany('INSERT OR IGNORE INTO expressions (hash, canonical) VALUES (?, ?)',
+                          [(digest, expression_engine.canonical_form(text)) for text, digest in hashes])
+            c.execute('CREATE TEMP TABLE expression_hash_map (text TEXT PRIMARY KEY, hash TEXT NOT NULL)')
+            c.executemany('INSERT INTO expression_hash_map (text, hash) VALUES (?, ?)', hashes)
+            c.execute('''
+                UPDATE graphs
+                SET expression_hash = (SELECT hash FROM expression_hash_map WHERE text = graphs.expression)
+                WHERE expression_hash IS NULL
+            ''')
+            c.execute('DROP TABLE expression_hash_map')
+        # Created after the fill, which is much faster without the index to maintain
+        c.execute('CREATE INDEX IF NOT EXISTS graphs_expression_hash ON graphs (expression_hash)')
+
+    def _init_summaries(self, c):
+        """Create the per-student and per-graph activity tables and the triggers that keep them current"""
+        c.execute("SELECT name FROM sqlite_master WHERE name IN ('student_summary', 'graph_comment_summary')")
+        existing = {row[0] for row in c.fetchall()}
+
+        # One row per student with graphs; students without graphs have none
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS student_summary (
+                user_id INTEGER PRIMARY KEY,
+                graph_count INTEGER NOT NULL DEFAULT 0,
+                comment_count INTEGER NOT NULL DEFAULT 0,
+                uncommented_count INTEGER NOT NULL DEFAULT 0,
+                last_activity TIMESTAMP,
+                last_comment_at TIMESTAMP,
+                FOREIGN KEY (user_id) REFERENCES users(id)
+            )
+        ''')
+
+        # One row per graph with comments, so "first comment on this graph" is a key lookup
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS graph_comment_summary (
+                graph_id INTEGER PRIMARY KEY,
+                comment_count INTEGER NOT NULL,
+                last_comment_at TIMESTAMP,
+                FOREIGN KEY (graph_id) REFERENCES graphs(id)
+            )
+        ''')
+
+        c.execute('''
+            CREATE TRIGGER IF NOT EXISTS graphs_summary_insert AFTER INSERT ON graphs
+            WHEN new.user_id IS NOT NULL BEGIN
+                INSERT INTO student_summary (user_id, graph_count, uncommented_count, last_activity)
+                VALUES (new.user_id, 1, 1, new.created_at)
+                ON CONFLICT (user_id) DO UPDATE SET
+                    graph_count = graph_count + 1,
+                    uncommented_count = uncommented_count + 1,
+                    last_activity = MAX(COALESCE(last_activity, ''), excluded.last_activity);
+            END
+        ''')
+        # Indexes for the MAX lookups that recompute last activity times after a delete
+        c.execute('CREATE INDEX IF NOT EXISTS graphs_user_created ON graphs (user_id, created_at)')
+        c.execute('CREATE INDEX IF NOT EXISTS comments_graph_created ON comments (graph_id, created_at)')
+        c.execute('''
+            CREATE TRIGGER IF NOT EXISTS graphs_summary_delete AFTER DELETE ON graphs BEGIN
+                UPDATE student_summary SET
+                    graph_count = graph_count - 1,
+                    comment_count = comment_count - COALESCE(
+                        (SELECT comment_count FROM graph_comment_summary WHERE graph_id = old.id), 0),
+                    uncommented_count = uncommented_count - NOT EXISTS (
+                        SELECT 1 FROM graph_comment_summary WHERE graph_id = old.id),
+                    last_activity = (SELECT MAX(created_at) FROM graphs WHERE user_id = old.user_id),
+                    last_comment_at = (
+                        SELECT MAX(s.last_comment_at) FROM graphs g
+                        JOIN graph_comment_summary s ON s.graph_id = g.id
+                        WHERE g.user_id = old.user_id)
+                WHERE user_id = old.user_id;
+                DELETE FROM graph_comment_summary WHERE graph_id = old.id;
+            END
+        ''')
+        c.execute('''
+            CREATE TRIGGER IF NOT EXISTS comments_summary_insert AFTER INSERT ON comments BEGIN
+                UPDATE student_summary SET
+                    comment_count = comment_count + 1,
+                    uncommented_count = uncommented_count - NOT EXISTS (
+                        SELECT 1 FROM graph_comment_summary WHERE graph_id = new.graph_id),
+                    last_comment_at = MAX(COALESCE(last_comment_at, ''), new.created_at)
+                WHERE user_id = (SELECT user_id FROM graphs WHERE id = new.graph_id);
+                INSERT INTO graph_comment_summary (graph_id, comment_count, last_comment_at)
+                VALUES (new.graph_id, 1, new.created_at)
+                ON CONFLICT (graph_id) DO UPDATE SET
+                    comment_count = comment_count + 1,
+                    last_comment_at = MAX(COALESCE(last_comment_at, ''), excluded.last_comment_at);
+            END
+        ''')
+        c.execute('''
+            CREATE TRIGGER IF NOT EXISTS comments_summary_delete AFTER DELETE ON comments BEGIN
+                UPDATE graph_comment_summary SET
+                    comment_count = comment_count - 1,
+                    last_comment_at = (SELECT MAX(created_at) FROM comments WHERE graph_id = old.graph_id)
+                WHERE graph_id = old.graph_id;
+                UPDATE student_summary SET
+                    comment_count = comment_count - 1,
+                    uncommented_count = uncommented_count + EXISTS (
+                        SELECT 1 FROM graph_comment_summary WHERE graph_id = old.graph_id AND comment_count = 0),
+                    last_comment_at = (
+                        SELECT MAX(s.last_comment_at) FROM graphs g
+                        JOIN graph_comment_summary s ON s.graph_id = g.id
+                        WHERE g.user_id = student_summary.user_id)
+                WHERE user_id = (SELECT user_id FROM graphs WHERE id = old.graph_id);
+                DELETE FROM graph_comment_summary WHERE graph_id = old.graph_id AND comment_count = 0;
+            END
+        ''')
+
+        if len(existing) < 2:
+            # Summarize graphs and comments saved before the tables existed
+            self._fill_summaries(c)
+
+    def _init_change_counters(self, c):
+        """Create change_counters and the triggers that bump a table's version on every row it changes"""
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS change_counters (
+                table_name TEXT PRIMARY KEY,
+                version INTEGER NOT NULL DEFAULT 0
+            )
+        ''')
+        c.executemany('INSERT OR IGNORE INTO change_counters (table_name) VALUES (?)',
+                      [(table,) for table in CHANGE_TRACKED_TABLES])
+        for table in CHANGE_TRACKED_TABLES:
+            for event in ('insert', 'update', 'delete'):
+                c.execute(f'''
+                    CREATE TRIGGER IF NOT EXISTS {table}_changes_{event} AFTER {event.upper()} ON {table} BEGIN
+                        UPDATE change_counters SET version = version + 1 WHERE table_name = '{table}';
+                    END
+                ''')
+
+    @staticmethod
+    def _fill_summaries(c):
+        c.execute('DELETE FROM graph_comment_summary')
+        c.execute('DELETE FROM student_summary')
+        c.execute('''
+            INSERT INTO graph_comment_summary (graph_id, comment_count, last_comment_at)
+            SELECT graph_id, COUNT(*), MAX(created_at) FROM comments
+            WHERE graph_id IS NOT NULL
+            GROUP BY graph_id
+        ''')
+        c.execute('''
+            INSERT INTO student_summary (user_id, graph_count, comment_count, uncommented_count,
+                                         last_activity, last_comment_at)
+            SELECT g.user_id, COUNT(*), COALESCE(SUM(s.comment_count), 0), SUM(s.graph_id IS NULL),
+                   MAX(g.created_at), MAX(s.last_comment_at)
+            FROM graphs g
+            LEFT JOIN graph_comment_summary s ON s.graph_id = g.id
+            WHERE g.user_id IS NOT NULL
+            GROUP BY g.user_id
+        ''')
+
+    @timed_query
+    def rebuild_summaries(self):
+        """Recompute the dashboard summary tables from graphs and comments (after bulk loads)"""
+        self._writer.submit(self._fill_summaries).result()
+        self.query_cache.clear()
+
+    def _init_search(self, c):
+        """Create the FTS5 indexes and their sync triggers; False when SQLite lacks FTS5"""
+        c.execute("SELECT name FROM sqlite_master WHERE name IN ('graphs_fts', 'comments_fts')")
+        existing = {row[0] for row in c.fetchall()}
+        try:
+            for table, source, columns, tokenizer in SEARCH_INDEXES:
+                names = ', '.join(columns)
+                new_values = ', '.join(f'new.{column}' for column in columns)
+                old_values = ', '.join(f'old.{column}' for column in columns)
+                c.execute(f'''
+                    CREATE VIRTUAL TABLE IF NOT EXISTS {table}
+                    USING fts5({names}, content='{source}', content_rowid='id', tokenize="{tokenizer}", prefix='2 3')
+                ''')
+                c.execute(f'''
+                    CREATE TRIGGER IF NOT EXISTS {table}_insert AFTER INSERT ON {source} BEGIN
+                        INSERT INTO {table} (rowid, {names}) VALUES (new.id, {new_values});
+                    END
+                ''')
+                c.execute(f'''
+                    CREATE TRIGGER IF NOT EXISTS {table}_delete AFTER DELETE ON {source} BEGIN
+                        INSERT INTO {table} ({table}, rowid, {names}) VALUES ('delete', old.id, {old_values});
+                    END
+                ''')
+                c.execute(f'''
+                    CREATE TRIGGER IF NOT EXISTS {table}_update AFTER UPDATE OF {names} ON {source} BEGIN
+                        INSERT INTO {table} ({table}, rowid, {names}) VALUES ('delete', old.id, {old_values});
+                        INSERT INTO {table} (rowid, {names}) VALUES (new.id, {new_values});
+                    END
+                ''')
+                if table not in existing:
+                    # Index rows saved before search existed
+                    c.execute(f"INSERT INTO {table} ({table}) VALUES ('rebuild')")
+        except sqlite3.OperationalError as e:
+            logging.warning(f"Full-text search unavailable: {str(e)}")
+            return False
+        return True
+
+    @timed_query
     def add_user(self, username, password, role, full_name, email):
         """Add a new user to the database"""
         try:
-            conn = sqlite3.connect(self.db_file)
-            c = conn.cursor()
-            c.execute('''
-                INSERT INTO users (username, password, role, full_name, email)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (username, password, role, full_name, email))
-            conn.commit()
-            conn.close()
-            return True
+            self._writer.submit(self._insert_user, username, password, role, full_name, email).result()
         except sqlite3.IntegrityError:
             return False
+        self.query_cache.invalidate(('get_all_students',), ('get_student_graphs', username),
+                                    ('get_class_overview',))
+        return True
+
+    @staticmethod
+    def _insert_user(c, username, password, role, full_name, email):
+        c.execute('''
+            INSERT INTO users (username, password, role, full_name, email)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (username, password, role, full_name, email))
+        return c.lastrowid
 
+    @timed_query
     def verify_user(self, username, password):
         """Verify user credentials and return user data"""
-        conn = sqlite3.connect(self.db_file)
+        conn = self._connect()
         c = conn.cursor()
         try:
             c.execute('''
@@ -104,9 +690,21 @@ class AdvancedDatabase:
         finally:
             conn.close()
 
+    @timed_query
+    def get_user_id(self, username):
+        """Id of the user with this username, or None"""
+        conn = self._connect()
+        c = conn.cursor()
+        c.execute('SELECT id FROM users WHERE username = ?', (username,))
+        row = c.fetchone()
+        conn.close()
+        return row[0] if row else None
+
+    @timed_query
+    @cached_query
     def get_all_students(self):
         """Get list of all students"""
-        conn = sqlite3.connect(self.db_file)
+        conn = self._connect()
         c = conn.cursor()
         c.execute('''
             SELECT id, username, full_name 
@@ -117,39 +715,109 @@ class AdvancedDatabase:
         conn.close()
         return students
 
+    @timed_query
+    @cached_query
+    def get_class_overview(self):
+        """
+        Activity of every student for the teacher dashboard: graph and comment counts,
+        graphs without comments and last save/comment times, read from student_summary
+        """
+        conn = self._connect()
+        c = conn.cursor()
+        c.execute('''
+            SELECT u.id, u.username, u.full_name,
+                   COALESCE(s.graph_count, 0), COALESCE(s.comment_count, 0), COALESCE(s.uncommented_count, 0),
+                   s.last_activity, s.last_comment_at
+            FROM users u
+            LEFT JOIN student_summary s ON s.user_id = u.id
+            WHERE u.role = 'student'
+            ORDER BY u.username
+        ''')
+        rows = c.fetchall()
+        conn.close()
+        return [self._summary_dict(row) for row in rows]
+
+    @timed_query
+    @cached_query
+    def get_student_summary(self, user_id):
+        """Dashboard activity of one student, or None if there is no such user"""
+        conn = self._connect()
+        c = conn.cursor()
+        c.execute('''
+            SELECT u.id, u.username, u.full_name,
+                   COALESCE(s.graph_count, 0), COALESCE(s.comment_count, 0), COALESCE(s.uncommented_count, 0),
+                   s.last_activity, s.last_comment_at
+            FROM users u
+            LEFT JOIN student_summary s ON s.user_id = u.id
+            WHERE u.id = ?
+        ''', (user_id,))
+        row = c.fetchone()
+        conn.close()
+        return self._summary_dict(row) if row else None
+
+    @staticmethod
+    def _summary_dict(row):
+        return {
+            'id': row[0],
+            'username': row[1],
+            'full_name': row[2],
+            'graph_count': row[3],
+            'comment_count': row[4],
+            'uncommented_count': row[5],
+            'last_activity': row[6],
+            'last_comment_at': row[7]
+        }
+
+    @timed_query
     def save_graph_state(self, user_id, graph_data):
         """Save a graph with all its properties"""
-        conn = sqlite3.connect(self.db_file)
-        c = conn.cursor()
-        try:
-            c.execute('''
-                INSERT INTO graphs (
-                    user_id, name, expression, variable,
-                    x_min, x_max, y_min, y_max, scale_type
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                user_id,
-                graph_data['name'],
-                graph_data['expression'],
-                graph_data['variable'],
-                graph_data['x_min'],
-                graph_data['x_max'],
-                graph_data['y_min'],
-                graph_data['y_max'],
-                graph_data['scale_type']
-            ))
-            graph_id = c.lastrowid
-            conn.commit()
-            return graph_id
-        except Exception as e:
-            conn.rollback()
-            raise e
-        finally:
-            conn.close()
+        # Parsed here rather than on the writer thread, which other writes wait for
+        expression = graph_data['expression']
+        content = (expression_engine.expression_hash(expression), expression_engine.canonical_form(expression))
+        graph_id, username = self._writer.submit(self._insert_graph, user_id, graph_data, content).result()
+        self.query_cache.invalidate(
+            ('get_user_graphs', user_id),
+            ('get_user_graph_history', user_id),
+            ('get_all_graphs',),
+            ('get_student_graphs', username),
+            ('get_graph_table',),
+            ('get_graph_table', user_id),
+            ('get_class_overview',),
+            ('get_student_summary', user_id)
+        )
+        return graph_id
+
+    @staticmethod
+    def _insert_graph(c, user_id, graph_data, content):
+        expression_hash, canonical = content
+        c.execute('INSERT OR IGNORE INTO expressions (hash, canonical) VALUES (?, ?)', (expression_hash, canonical))
+        c.execute('''
+            INSERT INTO graphs (
+                user_id, name, expression, variable,
+                x_min, x_max, y_min, y_max, scale_type, expression_hash
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (
+            user_id,
+            graph_data['name'],
+            graph_data['expression'],
+            graph_data['variable'],
+            graph_data['x_min'],
+            graph_data['x_max'],
+            graph_data['y_min'],
+            graph_data['y_max'],
+            graph_data['scale_type'],
+            expression_hash
+        ))
+        graph_id = c.lastrowid
+        c.execute('SELECT username FROM users WHERE id = ?', (user_id,))
+        owner = c.fetchone()
+        return graph_id, owner[0] if owner else None
 
+    @timed_query
+    @cached_query
     def get_user_graphs(self, user_id):
         """Get all graphs for a specific user"""
-        conn = sqlite3.connect(self.db_file)
+        conn = self._connect()
         c = conn.cursor()
         c.execute('''
             SELECT id, name, expression, variable, x_min, x_max, y_min, y_max, scale_type
@@ -175,9 +843,11 @@ class AdvancedDatabase:
             for g in graphs
         ]
 
+    @timed_query
+    @cached_query
     def get_all_graphs(self):
         """Get all graphs in the database for teachers"""
-        conn = sqlite3.connect(self.db_file)
+        conn = self._connect()
         c = conn.cursor()
         c.execute('''
             SELECT id, name, expression, variable, x_min, x_max, y_min, y_max, scale_type
@@ -201,20 +871,229 @@ class AdvancedDatabase:
             }
             for g in graphs
         ]
+
+    @timed_query
+    @cached_query
+    def get_graph_table(self, user_id=None):
+        """All graphs (or one user's) as a GraphTable, newest first, filled straight from the cursor"""
+        conn = self._connect()
+        c = conn.cursor()
+        query = '''
+            SELECT g.id, g.name, g.expression, g.variable,
+                   g.x_min, g.x_max, g.y_min, g.y_max, g.scale_type,
+                   CAST(strftime('%s', g.created_at) AS INTEGER),
+                   u.username
+            FROM graphs g
+            LEFT JOIN users u ON g.user_id = u.id
+        '''
+        params = ()
+        if user_id is not None:
+            query += ' WHERE g.user_id = ?'
+            params = (user_id,)
+        c.execute(query + ' ORDER BY g.created_at DESC, g.id DESC', params)
+        table = GraphTable()
+        while True:
+            rows = c.fetchmany(1000)
+            if not rows:
+                break
+            table.extend(rows)
+        conn.close()
+        return table
+
+    @timed_query
+    def search(self, text, limit=50, scopes=('graphs', 'comments')):
+        """
+        Graphs whose name or expression, or one of whose comments, contains every word
+        of text (as a word prefix), best match first. Each result is a graph dict plus
+        'source' ('graph' or 'comment'), a 'snippet' with matches in [brackets] and 'rank'.
+        """
+        query = fts_query(text)
+        if not query:
+            return []
+        columns = '''
+            g.id, g.name, g.expression, g.variable, g.x_min, g.x_max, g.y_min, g.y_max,
+            g.scale_type, g.created_at, u.username
+        '''
+        if self.has_search:
+            statements = {
+                'graphs': f'''
+                    SELECT {columns}, 'graph', snippet(graphs_fts, -1, '[', ']', '...', 8),
+                           bm25(graphs_fts, 2.0, 1.0)
+                    FROM graphs_fts
+                    JOIN graphs g ON g.id = graphs_fts.rowid
+                    LEFT JOIN users u ON u.id = g.user_id
+                    WHERE graphs_fts MATCH ? AND graphs_fts.rowid >= ?
+                    ORDER BY rank LIMIT ?
+                ''',
+                'comments': f'''
+                    SELECT {columns}, 'comment', snippet(comments_fts, 0, '[', ']', '...', 8), bm25(comments_fts)
+                    FROM comments_fts
+                    JOIN comments c ON c.id = comments_fts.rowid
+                    JOIN graphs g ON g.id = c.graph_id
+                    LEFT JOIN users u ON u.id = g.user_id
+                    WHERE comments_fts MATCH ? AND comments_fts.rowid >= ?
+                    ORDER BY rank LIMIT ?
+                '''
+            }
+        else:
+            # Without FTS5: unranked substring matches of the whole text, newest first
+            query = '%' + text.strip() + '%'
+            statements = {
+                'graphs': f'''
+                    SELECT {columns}, 'graph', g.name || ': ' || g.expression, 0
+                    FROM graphs g LEFT JOIN users u ON u.id = g.user_id
+                    WHERE g.name || ' ' || g.expression LIKE ?
+                    ORDER BY g.id DESC LIMIT ?
+                ''',
+                'comments': f'''
+                    SELECT {columns}, 'comment', c.comment_text, 0
+                    FROM comments c JOIN graphs g ON g.id = c.graph_id LEFT JOIN users u ON u.id = g.user_id
+                    WHERE c.comment_text LIKE ?
+                    ORDER BY c.id DESC LIMIT ?
+                '''
+            }
+        conn = self._connect()
+        c = conn.cursor()
+        rows = []
+        for scope in scopes:
+            if self.has_search:
+                # Ranking every match of a common word is slow on big tables, so only the
+                # newest SEARCH_CANDIDATES matches (a cheap rowid-ordered scan) are ranked
+                c.execute(f'''
+                    SELECT MIN(rowid) FROM (
+                        SELECT rowid FROM {scope}_fts WHERE {scope}_fts MATCH ?
+                        ORDER BY rowid DESC LIMIT ?
+                    )
+                ''', (query, SEARCH_CANDIDATES))
+                oldest = c.fetchone()[0]
+                if oldest is None:
+                    continue
+                c.execute(statements[scope], (query, oldest, limit))
+            else:
+                c.execute(statements[scope], (query, limit))
+            rows.extend(c.fetchall())
+        conn.close()
+        rows.sort(key=lambda row: row[13])
+        return [{
+            'id': r[0],
+            'name': r[1],
+            'expression': r[2],
+            'variable': r[3],
+            'x_min': r[4],
+            'x_max': r[5],
+            'y_min': r[6],
+            'y_max': r[7],
+            'scale_type': r[8],
+            'created_at': r[9],
+            'username': r[10],
+            'source': r[11],
+            'snippet': r[12],
+            'rank': r[13]
+        } for r in rows[:limit]]
+
+    def iter_graphs(self, student_username=None, after_id=0, batch_size=500):
+        """
+        Stream graphs with their owner's username in id order, batch_size rows at a time.
+        Each batch is its own query continuing after the last id seen, and its
+        statement is finished before any row is yielded, so a slow consumer
+        never holds a read transaction open.
+        """
+        query = '''
+            SELECT g.id, g.name, g.expression, g.variable,
+                   g.x_min, g.x_max, g.y_min, g.y_max, g.scale_type,
+                   u.username, g.expression_hash
+            FROM graphs g
+            LEFT JOIN users u ON g.user_id = u.id
+            WHERE g.id > ?
+        '''
+        if student_username:
+            query += ' AND u.username = ?'
+        query += ' ORDER BY g.id LIMIT ?'
+        conn = self._connect()
+        try:
+            while True:
+                params = [after_id, student_username, batch_size] if student_username else [after_id, batch_size]
+                c = conn.cursor()
+                c.execute(query, params)
+                graphs = c.fetchall()
+                c.close()
+                if not graphs:
+                    break
+                after_id = graphs[-1][0]
+                for g in graphs:
+                    yield {
+                        'id': g[0],
+                        'name': g[1],
+                        'expression': g[2],
+                        'variable': g[3],
+                        'x_min': g[4],
+                        'x_max': g[5],
+                        'y_min': g[6],
+                        'y_max': g[7],
+                        'scale_type': g[8],
+                        'username': g[9],
+                        'expression_hash': g[10]
+                    }
+                if len(graphs) < batch_size:
+                    break
+        finally:
+            conn.close()
+
+    @timed_query
     def add_comment(self, graph_id, teacher_id, comment_text):
         """Add a comment to a graph"""
-        conn = sqlite3.connect(self.db_file)
-        c = conn.cursor()
+        owner = self._writer.submit(self._insert_comment, graph_id, teacher_id, comment_text).result()
+        self.query_cache.invalidate(
+            ('get_graph_comments', graph_id),
+            ('get_user_graph_history', owner),
+            ('get_class_overview',),
+            ('get_student_summary', owner)
+        )
+
+    @timed_query
+    def add_comments(self, comments):
+        """Add many (graph_id, teacher_id, comment_text) comments in one transaction"""
+        comments = list(comments)
+        if not comments:
+            return
+        owners = self._writer.submit(self._insert_comments, comments).result()
+        graph_ids = {comment[0] for comment in comments}
+        self.query_cache.invalidate(
+            *[('get_graph_comments', graph_id) for graph_id in graph_ids],
+            *[('get_user_graph_history', owner) for owner in owners],
+            *[('get_student_summary', owner) for owner in owners],
+            ('get_class_overview',)
+        )
+
+    @staticmethod
+    def _insert_comments(c, comments):
+        c.executemany('''
+            INSERT INTO comments (graph_id, teacher_id, comment_text)
+            VALUES (?, ?, ?)
+        ''', comments)
+        owners = set()
+        for graph_id in {comment[0] for comment in comments}:
+            c.execute('SELECT user_id FROM graphs WHERE id = ?', (graph_id,))
+            owner = c.fetchone()
+            if owner:
+                owners.add(owner[0])
+        return owners
+
+    @staticmethod
+    def _insert_comment(c, graph_id, teacher_id, comment_text):
         c.execute('''
             INSERT INTO comments (graph_id, teacher_id, comment_text)
             VALUES (?, ?, ?)
         ''', (graph_id, teacher_id, comment_text))
-        conn.commit()
-        conn.close()
+        c.execute('SELECT user_id FROM graphs WHERE id = ?', (graph_id,))
+        owner = c.fetchone()
+        return owner[0] if owner else None
 
+    @timed_query
+    @cached_query
     def get_graph_comments(self, graph_id):
         """Get all comments for a specific graph"""
-        conn = sqlite3.connect(self.db_file)
+        conn = self._connect()
         c = conn.cursor()
         c.execute('''
             SELECT c.comment_text, u.full_name, c.created_at
@@ -235,9 +1114,11 @@ class AdvancedDatabase:
             for c in comments
         ]
 
+    @timed_query
+    @cached_query
     def get_user_graph_history(self, user_id):
         """Get all graphs for a user with their comments"""
-        conn = sqlite3.connect(self.db_file)
+        conn = self._connect()
         c = conn.cursor()
         c.execute('''
             SELECT g.id, g.name, g.expression, g.variable,
@@ -282,9 +1163,11 @@ class AdvancedDatabase:
         conn.close()
         return result
 
+    @timed_query
+    @cached_query
     def get_student_graphs(self, student_username):
         """Get all graphs for a specific student"""
-        conn = sqlite3.connect(self.db_file)
+        conn = self._connect()
         c = conn.cursor()
         c.execute('''
             SELECT g.id, g.name, g.expression, g.variable,
@@ -309,3 +1192,71 @@ class AdvancedDatabase:
             'scale_type': g[8],
             'created_at': g[9]
         } for g in graphs]
+
+    @timed_query
+    def get_thumbnails(self, wanted):
+        """
+        Get stored thumbnails for (graph_id, param_hash) pairs as {graph_id: (param_hash, image)};
+        a preview made for any graph with the same expression and view settings is returned
+        """
+        wanted = list(wanted)
+        if not wanted:
+            return {}
+        conn = self._connect()
+        c = conn.cursor()
+        thumbnails = []
+        for start in range(0, len(wanted), THUMBNAIL_LOOKUP_CHUNK):
+            chunk = wanted[start:start + THUMBNAIL_LOOKUP_CHUNK]
+            pairs = ', '.join(['(?, ?)'] * len(chunk))
+            c.execute(f'''
+                WITH wanted (graph_id, param_hash) AS (VALUES {pairs})
+                SELECT w.graph_id, t.param_hash, t.image
+                FROM wanted w
+                JOIN graphs g ON g.id = w.graph_id
+                JOIN expression_thumbnails t ON t.expression_hash = g.expression_hash AND t.param_hash = w.param_hash
+            ''', [value for pair in chunk for value in pair])
+            thumbnails.extend(c.fetchall())
+        conn.close()
+        return {t[0]: (t[1], t[2]) for t in thumbnails}
+
+    @timed_query
+    def get_samples(self, graph_id, param_hash, engine_version):
+        """
+        Get the stored plot data of a graph's expression, or None if missing or made with other
+        parameters; samples computed for any graph with the same expression are shared
+        """
+        conn = self._connect()
+        c = conn.cursor()
+        c.execute('''
+            SELECT s.data
+            FROM graphs g
+            JOIN expression_samples s ON s.expression_hash = g.expression_hash
+            WHERE g.id = ? AND s.param_hash = ? AND s.engine_version = ?
+        ''', (graph_id, param_hash, engine_version))
+        row = c.fetchone()
+        conn.close()
+        return row[0] if row else None
+
+    @timed_query
+    def save_samples(self, graph_id, param_hash, engine_version, data):
+        """Store (or replace) the computed plot data of a graph's expression"""
+        self._writer.submit(self._replace_samples, graph_id, param_hash, engine_version, data).result()
+
+    @staticmethod
+    def _replace_samples(c, graph_id, param_hash, engine_version, data):
+        c.execute('''
+            INSERT OR REPLACE INTO expression_samples (expression_hash, param_hash, engine_version, data)
+            SELECT expression_hash, ?, ?, ? FROM graphs WHERE id = ? AND expression_hash IS NOT NULL
+        ''', (param_hash, engine_version, sqlite3.Binary(data), graph_id))
+
+    @timed_query
+    def save_thumbnail(self, graph_id, param_hash, image):
+        """Store (or replace) the thumbnail of a graph's expression in the given view"""
+        self._writer.submit(self._replace_thumbnail, graph_id, param_hash, image).result()
+
+    @staticmethod
+    def _replace_thumbnail(c, graph_id, param_hash, image):
+        c.execute('''
+            INSERT OR REPLACE INTO expression_thumbnails (expression_hash, param_hash, image)
+            SELECT expression_hash, ?, ? FROM graphs WHERE id = ? AND expression_hash IS NOT NULL
+        ''', (param_hash, sqlite3.Binary(image), graph_id))
@@ -0,0 +1,258 @@
+# dataset_generator.py
+"""
+Fill a fresh database with a realistic synthetic class for benchmarks.
+
+Teachers, students, graphs (from a corpus of typical coursework expressions with
+random coefficients) and teacher comments are generated from one seed, so the
+same arguments always produce the same database. Rows go in with executemany in
+large transactions with syncing off, which builds millions of rows in seconds.
+The search indexes and dashboard summaries are rebuilt once at the end rather
+than row by row.
+
+    python dataset_generator.py --db big.db --students 2000 --graphs 50 --comments 1.5
+"""
+import argparse
+import logging
+import os
+import sqlite3
+import sys
+import time
+import numpy as np
+
+import expression_engine
+from database import AdvancedDatabase, CHANGE_TRACKED_TABLES, SEARCH_INDEXES
+
+# Expression templates; {a}, {b}, {c} are replaced with small random coefficients
+EXPRESSION_CORPUS = (
+    ('Linear function', '{a}*x + {b}'),
+    ('Quadratic', '{a}*x^2 + {b}*x + {c}'),
+    ('Quadratic', 'x^2 - {a}*x + {b}'),
+    ('Cubic', 'x^3 - {a}*x'),
+    ('Cubic', '{a}*x^3 + {b}*x^2 - x + {c}'),
+    ('Polynomial roots', '(x - {a})*(x + {b})'),
+    ('Quartic', 'x^4 - {a}*x^2 + {b}'),
+    ('Sine wave', 'sin(x)'),
+    ('Sine wave', '{a}*sin({b}*x)'),
+    ('Cosine wave', 'cos({a}*x) + {b}'),
+    ('Phase shift', 'sin(x + {a})'),
+    ('Tangent', 'tan(x)'),
+    ('Damped oscillation', 'exp(-x/{a})*sin({b}*x)'),
+    ('Exponential growth', 'exp({a}*x/10)'),
+    ('Exponential decay', '{a}*exp(-x)'),
+    ('Gaussian', 'exp(-x^2/{a})'),
+    ('Logarithm', 'log(x)'),
+    ('Natural log', 'ln(x + {a})'),
+    ('Square root', 'sqrt(x)'),
+    ('Square root', 'sqrt({a}*x + {b})'),
+    ('Reciprocal', '1/x'),
+    ('Rational function', '(x + {a})/(x - {b})'),
+    ('Absolute value', 'abs(x - {a})'),
+    ('Sigmoid', '1/(1 + exp(-x))'),
+    ('Hyperbolic', 'tanh({a}*x)'),
+    ('Sinc', 'sin(x)/x'),
+    ('Trig identity', 'sin(x)^2 + cos(x)^2'),
+    ('Product', 'x*sin(x)'),
+    ('Power', 'x^{a}'),
+    ('Solve equation', '{a}*x + {b} = {c}'),
+    ('Solve equation', 'x^2 = {a}'),
+    ('Solve equation', '3x+1=2x+8'),
+    ('Intersection', 'sin(x) = x/{a}'),
+)
+
+LOG_EXPRESSIONS = ('log(x)', 'ln(x + {a})', 'sqrt(x)', 'exp({a}*x/10)', 'x^{a}')
+
+COMMENT_CORPUS = (
+    "Good work!",
+    "Nice graph, well labelled.",
+    "Check your domain - the function is undefined for some x.",
+    "Try zooming out to see the end behaviour.",
+    "Where does it cross the x-axis?",
+    "Compare this with the derivative.",
+    "Can you find the maximum?",
+    "Great use of the log scale.",
+    "The range is too narrow to show the period.",
+    "Please redo with a wider x range.",
+    "Excellent - this matches the analytic solution.",
+    "What happens as x approaches 0?",
+)
+
+TERM_START = np.datetime64('2024-09-02T08:00:00', 's')
+TERM_DAYS = 120
+SCHOOL_DAY_SECONDS = 9 * 3600
+BATCH_ROWS = 100000
+
+X_MINS = np.array([-10.0, -5.0, -2.0, 0.0])
+X_SPANS = np.array([4.0, 10.0, 20.0])
+Y_LIMITS = np.array([5.0, 10.0, 50.0])
+
+
+def generate_users(first_id, teachers, students):
+    """(id, username, password, role, full_name, email) rows"""
+    rows = []
+    user_id = first_id
+    for role, count, width in (('teacher', teachers, 3), ('student', students, 5)):
+        for i in range(1, count + 1):
+            username = f'{role}{i:0{width}d}'
+            rows.append((user_id, username, f'{role}123', role, f'{role.title()} {i}', f'{username}@example.com'))
+            user_id += 1
+    return rows
+
+
+def format_times(seconds):
+    """SQLite CURRENT_TIMESTAMP strings for offsets in seconds from TERM_START"""
+    stamps = np.datetime_as_string(TERM_START + seconds.astype('timedelta64[s]'), unit='s')
+    return [stamp.replace('T', ' ') for stamp in stamps.tolist()]
+
+
+def generate_graphs(rng, student_ids, graphs_per_student, first_id):
+    """
+    Graph rows (id, user_id, name, expression, variable, x_min, x_max, y_min, y_max,
+    scale_type, created_at, expression_hash) for the given students, plus their creation
+    times in seconds
+    """
+    # Students do not all save the same amount of work
+    counts = np.maximum(0, np.rint(rng.normal(graphs_per_student, graphs_per_student / 4,
+                                              len(student_ids)))).astype(np.int64)
+    total = int(counts.sum())
+    user_ids = np.repeat(student_ids, counts)
+    numbers = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts) + 1
+    templates = rng.integers(len(EXPRESSION_CORPUS), size=total)
+    coefficients = np.stack([rng.integers(1, 10, total), rng.integers(1, 10, total),
+                             rng.integers(1, 10, total)], axis=1)
+    log_capable = np.array([template in LOG_EXPRESSIONS for _, template in EXPRESSION_CORPUS])
+    log_scale = log_capable[templates] & (rng.random(total) < 0.3)
+    x_min = np.where(log_scale, 0.1, X_MINS[rng.integers(len(X_MINS), size=total)])
+    x_max = x_min + X_SPANS[rng.integers(len(X_SPANS), size=total)]
+    y_limit = Y_LIMITS[rng.integers(len(Y_LIMITS), size=total)]
+    created = rng.integers(TERM_DAYS, size=total) * 86400 + rng.integers(SCHOOL_DAY_SECONDS, size=total)
+
+    # There are few distinct (template, coefficients) combinations, so format each once
+    rendered = {}
+    expressions = []
+    hashes = []
+    for key in zip(templates.tolist(), map(tuple, coefficients.tolist())):
+        entry = rendered.get(key)
+        if entry is None:
+            a, b, c = key[1]
+            expression = EXPRESSION_CORPUS[key[0]][1].format(a=a, b=b, c=c)
+            entry = rendered[key] = (expression, expression_engine.expression_hash(expression))
+        expressions.append(entry[0])
+        hashes.append(entry[1])
+    names = [f'{EXPRESSION_CORPUS[t][0]} {n}' for t, n in zip(templates.tolist(), numbers.tolist())]
+    scale_types = np.where(log_scale, 'log', 'linear').tolist()
+    rows = list(zip(range(first_id, first_id + total), user_ids.tolist(), names, expressions,
+                    ['x'] * total, x_min.tolist(), x_max.tolist(), (-y_limit).tolist(), y_limit.tolist(),
+                    scale_types, format_times(created), hashes))
+    return rows, created
+
+
+def generate_comments(rng, graph_ids, created, teacher_ids, comments_per_graph):
+    """(graph_id, teacher_id, comment_text, created_at) rows; each comment comes after the last"""
+    counts = rng.poisson(comments_per_graph, len(graph_ids))
+    total = int(counts.sum())
+    owners = np.repeat(np.arange(len(graph_ids)), counts)
+    # Minutes to a week between a graph and its comments, and between comments
+    gaps = rng.integers(60, 7 * 86400, size=total)
+    elapsed = np.cumsum(gaps)
+    starts = np.cumsum(counts) - counts
+    elapsed -= np.repeat(np.concatenate([[0], elapsed])[starts], counts)
+    texts = rng.integers(len(COMMENT_CORPUS), size=total)
+    teachers = np.asarray(teacher_ids)[rng.integers(len(teacher_ids), size=total)]
+    return list(zip(np.asarray(graph_ids)[owners].tolist(), teachers.tolist(),
+                    [COMMENT_CORPUS[t] for t in texts.tolist()],
+                    format_times(created[owners] + elapsed)))
+
+
+def generate(db_file, teachers=5, students=200, graphs_per_student=20, comments_per_graph=1.0, seed=0):
+    """Create db_file (schema from AdvancedDatabase) and fill it; returns row counts per table"""
+    db = AdvancedDatabase(db_file)
+    search_tables = [table for table, *_ in SEARCH_INDEXES] if db.has_search else []
+    db.close()
+    rng = np.random.default_rng(seed)
+    conn = sqlite3.connect(db_file)
+    try:
+        conn.execute('PRAGMA synchronous = OFF')
+        conn.execute('PRAGMA journal_mode = MEMORY')
+        # FTS5 flushes its pending terms at every statement, so indexing through the
+        # insert triggers is several times slower than one rebuild after the load
+        for table in search_tables:
+            conn.execute(f'DROP TRIGGER IF EXISTS {table}_insert')
+        conn.execute('DROP TRIGGER IF EXISTS graphs_summary_insert')
+        conn.execute('DROP TRIGGER IF EXISTS comments_summary_insert')
+        for table in CHANGE_TRACKED_TABLES:
+            conn.execute(f'DROP TRIGGER IF EXISTS {table}_changes_insert')
+        first_user = conn.execute('SELECT COALESCE(MAX(id), 0) + 1 FROM users').fetchone()[0]
+        users = generate_users(first_user, teachers, students)
+        conn.executemany('''
+            INSERT INTO users (id, username, password, role, full_name, email)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', users)
+        conn.commit()
+        counts = {'users': len(users), 'graphs': 0, 'comments': 0}
+        teacher_ids = [row[0] for row in users if row[3] == 'teacher']
+        student_ids = np.array([row[0] for row in users if row[3] == 'student'], dtype=np.int64)
+
+        # One transaction per chunk of students holding about BATCH_ROWS graphs
+        next_graph = conn.execute('SELECT COALESCE(MAX(id), 0) + 1 FROM graphs').fetchone()[0]
+        chunk = max(1, int(BATCH_ROWS // max(graphs_per_student, 1)))
+        for first in range(0, len(student_ids), chunk):
+            graphs, created = generate_graphs(rng, student_ids[first:first + chunk], graphs_per_student, next_graph)
+            expressions = {row[11]: row[3] for row in graphs}
+            conn.executemany('INSERT OR IGNORE INTO expressions (hash, canonical) VALUES (?, ?)',
+                             [(digest, expression_engine.canonical_form(text)) for digest, text in expressions.items()])
+            conn.executemany('''
+                INSERT INTO graphs (id, user_id, name, expression, variable,
+                                    x_min, x_max, y_min, y_max, scale_type, created_at, expression_hash)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', graphs)
+            if teacher_ids and comments_per_graph > 0:
+                graph_ids = np.arange(next_graph, next_graph + len(graphs))
+                comments = generate_comments(rng, graph_ids, created, teacher_ids, comments_per_graph)
+                conn.executemany('''
+                    INSERT INTO comments (graph_id, teacher_id, comment_text, created_at)
+                    VALUES (?, ?, ?, ?)
+                ''', comments)
+                counts['comments'] += len(comments)
+            conn.commit()
+            counts['graphs'] += len(graphs)
+            next_graph += len(graphs)
+        for table in search_tables:
+            conn.execute(f"INSERT INTO {table} ({table}) VALUES ('rebuild')")
+        # One bump per table stands in for the dropped per-row ones
+        conn.execute('UPDATE change_counters SET version = version + 1')
+        conn.commit()
+    finally:
+        conn.close()
+    # Opening recreates the dropped triggers
+    db = AdvancedDatabase(db_file)
+    db.rebuild_summaries()
+    db.close()
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic classroom database")
+    parser.add_argument('--db', required=True, help="Database file to create")
+    parser.add_argument('--teachers', type=int, default=5)
+    parser.add_argument('--students', type=int, default=200)
+    parser.add_argument('--graphs', type=float, default=20, help="Mean graphs per student")
+    parser.add_argument('--comments', type=float, default=1.0, help="Mean comments per graph")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--force', action='store_true', help="Replace the file if it exists")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+
+    if os.path.exists(args.db):
+        if not args.force:
+            logging.error(f"{args.db} exists; use --force to replace it")
+            return 1
+        os.remove(args.db)
+    start = time.perf_counter()
+    counts = generate(args.db, args.teachers, args.students, args.graphs, args.comments, args.seed)
+    logging.info(f"Wrote {counts['users']} users, {counts['graphs']} graphs and {counts['comments']} comments "
+                 f"to {args.db} in {time.perf_counter() - start:.1f} s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,604 @@
+# expression_engine.py
+import builtins
+import functools
+import hashlib
+import importlib.metadata
+import inspect
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import wait
+
+import numpy as np
+from scipy import special, integrate
+
+import metrics
+
+# sympy is imported on first use only: expressions whose generated code is already
+# in the source cache are rebuilt without it
+
+# Names available to expressions on top of the numpy namespace
+MATH_FUNCS = {
+    'ln': np.log,
+    'log': np.log10,
+    'sin': np.sin,
+    'cos': np.cos,
+    'tan': np.tan,
+    'sqrt': np.sqrt,
+    'exp': np.exp,
+    'abs': np.abs,
+    'sinh': np.sinh,
+    'cosh': np.cosh,
+    'tanh': np.tanh,
+    'asin': np.arcsin,
+    'acos': np.arccos,
+    'atan': np.arctan,
+    'sec': lambda v: 1 / np.cos(v),
+    'csc': lambda v: 1 / np.sin(v),
+    'cot': lambda v: 1 / np.tan(v),
+    'gamma': special.gamma,
+    'polygamma': special.polygamma,
+    'digamma': special.digamma,
+    'erf': special.erf,
+    'erfc': special.erfc,
+    'beta': special.beta,
+    'factorial': special.factorial,
+    'pi': np.pi,
+    'e': np.e,
+    'inf': np.inf,
+    'golden': (1 + np.sqrt(5)) / 2
+}
+
+CACHE_SIZE = 128
+
+# Grid points evaluated per block: 16k float64 values (128 KiB) per temporary stays in L2 cache
+BLOCK_SIZE = 1 << 14
+
+# Below this many samples per thread, handing blocks to a pool costs more than it saves
+PARALLEL_MIN_POINTS = 1 << 17
+
+# Grids at least this large are worth a Numba kernel (see jit_backend) when one is available
+JIT_MIN_POINTS = 1 << 18
+
+PRECISIONS = {'float64': np.float64, 'float32': np.float32}
+
+# Bump whenever MATH_FUNCS or the optimizer changes what generated code computes
+FUNCTION_TABLE_VERSION = 1
+
+# Bump whenever sampled plots (grids, overlays, solving) would come out differently;
+# stored samples from an older engine are recomputed
+ENGINE_VERSION = 1
+
+CACHE_ROOT = os.environ.get('GRAPHING_CALCULATOR_CACHE',
+                            os.path.join(os.path.expanduser('~'), '.cache', 'graphing_calculator'))
+SOURCE_CACHE_DIR = os.path.join(CACHE_ROOT, 'expressions')
+JIT_CACHE_DIR = os.path.join(CACHE_ROOT, 'jit')
+
+# Overlay keys understood by evaluate_overlays
+OVERLAY_DERIVATIVE = 'derivative'
+OVERLAY_SECOND_DERIVATIVE = 'second_derivative'
+OVERLAY_INTEGRAL = 'integral'
+
+
+def parse(text: str):
+    """Parse calculator syntax (implicit multiplication, ^ for powers) into a sympy expression"""
+    from sympy.parsing.sympy_parser import (parse_expr, standard_transformations,
+                                            implicit_multiplication_application, convert_xor)
+    transformations = standard_transformations + (implicit_multiplication_application, convert_xor,)
+    return parse_expr(text, transformations=transformations)
+
+
+def fold_constants(expr):
+    """
+    Evaluate every symbol-free subexpression (pi/4, sqrt(2), factorial(5), ...) once, up front,
+    including the numeric factors and terms of a product or sum with symbols (pi/4*x -> 0.785...*x)
+    """
+    def foldable(node):
+        if node.is_Atom:
+            return False
+        if node.is_number:
+            return True
+        if node.is_Mul or node.is_Add:
+            constant = node.as_independent(*node.free_symbols)[0]
+            return constant.is_number and not constant.is_Number
+        return False
+
+    def fold(node):
+        if node.is_number:
+            value = node.evalf(17)
+            return value if value.is_finite else node
+        constant, rest = node.as_independent(*node.free_symbols)
+        value = constant.evalf(17)
+        if not value.is_finite:
+            return node
+        return value * rest if node.is_Mul else value + rest
+
+    return expr.replace(foldable, fold)
+
+
+def to_horner(expr, symbol):
+    """
+    Rewrite polynomial sums in symbol into Horner form (one multiply-add per degree); in a sum
+    that mixes in other terms (sin(x) + x**2 + 3*x + 1) the polynomial terms are rewritten together
+    """
+    from sympy import Add, degree, horner
+
+    def split(node):
+        polynomial = [term for term in node.args if term.is_polynomial(symbol)]
+        return Add(*polynomial), Add(*[term for term in node.args if not term.is_polynomial(symbol)])
+
+    def is_polynomial(node):
+        return node.is_Add and degree(split(node)[0], symbol) >= 2
+
+    def rewrite(node):
+        polynomial, rest = split(node)
+        try:
+            return horner(polynomial, wrt=symbol) + rest
+        except Exception:
+            return node
+
+    return expr.replace(is_polynomial, rewrite)
+
+
+def optimize_expression(expr, symbol):
+    """Constant folding followed by Horner form; common subexpressions are shared by lambdify_optimized"""
+    try:
+        return to_horner(fold_constants(expr), symbol)
+    except Exception:
+        return expr
+
+
+def lambdify_optimized(symbol, exprs):
+    """
+    Compile one or several expressions into a single NumPy function.
+    Each expression is optimized, then sympy.cse runs across all of them, so a
+    subexpression shared between curves (or repeated within one) is computed once.
+    """
+    from sympy import lambdify
+    if isinstance(exprs, (list, tuple)):
+        optimized = [optimize_expression(expr, symbol) for expr in exprs]
+    else:
+        optimized = optimize_expression(exprs, symbol)
+    return lambdify(symbol, optimized, modules=['numpy', MATH_FUNCS], cse=True)
+
+
+def _as_array(values, x):
+    """Broadcast a scalar result (constant expression) to the shape of x"""
+    if np.ndim(values) == 0:
+        return np.full(np.shape(x), values)
+    return values
+
+
+class CompiledExpression:
+    """
+    An expression with its NumPy evaluator and cached derivatives.
+    func/source come from the source cache when available; the sympy form is
+    only parsed when something symbolic (derivatives, groups) needs it.
+    """
+
+    def __init__(self, text: str, variable: str = 'x', func=None, source=None):
+        self.text = text
+        self.variable = variable
+        self._expr = None
+        if func is None:
+            func = lambdify_optimized(self.symbol, self.expr)
+            source = inspect.getsource(func)
+        self.func = func
+        self.source = source
+        self._derivatives = {}
+        self._jit = None
+        self._jit_tried = False
+        self._lock = threading.Lock()
+
+    @property
+    def symbol(self):
+        from sympy import Symbol
+        return Symbol(self.variable)
+
+    @property
+    def expr(self):
+        if self._expr is None:
+            self._expr = parse(self.text)
+        return self._expr
+
+    def __call__(self, x):
+        return _as_array(self.func(x), x)
+
+    def evaluate_all(self, x):
+        return [self(x)]
+
+    def derivative(self, order: int = 1):
+        """Return the lambdified derivative of the given order, or None if it has no closed form"""
+        with self._lock:
+            if order not in self._derivatives:
+                self._derivatives[order] = self._compile_derivative(order)
+            return self._derivatives[order]
+
+    def jit_kernel(self):
+        """Return a Numba evaluate(x, out) for this expression, or None to stay on NumPy"""
+        with self._lock:
+            if not self._jit_tried:
+                self._jit_tried = True
+                import jit_backend
+                if jit_backend.available():
+                    self._jit = jit_backend.compile_kernel(self.text, self.source, self.func, JIT_CACHE_DIR)
+            return self._jit
+
+    def _compile_derivative(self, order):
+        from sympy import diff, Derivative, Subs
+        try:
+            derived = diff(self.expr, self.symbol, order)
+            if derived.has(Derivative, Subs):
+                return None
+            func = lambdify_optimized(self.symbol, derived)
+            # Unknown functions only fail once called, so probe a single point
+            with np.errstate(all='ignore'):
+                func(np.array([0.5]))
+            return func
+        except Exception:
+            return None
+
+
+class CompiledGroup:
+    """Several expressions plotted together, compiled into one function with shared subexpressions"""
+
+    def __init__(self, members, func=None, source=None):
+        self.members = members
+        if func is None:
+            func = lambdify_optimized(members[0].symbol, [member.expr for member in members])
+            source = inspect.getsource(func)
+        self.func = func
+        self.source = source
+
+    def __call__(self, x):
+        return [_as_array(values, x) for values in self.func(x)]
+
+    evaluate_all = __call__
+
+    def jit_kernel(self):
+        return None
+
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+_cache_stats = {'hits': 0, 'misses': 0}
+
+
+def _cache_lookup(key):
+    with _cache_lock:
+        compiled = _cache.get(key)
+        if compiled is not None:
+            _cache.move_to_end(key)
+            _cache_stats['hits'] += 1
+        else:
+            _cache_stats['misses'] += 1
+        return compiled
+
+
+def _cache_store(key, compiled):
+    with _cache_lock:
+        _cache[key] = compiled
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+
+
+# Where generated code may get its globals from when it is rebuilt without sympy
+_ORIGINS = {
+    'numpy': lambda name: getattr(np, name),
+    'math': lambda name: MATH_FUNCS[name],
+    'builtins': lambda name: getattr(builtins, name),
+    'functools': lambda name: getattr(functools, name),  # reduce, for Min/Max
+}
+
+
+@functools.lru_cache(maxsize=1)
+def _sympy_version():
+    try:
+        return importlib.metadata.version('sympy')
+    except importlib.metadata.PackageNotFoundError:
+        return 'unknown'
+
+
+def canonical_text(text: str) -> str:
+    """Expression text with runs of whitespace collapsed (they never change the parse)"""
+    return " ".join(text.split())
+
+
+@functools.lru_cache(maxsize=4096)
+def canonical_form(text: str) -> str:
+    """
+    The expression as sympy prints it after parsing, so spellings such as "2x+x" and
+    "3*x" agree; equations keep both sides. Unparseable text only has its whitespace collapsed.
+    """
+    try:
+        return " = ".join(str(parse(side)) for side in text.split("=", 1))
+    except Exception:
+        return canonical_text(text)
+
+
+def expression_hash(text: str) -> str:
+    """Content address of an expression: SHA-1 of its canonical form"""
+    return hashlib.sha1(canonical_form(text).encode('utf-8')).hexdigest()
+
+
+def _source_path(texts, variable):
+    key = "\x1f".join([str(FUNCTION_TABLE_VERSION), _sympy_version(), variable] + texts)
+    return os.path.join(SOURCE_CACHE_DIR, hashlib.sha1(key.encode('utf-8')).hexdigest() + '.json')
+
+
+def _global_origins(func):
+    """Map each global the generated function reads to its _ORIGINS entry, or None if one can't be rebuilt"""
+    origins = {}
+    for name in func.__code__.co_names:
+        value = func.__globals__.get(name, getattr(builtins, name, None))
+        for origin, resolve in _ORIGINS.items():
+            try:
+                if resolve(name) is value:
+                    origins[name] = origin
+                    break
+            except (AttributeError, KeyError):
+                continue
+        else:
+            return None
+    return origins
+
+
+def store_source(texts, variable, func, source):
+    """Write generated code to the source cache so later sessions can skip sympy"""
+    origins = _global_origins(func)
+    if origins is None or not source:
+        return
+    record = {'texts': texts, 'variable': variable, 'function': func.__name__,
+              'source': source, 'globals': origins}
+    path = _source_path(texts, variable)
+    try:
+        os.makedirs(SOURCE_CACHE_DIR, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.part"
+        with open(tmp_path, 'w') as f:
+            json.dump(record, f)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        logging.debug(f"Could not cache generated code: {str(e)}")
+
+
+def load_source(texts, variable):
+    """Rebuild (func, source) from the source cache without sympy, or None on a miss"""
+    path = _source_path(texts, variable)
+    try:
+        with open(path) as f:
+            record = json.load(f)
+        if record['texts'] != texts or record['variable'] != variable:
+            return None
+        namespace = {name: _ORIGINS[origin](name) for name, origin in record['globals'].items()}
+        exec(compile(record['source'], path, 'exec'), namespace)
+        return namespace[record['function']], record['source']
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logging.debug(f"Ignoring unusable cached code {path}: {str(e)}")
+        return None
+
+
+def compile_expression(text: str, variable: str = 'x') -> CompiledExpression:
+    """
+    Return the cached CompiledExpression for text. On a miss the generated code is
+    loaded from the source cache, or produced with sympy and written there.
+    """
+    key = (canonical_text(text), variable)
+    compiled = _cache_lookup(key)
+    if compiled is None:
+        loaded = load_source([key[0]], variable)
+        if loaded is not None:
+            compiled = CompiledExpression(key[0], variable, *loaded)
+        else:
+            compiled = CompiledExpression(key[0], variable)
+            store_source([key[0]], variable, compiled.func, compiled.source)
+        _cache_store(key, compiled)
+    return compiled
+
+
+def compile_group(texts, variable: str = 'x') -> CompiledGroup:
+    """Return the cached CompiledGroup evaluating all texts in one pass"""
+    texts = [canonical_text(text) for text in texts]
+    key = ('group', tuple(texts), variable)
+    compiled = _cache_lookup(key)
+    if compiled is None:
+        members = [compile_expression(text, variable) for text in texts]
+        loaded = load_source(texts, variable)
+        if loaded is not None:
+            compiled = CompiledGroup(members, *loaded)
+        else:
+            compiled = CompiledGroup(members)
+            store_source(texts, variable, compiled.func, compiled.source)
+        _cache_store(key, compiled)
+    return compiled
+
+
+def cache_info():
+    """Return hit/miss counters and the current size of the expression cache"""
+    with _cache_lock:
+        return dict(_cache_stats, size=len(_cache))
+
+
+def _cache_lookups():
+    info = cache_info()
+    return {('hit',): info['hits'], ('miss',): info['misses']}
+
+
+metrics.REGISTRY.callback('calculator_expression_cache_lookups_total', 'Compiled expression cache lookups',
+                          _cache_lookups, kind='counter', labelnames=('result',))
+metrics.REGISTRY.callback('calculator_expression_cache_entries', 'Compiled expressions held in memory',
+                          lambda: cache_info()['size'])
+
+
+def clear_cache():
+    """Drop every compiled expression"""
+    with _cache_lock:
+        _cache.clear()
+
+
+def fill_grid(out, start, x_min, x_max, num_points, log_scale=False):
+    """Write grid points start .. start+len(out)-1 of a linspace/logspace into out"""
+    if log_scale:
+        x_min, x_max = np.log10(x_min), np.log10(x_max)
+    step = (x_max - x_min) / (num_points - 1) if num_points > 1 else 0.0
+    # Positions are computed in float64 even for a float32 grid, then cast on copy
+    values = np.arange(start, start + len(out), dtype=np.float64)
+    np.multiply(values, step, out=values)
+    np.add(values, x_min, out=values)
+    if start + len(out) == num_points and num_points > 1:
+        values[-1] = x_max  # same exact end point as np.linspace
+    if log_scale:
+        np.power(10.0, values, out=values)
+    np.copyto(out, values, casting='same_kind')
+    return out
+
+
+class _ComplexResult(Exception):
+    """A block produced complex values after the outputs were allocated as real"""
+
+
+def _evaluate_blocks(compiled, x, outputs, first, last, x_min, x_max, num_points, log_scale, block_size,
+                     kernel=None, errors=None):
+    """Fill x[first:last] and the matching slice of every output, block by block"""
+    # np.errstate is per thread, so pool workers are handed the caller's settings
+    with np.errstate(**(errors or np.geterr())):
+        for start in range(first, last, block_size):
+            stop = min(start + block_size, last)
+            x_block = fill_grid(x[start:stop], start, x_min, x_max, num_points, log_scale)
+            if kernel is not None:
+                kernel(x_block, outputs[0][start:stop])
+                continue
+            for out, values in zip(outputs, compiled.evaluate_all(x_block)):
+                if np.iscomplexobj(values) and not np.iscomplexobj(out):
+                    raise _ComplexResult()
+                np.copyto(out[start:stop], values, casting='unsafe')
+
+
+def split_range(first, last, parts, block_size=BLOCK_SIZE):
+    """Split [first, last) into at most parts contiguous, block-aligned (start, stop) slices"""
+    blocks = -(-(last - first) // block_size)
+    parts = max(1, min(parts, blocks))
+    bounds = [first + (blocks * i // parts) * block_size for i in range(parts)] + [last]
+    return [(bounds[i], bounds[i + 1]) for i in range(parts) if bounds[i] < bounds[i + 1]]
+
+
+def plan_workers(num_points, max_workers, min_points=PARALLEL_MIN_POINTS):
+    """Threads worth using for a grid: one per min_points samples, capped at max_workers"""
+    return max(1, min(max_workers or 1, num_points // min_points))
+
+
+def evaluate_grid(compiled, x_min, x_max, num_points, log_scale=False,
+                  dtype=np.float64, block_size=BLOCK_SIZE, executor=None, workers=1, backend='numpy'):
+    """
+    Evaluate a CompiledExpression or CompiledGroup on a num_points grid, one block at a time.
+    Grid points are generated straight into the preallocated x array and each block's
+    results copied into one preallocated output per expression, so temporaries never
+    exceed block_size elements however fine the grid. With an executor and workers > 1
+    the remaining blocks are split into contiguous slices filled concurrently (NumPy
+    releases the GIL inside ufuncs). backend='jit' runs a fused Numba loop per block
+    instead of NumPy ufuncs when the expression has one. Returns (x, [outputs]).
+    """
+    x = np.empty(num_points, dtype=dtype)
+    if num_points == 0:
+        return x, []
+    kernel = compiled.jit_kernel() if backend == 'jit' else None
+    first_stop = min(block_size, num_points)
+    x_block = fill_grid(x[:first_stop], 0, x_min, x_max, num_points, log_scale)
+    if kernel is not None:
+        outputs = [np.empty(num_points, dtype=dtype)]
+        kernel(x_block, outputs[0][:first_stop])
+    else:
+        # The first block decides how many outputs there are and whether they are complex
+        results = compiled.evaluate_all(x_block)
+        outputs = [np.empty(num_points, dtype=np.result_type(values, dtype)) for values in results]
+        for out, values in zip(outputs, results):
+            np.copyto(out[:first_stop], values, casting='unsafe')
+
+    args = (x_min, x_max, num_points, log_scale, block_size, kernel)
+    slices = split_range(first_stop, num_points, workers, block_size)
+    try:
+        if executor is None or len(slices) < 2:
+            for first, last in slices:
+                _evaluate_blocks(compiled, x, outputs, first, last, *args)
+        else:
+            errors = np.geterr()
+            futures = [executor.submit(_evaluate_blocks, compiled, x, outputs, first, last, *args, errors)
+                       for first, last in slices]
+            wait(futures)  # every slice must stop writing before a possible complex retry
+            for future in futures:
+                future.result()
+    except _ComplexResult:
+        # Rare: real at the start of the grid, complex further on; redo with complex outputs
+        outputs = [out.astype(np.result_type(out, np.complex64)) for out in outputs]
+        _evaluate_blocks(compiled, x, outputs, first_stop, num_points, *args)
+    return x, outputs
+
+
+def solve_real(left: str, right: str, variable: str, x_min: float, x_max: float):
+    """Real solutions of left = right inside [x_min, x_max]"""
+    from sympy import symbols, solve
+    var_sym = symbols(variable)
+    left_expr = parse(left)
+    right_expr = parse(right)
+    values = []
+    for sol in solve(left_expr - right_expr, var_sym):
+        try:
+            sol_val = float(sol)
+        except (TypeError, ValueError):
+            continue
+        if x_min <= sol_val <= x_max:
+            values.append(sol_val)
+    return values
+
+
+def finite_difference(x, y, order: int = 1):
+    """Differentiate sampled values on the (possibly non-uniform) grid x"""
+    result = np.asarray(y, dtype=float)
+    for _ in range(order):
+        result = np.gradient(result, x)
+    return result
+
+
+def cumulative_integral(x, y, method: str = 'trapezoid'):
+    """Running integral of y from x[0], with non-finite samples contributing nothing"""
+    y = np.asarray(y, dtype=float)
+    finite = np.isfinite(y)
+    clean = np.where(finite, y, 0.0)
+    if method == 'simpson' and hasattr(integrate, 'cumulative_simpson') and len(x) > 2:
+        result = integrate.cumulative_simpson(clean, x=x, initial=0.0)
+    else:
+        result = np.empty_like(clean)
+        result[0] = 0.0
+        np.cumsum((clean[1:] + clean[:-1]) * np.diff(x) * 0.5, out=result[1:])
+    result[~finite] = np.nan
+    return result
+
+
+def evaluate_overlays(compiled: CompiledExpression, x, y, overlays, integral_method='trapezoid'):
+    """
+    Compute the requested overlays for an already sampled curve.
+    Each derivative costs at most one extra vectorized evaluation; the integral reuses y.
+    """
+    results = {}
+    if len(x) < 3:
+        return results
+    for key, order in ((OVERLAY_DERIVATIVE, 1), (OVERLAY_SECOND_DERIVATIVE, 2)):
+        if key not in overlays:
+            continue
+        func = compiled.derivative(order)
+        values = None
+        if func is not None:
+            try:
+                with np.errstate(all='ignore'):
+                    values = _as_array(func(x), x)
+            except Exception:
+                values = None
+        if values is None or np.iscomplexobj(values):
+            values = finite_difference(x, y, order)
+        results[key] = values
+    if OVERLAY_INTEGRAL in overlays:
+        results[OVERLAY_INTEGRAL] = cumulative_integral(x, y, integral_method)
+    return results
@@ -0,0 +1,332 @@
+# grading.py
+"""
+Batch auto-grading of saved graphs against a reference expression.
+
+Each graph's expression is evaluated on one grid shared with the reference
+and compared with it numerically; when the numbers cannot decide (the two
+differ only where one is undefined, or by rounding-sized amounts) sympy
+checks whether the difference simplifies to zero, in a process of its own
+that is killed after SYMBOLIC_TIMEOUT seconds. Each graph is evaluated in
+its own variable, and graphs are grouped by (expression content hash,
+variable), so a class that saved the same few expressions costs a few
+evaluations; verdicts are memoized per (reference, expression) pair for the
+life of the process. Distinct expressions are graded in a process pool;
+verdicts can be posted as comments in one transaction.
+
+    python grading.py --reference "x^2 - 4" --x-min -5 --x-max 5 --name Quadratic --latest
+    python grading.py --reference "sin(x)" --teacher teacher1 --comment
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import multiprocessing.connection
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import expression_engine
+from database import AdvancedDatabase
+
+GRID_POINTS = 512
+RTOL = 1e-6
+ATOL = 1e-9
+# Relative differences below this may be rounding (e.g. cancellation); sympy decides them
+SYMBOLIC_THRESHOLD = 1e-3
+# Fewer distinct expressions than this are graded in-process, without starting a pool
+POOL_MIN_EXPRESSIONS = 64
+# A symbolic check still running after this many seconds is stopped and the graph left ungraded
+SYMBOLIC_TIMEOUT = 10.0
+
+CORRECT = 'correct'
+INCORRECT = 'incorrect'
+INVALID = 'invalid'
+
+# (reference hash, expression hash, graph variable, reference variable, x_min, x_max, points) -> verdict dict
+_memo = {}
+_memo_lock = threading.Lock()
+
+
+def sample_grid(x_min, x_max, num_points=GRID_POINTS):
+    """The shared grid, nudged off round numbers so removable singularities rarely land on it"""
+    span = x_max - x_min
+    return np.linspace(x_min + span * 1e-4, x_max - span * 1.3e-4, num_points)
+
+
+def compare_samples(reference, values, rtol=RTOL, atol=ATOL):
+    """
+    (outcome, max_error) for two sample arrays, where outcome is CORRECT, INCORRECT
+    or None when only a symbolic check can tell
+    """
+    reference_finite = np.isfinite(reference)
+    values_finite = np.isfinite(values)
+    both = reference_finite & values_finite
+    if not both.any():
+        return None, float('nan')
+    scale = max(1.0, float(np.max(np.abs(reference[both]))))
+    difference = np.abs(values[both] - reference[both])
+    max_error = float(np.max(difference))
+    if np.all(difference <= atol * scale + rtol * np.abs(reference[both])):
+        # Equal wherever both are defined; a different domain needs a closer look
+        return (CORRECT if np.array_equal(reference_finite, values_finite) else None), max_error
+    if max_error / scale < SYMBOLIC_THRESHOLD:
+        return None, max_error
+    return INCORRECT, max_error
+
+
+def symbolically_equal(reference, text, variable='x', reference_variable=None):
+    """True when reference - text simplifies to zero, with text's variable renamed to the reference's"""
+    from sympy import Symbol, simplify
+    symbol = Symbol(variable)
+    reference_symbol = Symbol(reference_variable or variable)
+    reference_expr = expression_engine.parse(reference)
+    expr = expression_engine.parse(text).subs(symbol, reference_symbol)
+    if not (expr.free_symbols <= {reference_symbol} | reference_expr.free_symbols):
+        return False
+    return simplify(reference_expr - expr) == 0
+
+
+def _symbolic_worker(connection, *args):
+    try:
+        connection.send((symbolically_equal(*args), None))
+    except Exception as e:
+        connection.send((None, str(e)))
+    finally:
+        connection.close()
+
+
+def check_symbolic(checks, workers=1, timeout=SYMBOLIC_TIMEOUT):
+    """
+    {key: (equal, error)} for {key: symbolically_equal arguments}. Each check runs
+    in a process of its own, at most workers at a time, and is killed once it has
+    run for timeout seconds: sympy's simplify has no time limit of its own.
+    """
+    context = multiprocessing.get_context()
+    waiting = list(checks.items())
+    running = {}  # key -> (process, connection, deadline)
+    results = {}
+    while waiting or running:
+        while waiting and len(running) < workers:
+            key, args = waiting.pop(0)
+            receiver, sender = context.Pipe(duplex=False)
+            process = context.Process(target=_symbolic_worker, args=(sender, *args), daemon=True)
+            process.start()
+            sender.close()
+            running[key] = (process, receiver, time.monotonic() + timeout)
+        ready = multiprocessing.connection.wait([receiver for _, receiver, _ in running.values()], timeout=0.05)
+        now = time.monotonic()
+        for key, (process, receiver, deadline) in list(running.items()):
+            if receiver in ready:
+                try:
+                    results[key] = receiver.recv()
+                except EOFError:
+                    results[key] = (None, f"symbolic check failed (exit code {process.exitcode})")
+            elif now >= deadline:
+                process.kill()
+                results[key] = (None, f"symbolic check gave up after {timeout:g} s")
+            else:
+                continue
+            process.join()
+            receiver.close()
+            del running[key]
+    return results
+
+
+def grade_expressions(reference, items, x_min, x_max, reference_variable='x', num_points=GRID_POINTS):
+    """
+    Numeric verdicts for (text, variable) items against reference as {item: verdict dict}
+    (runs inside a worker process). Items the numbers cannot decide come back with
+    method 'symbolic' and verdict None.
+    """
+    x = sample_grid(x_min, x_max, num_points)
+    with np.errstate(all='ignore'):
+        reference_values = expression_engine.compile_expression(reference, reference_variable)(x)
+    verdicts = {}
+    for text, variable in items:
+        verdict = {'verdict': INVALID, 'method': 'numeric', 'max_error': None, 'error': None}
+        verdicts[(text, variable)] = verdict
+        if '=' in text:
+            verdict['error'] = "an equation, not a function"
+            continue
+        try:
+            with np.errstate(all='ignore'):
+                values = np.asarray(expression_engine.compile_expression(text, variable)(x))
+            if values.dtype == object:
+                # Symbols other than the variable survive evaluation as sympy objects
+                raise ValueError(f"not a function of {variable} alone")
+        except Exception as e:
+            verdict['error'] = str(e)
+            continue
+        outcome, max_error = compare_samples(reference_values, values)
+        verdict['max_error'] = None if np.isnan(max_error) else max_error
+        if outcome is None:
+            verdict['method'] = 'symbolic'
+        verdict['verdict'] = outcome
+    return verdicts
+
+
+def grade_unique(reference, texts_by_key, x_min, x_max, variable='x', num_points=GRID_POINTS, workers=None):
+    """
+    Verdicts per (expression hash, graph variable) for {key: representative text}, memoized
+    and spread over a process pool; variable is the reference's
+    """
+    reference_hash = expression_engine.expression_hash(reference)
+    memo_keys = {key: (reference_hash, *key, variable, x_min, x_max, num_points) for key in texts_by_key}
+    with _memo_lock:
+        verdicts = {key: _memo[memo_key] for key, memo_key in memo_keys.items() if memo_key in _memo}
+    todo = [key for key in texts_by_key if key not in verdicts]
+    if not todo:
+        return verdicts
+
+    items = [(texts_by_key[key], key[1]) for key in todo]
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(items) < POOL_MIN_EXPRESSIONS:
+        graded = grade_expressions(reference, items, x_min, x_max, variable, num_points)
+    else:
+        graded = {}
+        # A few chunks per worker keeps them busy when some expressions are slow to compile
+        size = max(1, -(-len(items) // (workers * 4)))
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(grade_expressions, reference, items[i:i + size], x_min, x_max, variable, num_points)
+                       for i in range(0, len(items), size)]
+            for future in futures:
+                graded.update(future.result())
+
+    undecided = {item: (reference, item[0], item[1], variable)
+                 for item in items if graded[item]['method'] == 'symbolic'}
+    for item, (equal, error) in check_symbolic(undecided, workers).items():
+        if error is not None:
+            graded[item].update(verdict=INVALID, error=error)
+        else:
+            graded[item]['verdict'] = CORRECT if equal else INCORRECT
+
+    with _memo_lock:
+        for key, item in zip(todo, items):
+            verdicts[key] = _memo[memo_keys[key]] = graded[item]
+    return verdicts
+
+
+def select_graphs(graphs, name=None, latest=False):
+    """Graphs whose name contains name (any case); with latest, only each student's newest one"""
+    if name:
+        graphs = [graph for graph in graphs if name.lower() in (graph['name'] or '').lower()]
+    if latest:
+        newest = {}
+        for graph in graphs:
+            if graph['username'] not in newest or graph['id'] > newest[graph['username']]['id']:
+                newest[graph['username']] = graph
+        graphs = sorted(newest.values(), key=lambda graph: graph['id'])
+    return graphs
+
+
+def grade_graphs(db, reference, x_min=-10.0, x_max=10.0, variable='x', student_username=None, name=None,
+                 latest=False, workers=None, num_points=GRID_POINTS):
+    """Grade saved graphs against reference; returns one result dict per graph in id order"""
+    if not x_min < x_max:
+        raise ValueError("x_min must be less than x_max")
+    try:
+        with np.errstate(all='ignore'):
+            expression_engine.compile_expression(reference, variable)(sample_grid(x_min, x_max, 2))
+    except Exception as e:
+        raise ValueError(f"Invalid reference expression {reference}: {e}")
+    graphs = select_graphs(list(db.iter_graphs(student_username=student_username)), name, latest)
+    texts_by_key = {}
+    for graph in graphs:
+        digest = graph['expression_hash'] or expression_engine.expression_hash(graph['expression'])
+        # Each graph is evaluated in the variable it was saved with
+        graph['grading_key'] = (digest, graph['variable'] or 'x')
+        texts_by_key.setdefault(graph['grading_key'], graph['expression'])
+    verdicts = grade_unique(reference, texts_by_key, x_min, x_max, variable, num_points, workers)
+    return [{
+        'graph_id': graph['id'],
+        'username': graph['username'],
+        'name': graph['name'],
+        'expression': graph['expression'],
+        'variable': graph['grading_key'][1],
+        **verdicts[graph['grading_key']]
+    } for graph in graphs]
+
+
+def comment_text(result, reference, x_min, x_max):
+    """The feedback comment posted for a graded graph"""
+    where = f"on [{x_min:g}, {x_max:g}]"
+    if result['verdict'] == CORRECT:
+        return f"Auto-grade: correct - matches {reference} {where}."
+    if result['verdict'] == INCORRECT:
+        if result['max_error'] is not None and result['method'] == 'numeric':
+            return f"Auto-grade: incorrect - differs from {reference} by up to {result['max_error']:.3g} {where}."
+        return f"Auto-grade: incorrect - not equivalent to {reference} {where}."
+    return f"Auto-grade: could not grade {result['expression']} ({result['error']})."
+
+
+def post_comments(db, results, teacher_id, reference, x_min, x_max):
+    """Add one verdict comment per graded graph in a single transaction; returns how many were added"""
+    comments = [(result['graph_id'], teacher_id, comment_text(result, reference, x_min, x_max))
+                for result in results]
+    db.add_comments(comments)
+    return len(comments)
+
+
+def summarize(results):
+    counts = {CORRECT: 0, INCORRECT: 0, INVALID: 0}
+    for result in results:
+        counts[result['verdict']] += 1
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Grade saved graphs against a reference expression")
+    parser.add_argument('--db', default='calculator.db', help="SQLite database file")
+    parser.add_argument('--reference', required=True, help="Expected expression, e.g. \"x^2 - 4\"")
+    parser.add_argument('--x-min', type=float, default=-10.0)
+    parser.add_argument('--x-max', type=float, default=10.0)
+    parser.add_argument('--variable', default='x',
+                        help="Variable of the reference; each graph is evaluated in its own")
+    parser.add_argument('--student', help="Only grade this student's graphs")
+    parser.add_argument('--name', help="Only grade graphs whose name contains this text")
+    parser.add_argument('--latest', action='store_true', help="Only grade each student's newest matching graph")
+    parser.add_argument('--workers', type=int, default=None, help="Grading processes (default: CPU count)")
+    parser.add_argument('--teacher', help="Teacher username the comments are posted as")
+    parser.add_argument('--comment', action='store_true', help="Post each verdict as a comment on its graph")
+    parser.add_argument('--json', help="Also write the per-graph results to this file")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+
+    db = AdvancedDatabase(args.db)
+    try:
+        teacher_id = None
+        if args.comment:
+            teacher_id = db.get_user_id(args.teacher) if args.teacher else None
+            if teacher_id is None:
+                logging.error("--comment needs --teacher with an existing username")
+                return 1
+        start = time.perf_counter()
+        results = grade_graphs(db, args.reference, args.x_min, args.x_max, args.variable, args.student,
+                               args.name, args.latest, args.workers)
+        elapsed = time.perf_counter() - start
+        for result in results:
+            if result['verdict'] != CORRECT:
+                logging.info(f"{result['username']:<20} {result['verdict']:<10} {result['name']}: {result['expression']}")
+        counts = summarize(results)
+        logging.info(f"Graded {len(results)} graphs in {elapsed:.1f} s: {counts[CORRECT]} correct, "
+                     f"{counts[INCORRECT]} incorrect, {counts[INVALID]} could not be graded")
+        if args.comment and results:
+            posted = post_comments(db, results, teacher_id, args.reference, args.x_min, args.x_max)
+            logging.info(f"Posted {posted} comments")
+        if args.json:
+            with open(args.json, 'w') as f:
+                json.dump(results, f, indent=2)
+    except ValueError as e:
+        logging.error(str(e))
+        return 1
+    finally:
+        db.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
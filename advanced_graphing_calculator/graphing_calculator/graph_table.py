@@ -0,0 +1,185 @@
+# graph_table.py
+import sys
+from datetime import datetime, timezone
+
+import numpy as np
+
+# One fixed-size record per graph; text columns hold indices into a StringPool
+GRAPH_DTYPE = np.dtype([
+    ('id', np.int64),
+    ('x_min', np.float64),
+    ('x_max', np.float64),
+    ('y_min', np.float64),
+    ('y_max', np.float64),
+    ('created_at', np.int64),  # seconds since the epoch, UTC
+    ('name', np.int32),
+    ('expression', np.int32),
+    ('variable', np.int32),
+    ('scale_type', np.int32),
+    ('username', np.int32),
+])
+
+STRING_FIELDS = ('name', 'expression', 'variable', 'scale_type', 'username')
+
+# Column order of the database rows GraphTable.extend accepts
+ROW_FIELDS = ('id', 'name', 'expression', 'variable', 'x_min', 'x_max', 'y_min', 'y_max',
+              'scale_type', 'created_at', 'username')
+
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'  # how SQLite's CURRENT_TIMESTAMP reads
+
+
+class StringPool:
+    """Stores each distinct string once; tables refer to them by index"""
+    def __init__(self):
+        self.strings = []
+        self.index = {}
+
+    def intern(self, text):
+        text = '' if text is None else str(text)
+        position = self.index.get(text)
+        if position is None:
+            position = self.index[text] = len(self.strings)
+            self.strings.append(sys.intern(text))
+        return position
+
+    def intern_many(self, texts):
+        """Indices for a whole column of strings; only unseen strings take the slow path"""
+        get = self.index.get
+        return [position if (position := get(text)) is not None else self.intern(text) for text in texts]
+
+    def __len__(self):
+        return len(self.strings)
+
+
+class GraphTable:
+    """
+    Columnar list of saved graphs: a NumPy structured array plus a shared string pool.
+    Filtering, sorting and searching work on whole columns (searching tests each
+    distinct string once), and dicts are only built for rows that are asked for.
+    """
+    def __init__(self, rows=None, pool=None):
+        self.rows = rows if rows is not None else np.empty(0, dtype=GRAPH_DTYPE)
+        self.pool = pool if pool is not None else StringPool()
+        # extend() appends into spare capacity; rows is a view of the filled part
+        self._buffer = self.rows
+
+    @classmethod
+    def from_rows(cls, records):
+        table = cls()
+        table.extend(records)
+        return table
+
+    def freeze(self):
+        """Make the table read-only, so one instance can be shared (the query cache does)"""
+        self.rows.flags.writeable = False
+
+    def extend(self, records):
+        """Append database rows given in ROW_FIELDS order"""
+        if not self.rows.flags.writeable:
+            raise TypeError("GraphTable is read-only")
+        columns = list(zip(*records))
+        if not columns:
+            return
+        size = len(self.rows)
+        count = len(columns[0])
+        if size + count > len(self._buffer):
+            # Grow geometrically so loading n rows in batches copies O(n) bytes in total
+            buffer = np.empty(max(size + count, 2 * len(self._buffer), 1024), dtype=GRAPH_DTYPE)
+            buffer[:size] = self.rows
+            self._buffer = buffer
+        block = self._buffer[size:size + count]
+        for field, values in zip(ROW_FIELDS, columns):
+            if field in STRING_FIELDS:
+                block[field] = self.pool.intern_many(values)
+            elif field == 'created_at':
+                block[field] = [value or 0 for value in values]
+            else:
+                # NULL bounds become NaN
+                block[field] = np.array(values, dtype=block.dtype[field])
+        self.rows = self._buffer[:size + count]
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __getitem__(self, position):
+        return self.row(position)
+
+    def __iter__(self):
+        return (self.row(position) for position in range(len(self.rows)))
+
+    def __deepcopy__(self, memo):
+        # The pool only ever grows, so existing indices stay valid when copies share it
+        return GraphTable(self.rows.copy(), self.pool)
+
+    def __sizeof__(self):
+        return (object.__sizeof__(self) + self.rows.nbytes +
+                sum(sys.getsizeof(text) for text in self.pool.strings))
+
+    def row(self, position):
+        """One graph as the dict the database's list methods return"""
+        record = self.rows[position]
+        strings = self.pool.strings
+        graph = {field: strings[record[field]] for field in STRING_FIELDS}
+        graph['id'] = int(record['id'])
+        for field in ('x_min', 'x_max', 'y_min', 'y_max'):
+            value = float(record[field])
+            graph[field] = None if np.isnan(value) else value
+        graph['created_at'] = datetime.fromtimestamp(
+            int(record['created_at']), timezone.utc).strftime(TIMESTAMP_FORMAT)
+        return graph
+
+    def to_dicts(self):
+        return [self.row(position) for position in range(len(self.rows))]
+
+    def column(self, field):
+        """Values of one column; text columns come back as an object array of strings"""
+        if field in STRING_FIELDS:
+            return np.array(self.pool.strings, dtype=object)[self.rows[field]]
+        return self.rows[field]
+
+    def ids(self):
+        return self.rows['id']
+
+    def index_of(self, graph_id):
+        """Position of the graph with this id, or None"""
+        positions = np.flatnonzero(self.rows['id'] == graph_id)
+        return int(positions[0]) if len(positions) else None
+
+    def take(self, positions):
+        """Sub-table of the given positions (or boolean mask), sharing the string pool"""
+        return GraphTable(self.rows[positions], self.pool)
+
+    def where(self, **equals):
+        """Rows whose columns equal the given values, e.g. where(username='alice', scale_type='log')"""
+        mask = np.ones(len(self.rows), dtype=bool)
+        for field, value in equals.items():
+            if field in STRING_FIELDS:
+                position = self.pool.index.get(value)
+                if position is None:
+                    return self.take(np.zeros(len(self.rows), dtype=bool))
+                mask &= self.rows[field] == position
+            else:
+                mask &= self.rows[field] == value
+        return self.take(mask)
+
+    def search(self, text, fields=('name', 'expression')):
+        """Rows where any of fields contains text, ignoring case"""
+        needle = text.lower()
+        # One substring test per distinct string, then a lookup per row
+        matches = np.fromiter((needle in value.lower() for value in self.pool.strings),
+                              dtype=bool, count=len(self.pool))
+        mask = np.zeros(len(self.rows), dtype=bool)
+        for field in fields:
+            mask |= matches[self.rows[field]]
+        return self.take(mask)
+
+    def sort(self, field, descending=False):
+        """Rows ordered by one column; text columns sort alphabetically"""
+        if field in STRING_FIELDS:
+            ranks = np.empty(len(self.pool), dtype=np.int64)
+            ranks[sorted(range(len(self.pool)), key=self.pool.strings.__getitem__)] = np.arange(len(self.pool))
+            keys = ranks[self.rows[field]]
+        else:
+            keys = self.rows[field]
+        # Negating keeps ties in their current order, unlike reversing an ascending sort
+        return self.take(np.argsort(-keys if descending else keys, kind='stable'))
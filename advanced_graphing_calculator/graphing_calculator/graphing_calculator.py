@@ -5,10 +5,20 @@ import json
 import os
 import math
 import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 
+import expression_engine
+import metrics
+
+PLOT_STAGE_SECONDS = metrics.REGISTRY.histogram(
+    'calculator_plot_stage_seconds', 'Time spent per plotting stage', ('stage',))
+
 
 class Graph:
+    __slots__ = ('expression', 'variable', 'start', 'end', 'scale_type', 'comments',
+                 'millisecond_mode', 'timestamp')
+
     def __init__(self, expression: str, variable: str, start: float, end: float,
                  scale_type: str, comments: List[str] = None, millisecond_mode: bool = False,
                  timestamp: Optional[float] = None):
@@ -51,6 +61,10 @@ class GraphingCalculator:
     def __init__(self):
         self.graphs: Dict[str, Graph] = {}
         self.current_user = None
+        self.precision = 'float64'  # or 'float32' to halve sample memory
+        self.max_workers = os.cpu_count() or 1
+        self.backend = 'auto'  # 'numpy', or 'jit' to use Numba kernels for large grids when installed
+        self._executor = None
 
     def set_user(self, user):
         """Set the current user and load their graphs"""
@@ -116,6 +130,128 @@ class GraphingCalculator:
         except Exception as e:
             raise ValueError(f"Error evaluating expression: {e}")
 
+    def compile_expression(self, expression: str, variable: str = 'x'):
+        """Return the cached compiled form of an expression"""
+        return expression_engine.compile_expression(expression, variable)
+
+    def sample_expression(self, expression: str, x, variable: str = 'x'):
+        """Evaluate an expression over the whole sample grid in one vectorized call"""
+        compiled = self.compile_expression(expression, variable)
+        try:
+            return compiled(x)
+        except Exception as e:
+            raise ValueError(f"Error evaluating expression: {e}")
+
+    def evaluate_overlays(self, expression: str, x, y, overlays, variable: str = 'x'):
+        """Derivative and integral overlays for a curve already sampled on x"""
+        compiled = self.compile_expression(expression, variable)
+        return expression_engine.evaluate_overlays(compiled, x, y, overlays)
+
+    def get_executor(self):
+        """Thread pool shared by parallel grid evaluations, created on first use"""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                thread_name_prefix='evaluate')
+        return self._executor
+
+    def evaluate_grid(self, expressions, x_min: float, x_max: float, scale_type: str = 'linear',
+                      num_points: int = 1000, variable: str = 'x'):
+        """
+        Sample one or more expressions on a grid with bounded temporary memory.
+        Large grids are split across up to max_workers threads; small ones stay on this thread.
+        Returns (x, [y for each expression]) in the calculator's precision.
+        """
+        if scale_type == 'log':
+            x_min = max(1e-10, x_min)
+        with PLOT_STAGE_SECONDS.time(stage='compile'):
+            if len(expressions) == 1:
+                compiled = self.compile_expression(expressions[0], variable)
+            else:
+                compiled = expression_engine.compile_group(expressions, variable)
+        workers = expression_engine.plan_workers(num_points, self.max_workers)
+        executor = self.get_executor() if workers > 1 else None
+        backend = self.backend
+        if backend == 'auto':
+            backend = 'jit' if num_points >= expression_engine.JIT_MIN_POINTS else 'numpy'
+        try:
+            with PLOT_STAGE_SECONDS.time(stage='evaluate'):
+                return expression_engine.evaluate_grid(
+                    compiled, x_min, x_max, num_points, log_scale=scale_type == 'log',
+                    dtype=expression_engine.PRECISIONS[self.precision],
+                    executor=executor, workers=workers, backend=backend)
+        except Exception as e:
+            raise ValueError(f"Error evaluating expression: {e}")
+
+    def compute_plot(self, expression: str, second_expr: str, x_min: float, x_max: float,
+                     scale_type: str, variable: str = 'x', overlays=(), solve_equations: bool = True,
+                     num_points: int = 1000):
+        """
+        Sample everything a plot shows without touching the GUI.
+        Returns a dict with the grid, the curves as (role, label, values) tuples,
+        overlays, and equation solutions / intersections when solve_equations is set.
+        """
+        if scale_type == 'log':
+            x_min = max(1e-10, x_min)
+        result = {
+            'expression': expression,
+            'second_expr': second_expr,
+            'variable': variable,
+            'x_min': x_min,
+            'x_max': x_max,
+            'log_scale': scale_type == 'log',
+            'curves': [],
+            'overlays': {},
+            'solutions': [],
+            'intersections': [],
+            'intersection_error': None,
+            'solved': solve_equations
+        }
+
+        if "=" in expression:
+            # Equation mode: draw both sides and mark where they meet
+            left_side, right_side = expression.split("=", 1)
+            result['mode'] = 'equation'
+            x, (left, right) = self.evaluate_grid([left_side, right_side], x_min, x_max, scale_type,
+                                                  num_points, variable)
+            result['x'] = x
+            result['curves'] = [('left', left_side.strip(), left), ('right', right_side.strip(), right)]
+            if solve_equations:
+                with PLOT_STAGE_SECONDS.time(stage='solve'):
+                    result['solutions'] = expression_engine.solve_real(left_side, right_side, variable, x_min, x_max)
+            return result
+
+        result['mode'] = 'function'
+        if second_expr:
+            x, (y, y2) = self.evaluate_grid([expression, second_expr], x_min, x_max, scale_type, num_points)
+        else:
+            x, (y,) = self.evaluate_grid([expression], x_min, x_max, scale_type, num_points)
+        if np.iscomplexobj(y):
+            result['curves'] = [('real', f"Re({expression})", y.real), ('imag', f"Im({expression})", y.imag)]
+        else:
+            # Only keep the points where the main curve is defined
+            mask = np.isfinite(y)
+            x, y = x[mask], y[mask]
+            if second_expr:
+                y2 = y2[mask]
+            result['curves'] = [('main', expression, y)]
+            if overlays:
+                with PLOT_STAGE_SECONDS.time(stage='overlays'):
+                    result['overlays'] = self.evaluate_overlays(expression, x, y, overlays)
+        result['x'] = x
+
+        if second_expr:
+            result['curves'].append(('second', second_expr, y2))
+            if solve_equations:
+                try:
+                    first = self.compile_expression(expression, variable)
+                    with PLOT_STAGE_SECONDS.time(stage='solve'):
+                        solutions = expression_engine.solve_real(expression, second_expr, variable, x_min, x_max)
+                    for sol_val in solutions:
+                        result['intersections'].append((sol_val, float(np.real(first(np.array([sol_val]))[0]))))
+                except Exception as e:
+                    result['intersection_error'] = str(e)
+        return result
+
     def clear_graphs(self):
         """Clear all graphs"""
         self.graphs = {}
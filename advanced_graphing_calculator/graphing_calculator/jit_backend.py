@@ -0,0 +1,144 @@
+# jit_backend.py
+"""
+Optional Numba backend for compiled expressions.
+
+The NumPy source lambdify generates for an expression is rewritten into a
+scalar kernel plus a single loop over the grid, so every sample goes through
+the whole expression once with no temporaries. The generated module is written
+to expression_engine.JIT_CACHE_DIR and compiled with cache=True, so later sessions load the
+machine code from disk. Anything that fails (Numba missing, an unsupported
+function, results that disagree with NumPy) returns None and callers keep
+using the NumPy evaluator.
+"""
+import hashlib
+import importlib.util
+import logging
+import os
+import sys
+import threading
+
+import numpy as np
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+BACKEND_VERSION = 1
+
+# Kernels must reproduce the NumPy path to this tolerance on the probe grid
+RTOL = 1e-9
+ATOL = 1e-12
+
+# The namespace lambdify resolves names in: numpy first, then the extra names from
+# expression_engine.MATH_FUNCS in a form Numba can compile. Functions missing here
+# (scipy.special) stay undefined, so such expressions fall back to NumPy.
+PRELUDE = '''\
+from numpy import *
+from numba import njit
+
+ln = log
+asin = arcsin
+acos = arccos
+atan = arctan
+golden = (1 + sqrt(5)) / 2
+
+
+@njit(cache=True, error_model='numpy')
+def sec(v):
+    return 1 / cos(v)
+
+
+@njit(cache=True, error_model='numpy')
+def csc(v):
+    return 1 / sin(v)
+
+
+@njit(cache=True, error_model='numpy')
+def cot(v):
+    return 1 / tan(v)
+'''
+
+LOOP = '''
+
+@njit(cache=True, nogil=True, error_model='numpy')
+def evaluate(x, out):
+    for i in range(x.shape[0]):
+        out[i] = kernel(x[i])
+'''
+
+_lock = threading.Lock()
+
+
+def available():
+    """True when Numba is importable"""
+    return numba is not None
+
+
+def generate_source(text, lambdified_source):
+    """Turn lambdify's `def _lambdifygenerated(x): ...` into a module with a jitted loop"""
+    lines = lambdified_source.strip().splitlines()
+    header, body = lines[0], lines[1:]
+    if not header.startswith('def ') or '(' not in header:
+        raise ValueError("Unexpected lambdify source")
+    kernel = "def kernel" + header[header.index('('):]
+    return (f"# Generated by jit_backend.py from: {text!r}\n" + PRELUDE + "\n\n" +
+            "@njit(cache=True, error_model='numpy')\n" + kernel + "\n" + "\n".join(body) + "\n" + LOOP)
+
+
+def _load_module(source, cache_dir):
+    digest = hashlib.sha1(f"{BACKEND_VERSION}\n{source}".encode('utf-8')).hexdigest()
+    name = f"jit_{digest}"
+    path = os.path.join(cache_dir, name + ".py")
+    with _lock:
+        # Rewriting an existing file would invalidate Numba's on-disk cache for it
+        if not os.path.exists(path):
+            os.makedirs(cache_dir, exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.part"
+            with open(tmp_path, 'w') as f:
+                f.write(source)
+            os.replace(tmp_path, path)
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    # Numba's disk cache resolves functions through sys.modules
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def probe_points():
+    """Sample points for the agreement check: a dense sweep plus awkward values"""
+    sweep = np.linspace(-10.0, 10.0, 401)
+    special_points = np.array([0.0, -0.0, 1.0, -1.0, 0.5, 1e-8, 1e6, -1e6, np.pi / 2])
+    return np.concatenate([sweep, special_points])
+
+
+def agrees(evaluate, reference, x=None):
+    """Compare a jitted evaluate(x, out) with the NumPy function on the probe points"""
+    x = probe_points() if x is None else x
+    with np.errstate(all='ignore'):
+        expected = np.broadcast_to(reference(x), x.shape)
+        if np.iscomplexobj(expected):
+            return False
+        actual = np.empty_like(x)
+        evaluate(x, actual)
+    return bool(np.allclose(actual, expected, rtol=RTOL, atol=ATOL, equal_nan=True))
+
+
+def compile_kernel(text, lambdified_source, reference, cache_dir):
+    """
+    Return a jitted evaluate(x, out) equivalent to reference, or None when the
+    backend is unavailable or cannot reproduce the NumPy results.
+    """
+    if numba is None:
+        return None
+    try:
+        module = _load_module(generate_source(text, lambdified_source), cache_dir)
+        evaluate = module.evaluate
+        if not agrees(evaluate, reference):
+            logging.info(f"JIT kernel for {text!r} disagrees with NumPy; using NumPy")
+            return None
+        return evaluate
+    except Exception as e:
+        logging.debug(f"JIT backend unavailable for {text!r}: {str(e)}")
+        return None
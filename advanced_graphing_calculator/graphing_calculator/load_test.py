@@ -0,0 +1,293 @@
+# load_test.py
+"""
+Classroom load test for the storage layer.
+
+Simulates N students and M teachers working against one SQLite file, the way a
+lab shares calculator.db. Users are spread over worker processes (each with its
+own AdvancedDatabase, like separate lab machines) and run as threads inside
+them. Each user draws operations from a weighted mix with exponential think time
+between them. The report gives throughput, p50/p95/p99 latency per operation and
+the rate of "database is locked" errors.
+
+    python load_test.py --students 30 --teachers 3 --duration 20
+    python load_test.py --processes 1 --json baseline.json
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from database import AdvancedDatabase
+
+# Operation -> relative weight for each role
+STUDENT_MIX = {
+    'save_graph_state': 3,
+    'get_user_graphs': 3,
+    'get_user_graph_history': 3,
+    'get_graph_comments': 1,
+}
+TEACHER_MIX = {
+    'add_comment': 4,
+    'get_graph_comments': 3,
+    'get_user_graphs': 3,
+}
+
+EXPRESSIONS = ('sin(x)', 'x^2 - 3*x + 2', 'exp(-x^2)', 'cos(x)*x', 'log(x)', 'tan(x)', 'sqrt(x)', '1/x')
+
+
+def is_lock_error(error):
+    return isinstance(error, sqlite3.OperationalError) and (
+        'locked' in str(error) or 'busy' in str(error))
+
+
+def random_graph(rng, index):
+    x_min = rng.choice((-10, -5, -1, 0))
+    return {
+        'name': f'graph {index}',
+        'expression': rng.choice(EXPRESSIONS),
+        'variable': 'x',
+        'x_min': x_min,
+        'x_max': x_min + rng.choice((2, 10, 20)),
+        'y_min': -10,
+        'y_max': 10,
+        'scale_type': 'linear',
+    }
+
+
+def create_database(path, students, teachers, graphs_per_student, seed=0):
+    """Add load_student<i> / load_teacher<j> accounts and graphs for each student; returns user ids by role"""
+    rng = random.Random(seed)
+    db = AdvancedDatabase(path)
+    users = {'student': [], 'teacher': []}
+    for role, count in (('student', students), ('teacher', teachers)):
+        for i in range(count):
+            # Prefixed so they cannot clash with the default teacher1 account
+            username = f'load_{role}{i}'
+            db.add_user(username, 'pw', role, f'Load {role.title()} {i}', f'{username}@example.com')
+            users[role].append(db.verify_user(username, 'pw')['id'])
+    for user_id in users['student']:
+        for k in range(graphs_per_student):
+            db.save_graph_state(user_id, random_graph(rng, k))
+    db.close()
+    return users
+
+
+class UserSession:
+    """One simulated user: picks operations from its role's mix and records their latencies"""
+    def __init__(self, db, role, user_id, student_ids, rng, think_time):
+        self.db = db
+        self.role = role
+        self.user_id = user_id
+        self.student_ids = student_ids
+        self.rng = rng
+        self.think_time = think_time
+        mix = STUDENT_MIX if role == 'student' else TEACHER_MIX
+        self.operations = list(mix)
+        self.weights = list(mix.values())
+        self.graph_ids = []
+        self.saved = 0
+
+    def known_graph(self):
+        """A graph id this user has seen, or None before any listing"""
+        return self.rng.choice(self.graph_ids) if self.graph_ids else None
+
+    def perform(self, operation):
+        db = self.db
+        if operation == 'save_graph_state':
+            self.saved += 1
+            self.graph_ids.append(db.save_graph_state(self.user_id, random_graph(self.rng, self.saved)))
+        elif operation == 'get_user_graphs':
+            owner = self.user_id if self.role == 'student' else self.rng.choice(self.student_ids)
+            graphs = db.get_user_graphs(owner)
+            self.graph_ids = [g['id'] for g in graphs[:50]] or self.graph_ids
+        elif operation == 'get_user_graph_history':
+            db.get_user_graph_history(self.user_id)
+        elif operation == 'get_graph_comments':
+            graph_id = self.known_graph()
+            if graph_id is not None:
+                db.get_graph_comments(graph_id)
+        elif operation == 'add_comment':
+            graph_id = self.known_graph()
+            if graph_id is None:
+                return self.perform('get_user_graphs')
+            db.add_comment(graph_id, self.user_id, f'Comment {self.rng.random():.6f}')
+        return operation
+
+    def run(self, deadline, results):
+        while time.time() < deadline:
+            operation = self.rng.choices(self.operations, self.weights)[0]
+            start = time.perf_counter()
+            try:
+                operation = self.perform(operation)
+                outcome = 'ok'
+            except Exception as e:
+                outcome = 'locked' if is_lock_error(e) else 'error'
+                if outcome == 'error':
+                    logging.debug(f"{operation} failed: {str(e)}")
+            elapsed = time.perf_counter() - start
+            results.record(operation, outcome, elapsed)
+            if self.think_time:
+                time.sleep(self.rng.expovariate(1.0 / self.think_time))
+
+
+class Results:
+    """Latencies of successful calls and error counts per operation"""
+    def __init__(self):
+        self.latencies = {}
+        self.locked = {}
+        self.errors = {}
+        self.lock = threading.Lock()
+
+    def record(self, operation, outcome, elapsed):
+        with self.lock:
+            if outcome == 'ok':
+                self.latencies.setdefault(operation, []).append(elapsed)
+            else:
+                counts = self.locked if outcome == 'locked' else self.errors
+                counts[operation] = counts.get(operation, 0) + 1
+
+    def merge(self, other):
+        for operation, values in other['latencies'].items():
+            self.latencies.setdefault(operation, []).extend(values)
+        for name in ('locked', 'errors'):
+            counts = getattr(self, name)
+            for operation, count in other[name].items():
+                counts[operation] = counts.get(operation, 0) + count
+
+    def as_dict(self):
+        return {'latencies': self.latencies, 'locked': self.locked, 'errors': self.errors}
+
+
+def run_worker(db_file, sessions, student_ids, start_at, duration, think_time, cache, seed):
+    """Run the given (role, user_id) sessions as threads in this process"""
+    db = AdvancedDatabase(db_file, cache_entries=256 if cache else 0)
+    results = Results()
+    threads = []
+    for k, (role, user_id) in enumerate(sessions):
+        session = UserSession(db, role, user_id, student_ids, random.Random(seed * 1000 + k), think_time)
+        threads.append(threading.Thread(target=session.run, args=(start_at + duration, results)))
+    time.sleep(max(0.0, start_at - time.time()))
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    db.close()
+    return results.as_dict()
+
+
+def summarize(results, duration):
+    """Per-operation and total counts, throughput, latency percentiles (ms) and error rates"""
+    rows = {}
+    operations = sorted(set(results.latencies) | set(results.locked) | set(results.errors))
+    totals = {'ok': 0, 'locked': 0, 'errors': 0}
+    all_latencies = []
+    for operation in operations:
+        latencies = np.array(results.latencies.get(operation, []), dtype=float) * 1000
+        locked = results.locked.get(operation, 0)
+        errors = results.errors.get(operation, 0)
+        attempts = len(latencies) + locked + errors
+        rows[operation] = describe(latencies, attempts, locked, errors, duration)
+        totals['ok'] += len(latencies)
+        totals['locked'] += locked
+        totals['errors'] += errors
+        all_latencies.append(latencies)
+    merged = np.concatenate(all_latencies) if all_latencies else np.empty(0)
+    rows['total'] = describe(merged, sum(totals.values()), totals['locked'], totals['errors'], duration)
+    return rows
+
+
+def describe(latencies, attempts, locked, errors, duration):
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) if len(latencies) else (float('nan'),) * 3
+    return {
+        'calls': int(attempts),
+        'ok': int(len(latencies)),
+        'throughput': len(latencies) / duration,
+        'p50_ms': float(p50),
+        'p95_ms': float(p95),
+        'p99_ms': float(p99),
+        'max_ms': float(latencies.max()) if len(latencies) else float('nan'),
+        'locked': int(locked),
+        'lock_rate': locked / attempts if attempts else 0.0,
+        'errors': int(errors),
+    }
+
+
+def format_report(summary):
+    lines = [f"{'operation':<24} {'calls':>7} {'ops/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+             f"{'max ms':>8} {'locked':>7} {'lock %':>7} {'errors':>7}"]
+    for operation, row in summary.items():
+        lines.append(f"{operation:<24} {row['calls']:>7} {row['throughput']:>8.1f} {row['p50_ms']:>8.2f} "
+                     f"{row['p95_ms']:>8.2f} {row['p99_ms']:>8.2f} {row['max_ms']:>8.1f} {row['locked']:>7} "
+                     f"{row['lock_rate'] * 100:>6.2f}% {row['errors']:>7}")
+    return '\n'.join(lines)
+
+
+def run_load_test(students=30, teachers=3, duration=10.0, processes=4, think_time=0.05,
+                  graphs_per_student=20, db_file=None, cache=True, seed=0):
+    """Run the simulation and return its summary; a temporary database is used unless db_file is given"""
+    temp_dir = None
+    if db_file is None:
+        temp_dir = tempfile.mkdtemp(prefix='calculator-load-')
+        db_file = os.path.join(temp_dir, 'calculator.db')
+    try:
+        users = create_database(db_file, students, teachers, graphs_per_student, seed)
+        sessions = ([('student', user_id) for user_id in users['student']] +
+                    [('teacher', user_id) for user_id in users['teacher']])
+        processes = max(1, min(processes, len(sessions)))
+        shares = [sessions[k::processes] for k in range(processes)]
+        results = Results()
+        # Give every process time to start so the users begin together
+        start_at = time.time() + 1.0 + 0.1 * processes
+        if processes == 1:
+            results.merge(run_worker(db_file, shares[0], users['student'], start_at, duration,
+                                     think_time, cache, seed))
+        else:
+            with ProcessPoolExecutor(max_workers=processes) as executor:
+                futures = [executor.submit(run_worker, db_file, share, users['student'], start_at, duration,
+                                           think_time, cache, seed + k)
+                           for k, share in enumerate(shares)]
+                for future in futures:
+                    results.merge(future.result())
+        return summarize(results, duration)
+    finally:
+        if temp_dir is not None:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate a classroom of users against the database")
+    parser.add_argument('--students', type=int, default=30)
+    parser.add_argument('--teachers', type=int, default=3)
+    parser.add_argument('--duration', type=float, default=10.0, help="Seconds of load")
+    parser.add_argument('--processes', type=int, default=4, help="Worker processes; users run as threads in them")
+    parser.add_argument('--think-ms', type=float, default=50.0, help="Mean pause between a user's operations")
+    parser.add_argument('--graphs', type=int, default=20, help="Graphs per student before the run")
+    parser.add_argument('--db', help="Database file to use instead of a temporary one (it is modified)")
+    parser.add_argument('--no-cache', action='store_true', help="Disable the read-query cache")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', help="Also write the summary to this file")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING, format='%(message)s')
+
+    summary = run_load_test(args.students, args.teachers, args.duration, args.processes,
+                            args.think_ms / 1000.0, args.graphs, args.db, not args.no_cache, args.seed)
+    print(f"{args.students} students, {args.teachers} teachers, {args.processes} processes, {args.duration:g} s")
+    print(format_report(summary))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(summary, f, indent=2)
+    return 1 if summary['total']['errors'] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
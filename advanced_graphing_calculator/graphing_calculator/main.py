@@ -2,24 +2,278 @@ import sys
 import logging
 import numpy as np
 import time
+import weakref
 from datetime import datetime
-from PyQt6.QtGui import QPalette, QColor, QIcon
+from PyQt6.QtGui import QPalette, QColor, QIcon, QPixmap
 from PyQt6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout,
                              QHBoxLayout, QPushButton, QLineEdit, QLabel, QComboBox,
                              QDoubleSpinBox, QTextEdit, QMessageBox, QGridLayout,
                              QListWidget, QInputDialog, QFileDialog, QFrame, QListWidgetItem,
-                             QCheckBox, QStatusBar)
-from PyQt6.QtCore import Qt, QSize, QTimer
+                             QCheckBox, QStatusBar, QStyledItemDelegate, QStyleOptionViewItem,
+                             QAbstractItemView)
+from PyQt6.QtCore import Qt, QSize, QTimer, QRect, QObject, QRunnable, QThreadPool, pyqtSignal
 from scipy import special, optimize
-from sympy import sympify, lambdify, symbols, solve
-from sympy.parsing.sympy_parser import parse_expr, standard_transformations, implicit_multiplication_application, convert_xor
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
 from matplotlib.figure import Figure
+from matplotlib.collections import LineCollection
 import matplotlib.pyplot as plt
 
-from graphing_calculator import GraphingCalculator
+from graphing_calculator import GraphingCalculator, PLOT_STAGE_SECONDS
+import expression_engine
+import metrics
+import query_profiler
+import thumbnails
+import plot_samples
 from auth_system import User
-from database import AdvancedDatabase
+from async_database import AsyncDatabase
+from change_watcher import ChangeWatcher
+
+# Quiet period after the last keystroke before a live plot starts
+LIVE_PLOT_DELAY_MS = 25
+# Pause after the last keystroke in the search box before querying
+SEARCH_DELAY_MS = 250
+
+# label, normal colour, fire mode colour
+OVERLAY_STYLES = {
+    expression_engine.OVERLAY_DERIVATIVE: ("f′(x)", '#2ecc71', '#ffd700'),
+    expression_engine.OVERLAY_SECOND_DERIVATIVE: ("f″(x)", '#9b59b6', '#ff8c00'),
+    expression_engine.OVERLAY_INTEGRAL: ("∫f dx", '#f1c40f', '#ffff66'),
+}
+
+# Every widget style of the main window, set once on the window: Qt parses one sheet
+# per window instead of one per widget, and panels built later are styled by it too.
+# Widgets opt in by class (ModernButton, ModernLineEdit) or object name.
+MAIN_WINDOW_STYLE = """
+    ModernButton {
+        background: qlineargradient(x1:0, y1:0, x2:0, y2:1,
+                                   stop:0 #3498db, stop:1 #2980b9);
+        border: none;
+        color: white;
+        padding: 10px 18px;
+        border-radius: 8px;
+        font-size: 14px;
+        font-weight: bold;
+    }
+    ModernButton:hover {
+        background: qlineargradient(x1:0, y1:0, x2:0, y2:1,
+                                   stop:0 #5dade2, stop:1 #3498db);
+    }
+    ModernButton:pressed {
+        background: qlineargradient(x1:0, y1:0, x2:0, y2:1,
+                                   stop:0 #2980b9, stop:1 #21618c);
+    }
+    ModernButton[fireMode="true"] {
+        background: qlineargradient(x1:0, y1:0, x2:1, y2:1,
+                                   stop:0 #ff4500, stop:0.5 #ff6347, stop:1 #ff8c00);
+    }
+    ModernButton[fireMode="true"]:hover {
+        background: qlineargradient(x1:0, y1:0, x2:1, y2:1,
+                                   stop:0 #ff6347, stop:0.5 #ff7f50, stop:1 #ffa500);
+    }
+    ModernButton[fireMode="true"]:pressed {
+        background: qlineargradient(x1:0, y1:0, x2:1, y2:1,
+                                   stop:0 #ff2400, stop:0.5 #ff4500, stop:1 #ff6347);
+    }
+    ModernLineEdit {
+        background: qlineargradient(x1:0, y1:0, x2:0, y2:1,
+                                  stop:0 #34495e, stop:1 #2c3e50);
+        border: 2px solid #3d3d3d;
+        border-radius: 8px;
+        color: white;
+        padding: 10px;
+        font-size: 14px;
+    }
+    ModernLineEdit:focus {
+        border: 2px solid #3498db;
+        background: qlineargradient(x1:0, y1:0, x2:0, y2:1,
+                                  stop:0 #2c3e50, stop:1 #34495e);
+    }
+    ModernLineEdit:hover {
+        border: 2px solid #5dade2;
+    }
+    QWidget#sidebarDivider {
+        background-color: #2d2d2d;
+        border-right: 1px solid #333340;
+    }
+    QLabel#userInfo {
+        color: white;
+        font-size: 18px;
+        font-weight: bold;
+        padding: 10px;
+    }
+    QPushButton#logoutButton {
+        background-color: #ff5555;
+        border: none;
+        color: white;
+        padding: 3px 5px;
+        border-radius: 6px;
+        font-size: 16px;
+    }
+    QPushButton#logoutButton:hover {
+        background-color: #ff6e6e;
+    }
+    QPushButton#logoutButton:pressed {
+        background-color: #ff3333;
+    }
+    QLabel#groupLabel {
+        color: white;
+        font-size: 13px;
+        font-weight: bold;
+    }
+    QLabel#advancedLabel {
+        color: white;
+        font-size: 13px;
+        font-weight: bold;
+        margin-top: 10px;
+    }
+    QLabel#fieldLabel {
+        color: white;
+        font-weight: bold;
+        font-size: 12px;
+        margin-right: 5px;
+    }
+    QLabel#rangeLabel {
+        color: white;
+        font-weight: bold;
+        font-size: 12px;
+    }
+    QLabel#panelTitle {
+        color: white;
+        font-size: 16px;
+        font-weight: bold;
+        margin-bottom: 5px;
+    }
+    QLabel#commentTitle {
+        color: white;
+        font-size: 16px;
+        font-weight: bold;
+    }
+    QLabel#teacherTitle {
+        color: white;
+        font-size: 18px;
+        font-weight: bold;
+    }
+    QComboBox#optionSelector {
+        background-color: #2d2d2d;
+        color: white;
+        border: 2px solid #3d3d3d;
+        border-radius: 4px;
+        padding: 5px;
+        min-width: 80px;
+    }
+    QComboBox#optionSelector:hover {
+        border-color: #4d4d4d;
+        background-color: #353535;
+    }
+    QComboBox#optionSelector::drop-down {
+        border: none;
+        width: 20px;
+    }
+    QDoubleSpinBox {
+        background-color: #2d2d2d;
+        color: white;
+        border: 2px solid #3d3d3d;
+        border-radius: 4px;
+        padding: 2px;
+        min-width: 20px;
+    }
+    QDoubleSpinBox:hover {
+        border-color: #4d4d4d;
+        background-color: #353535;
+    }
+    QDoubleSpinBox::up-button, QDoubleSpinBox::down-button {
+        background-color: #3d3d3d;
+        border: none;
+        width: 16px;
+    }
+    QCheckBox {
+        color: white;
+        font-size: 12px;
+        font-weight: bold;
+        padding: 5px;
+    }
+    QCheckBox::indicator {
+        width: 18px;
+        height: 18px;
+        border-radius: 4px;
+        border: 2px solid #3d3d3d;
+        background-color: #2d2d2d;
+    }
+    QCheckBox::indicator:checked {
+        background: qlineargradient(x1:0, y1:0, x2:1, y2:1,
+                                   stop:0 #ff4500, stop:1 #ff8c00);
+        border: 2px solid #ff4500;
+    }
+    QCheckBox::indicator:hover {
+        border: 2px solid #5dade2;
+    }
+    QListWidget#graphList {
+        background-color: #2d2d2d;
+        border: 2px solid #3d3d3d;
+        border-radius: 6px;
+        color: white;
+        font-size: 12px;
+        padding: 5px;
+    }
+    QListWidget#graphList::item {
+        padding: 8px;
+        border-bottom: 1px solid #3d3d3d;
+        margin: 2px 0px;
+    }
+    QListWidget#graphList::item:selected {
+        background-color: #2a82da;
+        border-radius: 4px;
+    }
+    QListWidget#graphList::item:hover {
+        background-color: #353535;
+    }
+    QComboBox#studentSelector {
+        background-color: #2d2d2d;
+        border: 2px solid #3d3d3d;
+        border-radius: 6px;
+        color: white;
+        padding: 8px;
+        font-size: 14px;
+    }
+    QComboBox#studentSelector QLineEdit {
+        color: white;
+        padding: 5px;
+    }
+    QLineEdit#searchInput {
+        background-color: #2d2d2d;
+        border: 2px solid #3d3d3d;
+        border-radius: 6px;
+        color: white;
+        padding: 8px;
+        font-size: 14px;
+    }
+    QTextEdit#commentInput {
+        background-color: #2d2d2d;
+        border: 2px solid #3d3d3d;
+        border-radius: 6px;
+        color: white;
+        padding: 10px;
+        font-size: 14px;
+    }
+    QListWidget#commentsList {
+        background-color: #2d2d2d;
+        border: 2px solid #3d3d3d;
+        border-radius: 6px;
+        color: white;
+        font-size: 14px;
+    }
+    QListWidget#commentsList::item {
+        padding: 10px;
+    }
+    QStatusBar {
+        background: qlineargradient(x1:0, y1:0, x2:1, y2:0,
+                                   stop:0 #2c3e50, stop:1 #34495e);
+        color: white;
+        font-size: 12px;
+        padding: 5px;
+        border-top: 2px solid #3498db;
+    }
+"""
 
 class DarkPalette(QPalette):
     def __init__(self):
@@ -38,83 +292,15 @@ class DarkPalette(QPalette):
         self.setColor(QPalette.ColorRole.HighlightedText, Qt.GlobalColor.black)
 
 class ModernButton(QPushButton):
+    """Gradient button, styled by MAIN_WINDOW_STYLE"""
     def __init__(self, *args, fire_mode=False, **kwargs):
         super().__init__(*args, **kwargs)
         if fire_mode:
             # Fire-themed gradient button
-            self.setStyleSheet("""
-                QPushButton {
-                    background: qlineargradient(x1:0, y1:0, x2:1, y2:1,
-                                               stop:0 #ff4500, stop:0.5 #ff6347, stop:1 #ff8c00);
-                    border: none;
-                    color: white;
-                    padding: 10px 18px;
-                    border-radius: 8px;
-                    font-size: 14px;
-                    font-weight: bold;
-                    box-shadow: 0 4px 6px rgba(255, 69, 0, 0.4);
-                }
-                QPushButton:hover {
-                    background: qlineargradient(x1:0, y1:0, x2:1, y2:1,
-                                               stop:0 #ff6347, stop:0.5 #ff7f50, stop:1 #ffa500);
-                    box-shadow: 0 6px 8px rgba(255, 69, 0, 0.6);
-                }
-                QPushButton:pressed {
-                    background: qlineargradient(x1:0, y1:0, x2:1, y2:1,
-                                               stop:0 #ff2400, stop:0.5 #ff4500, stop:1 #ff6347);
-                    box-shadow: 0 2px 4px rgba(255, 36, 0, 0.3);
-                }
-            """)
-        else:
-            # Modern gradient button with shadows
-            self.setStyleSheet("""
-                QPushButton {
-                    background: qlineargradient(x1:0, y1:0, x2:0, y2:1,
-                                               stop:0 #3498db, stop:1 #2980b9);
-                    border: none;
-                    color: white;
-                    padding: 10px 18px;
-                    border-radius: 8px;
-                    font-size: 14px;
-                    font-weight: bold;
-                    box-shadow: 0 4px 6px rgba(52, 152, 219, 0.4);
-                }
-                QPushButton:hover {
-                    background: qlineargradient(x1:0, y1:0, x2:0, y2:1,
-                                               stop:0 #5dade2, stop:1 #3498db);
-                    box-shadow: 0 6px 8px rgba(52, 152, 219, 0.6);
-                }
-                QPushButton:pressed {
-                    background: qlineargradient(x1:0, y1:0, x2:0, y2:1,
-                                               stop:0 #2980b9, stop:1 #21618c);
-                    box-shadow: 0 2px 4px rgba(41, 128, 185, 0.3);
-                }
-            """)
+            self.setProperty('fireMode', True)
 
 class ModernLineEdit(QLineEdit):
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.setStyleSheet("""
-            QLineEdit {
-                background: qlineargradient(x1:0, y1:0, x2:0, y2:1,
-                                          stop:0 #34495e, stop:1 #2c3e50);
-                border: 2px solid #3d3d3d;
-                border-radius: 8px;
-                color: white;
-                padding: 10px;
-                font-size: 14px;
-                box-shadow: inset 0 2px 4px rgba(0, 0, 0, 0.2);
-            }
-            QLineEdit:focus {
-                border: 2px solid #3498db;
-                background: qlineargradient(x1:0, y1:0, x2:0, y2:1,
-                                          stop:0 #2c3e50, stop:1 #34495e);
-                box-shadow: 0 0 10px rgba(52, 152, 219, 0.5);
-            }
-            QLineEdit:hover {
-                border: 2px solid #5dade2;
-            }
-        """)
+    """Gradient line edit, styled by MAIN_WINDOW_STYLE"""
 
 class CommentInput(QTextEdit):
     def __init__(self, parent=None):
@@ -130,6 +316,70 @@ class CommentInput(QTextEdit):
         else:
             super().keyPressEvent(event)
 
+class ThumbnailDelegate(QStyledItemDelegate):
+    """Paints the cached preview of a saved graph to the right of its list text"""
+    def __init__(self, thumbnail_cache, parent=None):
+        super().__init__(parent)
+        self.thumbnail_cache = thumbnail_cache  # graph_id -> (param_hash, QPixmap)
+
+    def paint(self, painter, option, index):
+        cached = self.thumbnail_cache.get(index.data(Qt.ItemDataRole.UserRole))
+        if cached is None:
+            super().paint(painter, option, index)
+            return
+        pixmap = cached[1]
+        text_option = QStyleOptionViewItem(option)
+        text_option.rect = option.rect.adjusted(0, 0, -(pixmap.width() + 12), 0)
+        super().paint(painter, text_option, index)
+        rect = option.rect
+        target = QRect(rect.right() - pixmap.width() - 6,
+                       rect.top() + (rect.height() - pixmap.height()) // 2,
+                       pixmap.width(), pixmap.height())
+        painter.drawPixmap(target, pixmap)
+
+    def sizeHint(self, option, index):
+        size = super().sizeHint(option, index)
+        return QSize(size.width() + thumbnails.THUMBNAIL_WIDTH + 12,
+                     max(size.height(), thumbnails.THUMBNAIL_HEIGHT + 8))
+
+class ThumbnailSignals(QObject):
+    finished = pyqtSignal(int, str, bytes)
+
+class ThumbnailWorker(QRunnable):
+    """Renders and stores one graph thumbnail off the GUI thread"""
+    def __init__(self, graph_data, signals):
+        super().__init__()
+        self.graph_data = graph_data
+        self.signals = signals
+
+    def run(self):
+        try:
+            graph_hash = thumbnails.param_hash(self.graph_data)
+            image = thumbnails.render_thumbnail(self.graph_data)
+            self.signals.finished.emit(self.graph_data['id'], graph_hash, image)
+        except Exception as e:
+            logging.error(f"Error rendering thumbnail: {str(e)}")
+
+class PlotSignals(QObject):
+    finished = pyqtSignal(int, object)
+
+class PlotWorker(QRunnable):
+    """Samples a live plot off the GUI thread; invalid or partial input is silently skipped"""
+    def __init__(self, calculator, spec, generation, signals):
+        super().__init__()
+        self.calculator = calculator
+        self.spec = spec
+        self.generation = generation
+        self.signals = signals
+
+    def run(self):
+        try:
+            with np.errstate(all='ignore'):
+                data = self.calculator.compute_plot(**self.spec)
+        except Exception:
+            return
+        self.signals.finished.emit(self.generation, data)
+
 class GraphCanvas(FigureCanvas):
     def __init__(self, calculator: GraphingCalculator):
         fig = Figure(figsize=(8, 6), dpi=100)
@@ -176,6 +426,21 @@ class GraphCanvas(FigureCanvas):
             self.axes.tick_params(axis='y', colors='#ecf0f1')
         self.draw()
 
+# Main windows not yet closed; closeEvent takes a window out
+_open_windows = weakref.WeakSet()
+
+
+def _queue_depths():
+    depths = {}
+    for window in list(_open_windows):
+        for key, depth in window.queue_depths().items():
+            depths[key] = depths.get(key, 0) + depth
+    return depths
+
+
+metrics.REGISTRY.callback('calculator_worker_queue_depth', 'Jobs queued or running per worker',
+                          _queue_depths, labelnames=('queue',))
+
 class MainWindow(QMainWindow):
     def __init__(self, calculator: GraphingCalculator):
         self.auth_window = None
@@ -184,80 +449,72 @@ class MainWindow(QMainWindow):
         screen = QApplication.primaryScreen().geometry()
         window_size = QSize(1200, 800)  # Default size
         if window_size.width() > screen.width():
-            window_size.setWidth(screen.width() * 0.9)
+            window_size.setWidth(int(screen.width() * 0.9))
         if window_size.height() > screen.height():
-            window_size.setHeight(screen.height() * 0.9)
+            window_size.setHeight(int(screen.height() * 0.9))
         x = (screen.width() - window_size.width()) // 2
         y = (screen.height() - window_size.height()) // 2
         self.setGeometry(x, y, window_size.width(), window_size.height())
+        self.setStyleSheet(MAIN_WINDOW_STYLE)
         self.calculator = calculator
         self.current_user = None
+        self.db = AsyncDatabase(parent=self)
+        # Refreshes what is on screen when another window or user changes the database
+        self.change_watcher = ChangeWatcher(self.db.db_file, parent=self)
+        self.change_watcher.users_changed.connect(self.on_users_changed)
+        self.change_watcher.graphs_changed.connect(self.on_graphs_changed)
+        self.change_watcher.comments_changed.connect(self.on_comments_changed)
+        self.comments_graph_id = None  # graph whose comments are shown
+        self.shown_comments = None
+        self.student_graph_source = None  # student whose graphs fill student_graph_list, None for other lists
         self.history_list = QListWidget()
         self.graph_data = {}
-        self.var_selector_layout = QHBoxLayout()
-        self.var_label = QLabel("Variable:")
-        self.scale_label = QLabel("Scale:")
-        self.range_group = QWidget()
-        self.controls_layout = QVBoxLayout()
-        self.sidebar_layout = QVBoxLayout()
-        self.var_selector_layout = QHBoxLayout()
-        self.min_value = QDoubleSpinBox()
-        self.max_value = QDoubleSpinBox()
-        self.step_value = QDoubleSpinBox()
-        self.student_graph_list = QListWidget()
+        # Role panels are built the first time set_user shows them (see student_panel and teacher_panel)
+        self.student_controls = None
+        self.student_list = None
+        self.teacher_controls = None
+        self.student_selector = None
+        self.search_input = None
+        self.search_timer = None
+        self.student_graph_list = None
+        self.comment_input = None
         self.student_graph_data = {}
+        self.search_results = {}  # graph id -> graph dict for the current search
+        self.graph_table = None
+        self.store_samples = True  # keep computed plots of saved graphs in the database
+        self.thumbnail_cache = {}
+        self.pending_thumbnails = set()
+        self.thumbnail_pool = QThreadPool()
+        self.thumbnail_pool.setMaxThreadCount(2)
+        self.thumbnail_signals = ThumbnailSignals()
+        self.thumbnail_signals.finished.connect(self.on_thumbnail_ready)
+        self.history_list.setItemDelegate(ThumbnailDelegate(self.thumbnail_cache, self.history_list))
         main_layout = QHBoxLayout()
         sidebar = QWidget()
+        sidebar.setObjectName('sidebarDivider')
         sidebar.setMinimumWidth(5)
         sidebar.setMaximumWidth(10)
-        sidebar.setStyleSheet("""
-            QWidget {
-                background-color: #2d2d2d;
-                border-right: 1px solid #333340;
-            }
-        """)
         sidebar_layout = QVBoxLayout(sidebar)
         sidebar_layout.setContentsMargins(20, 20, 20, 20)
         sidebar_layout.setSpacing(20)
         sidebar_widget = QWidget()
         sidebar_widget.setLayout(sidebar_layout)
+        self.sidebar_layout = sidebar_layout
         main_layout.addWidget(sidebar_widget)
         header_widget = QWidget()
         header_layout = QVBoxLayout(header_widget)
         header_layout.setSpacing(5)
         self.user_info = QLabel("Not logged in")
-        self.user_info.setStyleSheet("""
-            QLabel {
-                color: white;
-                font-size: 18px;
-                font-weight: bold;
-                padding: 10px;
-            }
-        """)
+        self.user_info.setObjectName('userInfo')
         header_layout.addWidget(self.user_info)
-        logout_btn = ModernButton("Logout")
+        logout_btn = QPushButton("Logout")
+        logout_btn.setObjectName('logoutButton')
         logout_btn.setMinimumHeight(30)
-        logout_btn.setStyleSheet("""
-            QPushButton {
-                background-color: #ff5555;
-                border: none;
-                color: white;
-                padding: 3px 5px;
-                border-radius: 6px;
-                font-size: 16px;
-            }
-            QPushButton:hover {
-                background-color: #ff6e6e;
-            }
-            QPushButton:pressed {
-                background-color: #ff3333;
-            }
-        """)
         logout_btn.clicked.connect(self.handle_logout)
         header_layout.addWidget(logout_btn)
         sidebar_layout.addWidget(header_widget)
         input_label = QLabel("Function Input")
-        input_label.setStyleSheet("color: white; font-size: 13px; font-weight: bold;")
+        input_label.setObjectName('groupLabel')
         sidebar_layout.addWidget(input_label)
         self.expr_input = ModernLineEdit()
         self.expr_input.setMinimumHeight(35)
@@ -272,39 +529,15 @@ class MainWindow(QMainWindow):
         var_selector_widget = QWidget()
         var_selector_layout = QHBoxLayout(var_selector_widget)
         var_label = QLabel("Variable:")
-        var_label.setStyleSheet("""
-            QLabel {
-                color: white;
-                font-weight: bold;
-                font-size: 12px;
-                margin-right: 5px;
-            }
-        """)
+        var_label.setObjectName('fieldLabel')
         self.var_selector = QComboBox()
+        self.var_selector.setObjectName('optionSelector')
         self.var_selector.addItems(['x', 'y', 't', 'θ', 'r'])
-        self.var_selector.setStyleSheet("""
-            QComboBox {
-                background-color: #2d2d2d;
-                color: white;
-                border: 2px solid #3d3d3d;
-                border-radius: 4px;
-                padding: 5px;
-                min-width: 80px;
-            }
-            QComboBox:hover {
-                border-color: #4d4d4d;
-                background-color: #353535;
-            }
-            QComboBox::drop-down {
-                border: none;
-                width: 20px;
-            }
-        """)
         scale_label = QLabel("Scale:")
-        scale_label.setStyleSheet(var_label.styleSheet())
+        scale_label.setObjectName('fieldLabel')
         self.scale_type = QComboBox()
+        self.scale_type.setObjectName('optionSelector')
         self.scale_type.addItems(['Linear', 'Log', 'Polar', 'Parametric'])
-        self.scale_type.setStyleSheet(self.var_selector.styleSheet())
         var_selector_layout.addWidget(var_label)
         var_selector_layout.addWidget(self.var_selector)
         var_selector_layout.addWidget(scale_label)
@@ -314,223 +547,73 @@ class MainWindow(QMainWindow):
         range_group = QWidget()
         range_layout = QGridLayout(range_group)
         range_layout.setSpacing(10)
-        range_spinbox_style = """
-            QDoubleSpinBox {
-                background-color: #2d2d2d;
-                color: white;
-                border: 2px solid #3d3d3d;
-                border-radius: 4px;
-                padding: 2px;
-                min-width: 20px;
-            }
-            QDoubleSpinBox:hover {
-                border-color: #4d4d4d;
-                background-color: #353535;
-            }
-            QDoubleSpinBox::up-button, QDoubleSpinBox::down-button {
-                background-color: #3d3d3d;
-                border: none;
-                width: 16px;
-            }
-        """
         for i, (label_text, attr_name) in enumerate([
             ("Min:", "min_value"),
             ("Max:", "max_value"),
             ("Step:", "step_value")
         ]):
             label = QLabel(label_text)
-            label.setStyleSheet("color: white; font-weight: bold; font-size: 12px;")
+            label.setObjectName('rangeLabel')
             spinbox = QDoubleSpinBox()
             spinbox.setRange(-1000, 1000)
             spinbox.setDecimals(3)
             spinbox.setValue(-10 if "min" in label_text.lower() else 10)
             spinbox.setSingleStep(0.1)
-            spinbox.setStyleSheet(range_spinbox_style)
             setattr(self, attr_name, spinbox)
             range_layout.addWidget(label, i, 0)
             range_layout.addWidget(spinbox, i, 1)
         controls_layout.addWidget(range_group)
-        
+
         # Add advanced features section
         advanced_features_label = QLabel("Advanced Features")
-        advanced_features_label.setStyleSheet("color: white; font-size: 13px; font-weight: bold; margin-top: 10px;")
+        advanced_features_label.setObjectName('advancedLabel')
         controls_layout.addWidget(advanced_features_label)
-        
+
         # Fire mode checkbox
         self.fire_mode_checkbox = QCheckBox("🔥 Fire Mode")
-        self.fire_mode_checkbox.setStyleSheet("""
-            QCheckBox {
-                color: white;
-                font-size: 12px;
-                font-weight: bold;
-                padding: 5px;
-            }
-            QCheckBox::indicator {
-                width: 18px;
-                height: 18px;
-                border-radius: 4px;
-                border: 2px solid #3d3d3d;
-                background-color: #2d2d2d;
-            }
-            QCheckBox::indicator:checked {
-                background: qlineargradient(x1:0, y1:0, x2:1, y2:1,
-                                           stop:0 #ff4500, stop:1 #ff8c00);
-                border: 2px solid #ff4500;
-            }
-            QCheckBox::indicator:hover {
-                border: 2px solid #5dade2;
-            }
-        """)
         self.fire_mode_checkbox.stateChanged.connect(self.toggle_fire_mode)
         self.fire_mode_checkbox.stateChanged.connect(self.sync_fire_button_from_checkbox)
         controls_layout.addWidget(self.fire_mode_checkbox)
-        
+
         # Millisecond plotting checkbox
         self.millisecond_mode_checkbox = QCheckBox("⏱️ Millisecond Time Mode")
-        self.millisecond_mode_checkbox.setStyleSheet(self.fire_mode_checkbox.styleSheet())
         controls_layout.addWidget(self.millisecond_mode_checkbox)
-        
+
         # 3D plotting checkbox (future feature)
         self.advanced_plot_checkbox = QCheckBox("📊 3D Plot Mode")
-        self.advanced_plot_checkbox.setStyleSheet(self.fire_mode_checkbox.styleSheet())
         controls_layout.addWidget(self.advanced_plot_checkbox)
-        
+
+        # Derivative and integral overlays
+        self.derivative_checkbox = QCheckBox("f′(x) Derivative")
+        self.second_derivative_checkbox = QCheckBox("f″(x) Second Derivative")
+        self.integral_checkbox = QCheckBox("∫f dx Integral")
+        for checkbox in (self.derivative_checkbox, self.second_derivative_checkbox, self.integral_checkbox):
+            checkbox.stateChanged.connect(self.refresh_overlays)
+            controls_layout.addWidget(checkbox)
+
+        # Single precision halves the memory of sampled curves
+        self.precision_checkbox = QCheckBox("Single Precision (float32)")
+        self.precision_checkbox.stateChanged.connect(self.toggle_precision)
+        controls_layout.addWidget(self.precision_checkbox)
+
+        # Live plotting as the user types, debounced and sampled on a worker thread
+        self.live_plot_checkbox = QCheckBox("⚡ Live Plot")
+        self.live_plot_checkbox.setChecked(True)
+        controls_layout.addWidget(self.live_plot_checkbox)
+        self.live_plot_generation = 0
+        self.plot_pool = QThreadPool()
+        self.plot_pool.setMaxThreadCount(1)
+        self.plot_signals = PlotSignals()
+        self.plot_signals.finished.connect(self.on_live_plot_ready)
+        _open_windows.add(self)
+        self.live_plot_timer = QTimer(self)
+        self.live_plot_timer.setSingleShot(True)
+        self.live_plot_timer.setInterval(LIVE_PLOT_DELAY_MS)
+        self.live_plot_timer.timeout.connect(self.start_live_plot)
+        self.expr_input.textChanged.connect(self.schedule_live_plot)
+        self.second_expr_input.textChanged.connect(self.schedule_live_plot)
+
         sidebar_layout.addWidget(controls_group)
-        self.student_controls = QWidget()
-        student_layout = QVBoxLayout(self.student_controls)
-        student_layout.setSpacing(5)
-        student_history_container = QWidget()
-        student_history_layout = QVBoxLayout(student_history_container)
-        student_history_label = QLabel("My Graph History")
-        student_history_label.setStyleSheet("""
-            QLabel {
-                color: white;
-                font-size: 16px;
-                font-weight: bold;
-                margin-bottom: 5px;
-            }
-        """)
-        student_history_layout.addWidget(student_history_label)
-        self.student_list = QListWidget()
-        self.student_list.setMinimumHeight(200)
-        self.student_list.setStyleSheet("""
-            QListWidget {
-                background-color: #2d2d2d;
-                border: 2px solid #3d3d3d;
-                border-radius: 6px;
-                color: white;
-                font-size: 12px;
-                padding: 5px;
-            }
-            QListWidget::item {
-                padding: 8px;
-                border-bottom: 1px solid #3d3d3d;
-                margin: 2px 0px;
-            }
-            QListWidget::item:selected {
-                background-color: #2a82da;
-                border-radius: 4px;
-            }
-            QListWidget::item:hover {
-                background-color: #353535;
-            }
-        """)
-        self.student_list.itemClicked.connect(self.load_graph_from_history)
-        self.student_list.itemSelectionChanged.connect(self.on_graph_selection_changed)
-        student_history_layout.addWidget(self.student_list)
-        student_layout.addWidget(student_history_container)
-        sidebar_layout.addWidget(self.student_controls)
-        self.student_controls.hide()
-        self.teacher_controls = QWidget()
-        teacher_layout = QVBoxLayout(self.teacher_controls)
-        teacher_layout.setSpacing(15)
-        teacher_label = QLabel("Teacher Controls")
-        teacher_label.setStyleSheet("color: white; font-size: 18px; font-weight: bold;")
-        teacher_layout.addWidget(teacher_label)
-        selector_section = QWidget()
-        selector_layout = QVBoxLayout(selector_section)
-        self.student_selector = QComboBox()
-        self.student_selector.setMinimumHeight(35)
-        self.student_selector.setEditable(True)
-        self.student_selector.setStyleSheet("""
-            QComboBox {
-                background-color: #2d2d2d;
-                border: 2px solid #3d3d3d;
-                border-radius: 6px;
-                color: white;
-                padding: 8px;
-                font-size: 14px;
-            }
-            QComboBox QLineEdit {
-                color: white;
-                padding: 5px;
-            }
-        """)
-        self.student_selector.currentIndexChanged.connect(self.load_selected_student_graphs)
-        selector_layout.addWidget(self.student_selector)
-        teacher_layout.addWidget(selector_section)
-        selected_student_section = QWidget()
-        selected_student_layout = QVBoxLayout(selected_student_section)
-        selected_student_label = QLabel("Student's Graphs")
-        selected_student_label.setStyleSheet("""
-            QLabel {
-                color: white;
-                font-size: 16px;
-                font-weight: bold;
-                margin-bottom: 5px;
-            }
-        """)
-        selected_student_layout.addWidget(selected_student_label)
-        self.student_graph_list = QListWidget()
-        self.student_graph_list.setMinimumHeight(200)
-        self.student_graph_list.setStyleSheet("""
-            QListWidget {
-                background-color: #2d2d2d;
-                border: 2px solid #3d3d3d;
-                border-radius: 6px;
-                color: white;
-                font-size: 12px;
-                padding: 5px;
-            }
-            QListWidget::item {
-                padding: 8px;
-                border-bottom: 1px solid #3d3d3d;
-                margin: 2px 0px;
-            }
-            QListWidget::item:selected {
-                background-color: #2a82da;
-                border-radius: 4px;
-            }
-            QListWidget::item:hover {
-                background-color: #353535;
-            }
-        """)
-        self.student_graph_list.itemClicked.connect(self.load_graph_from_history)
-        self.student_graph_list.itemSelectionChanged.connect(self.on_graph_selection_changed)
-        selected_student_layout.addWidget(self.student_graph_list)
-        teacher_layout.addWidget(selected_student_section)
-        comment_section = QWidget()
-        comment_layout = QVBoxLayout(comment_section)
-        comment_label = QLabel("Add Comment")
-        comment_label.setStyleSheet("color: white; font-size: 16px; font-weight: bold;")
-        comment_layout.addWidget(comment_label)
-        self.comment_input = CommentInput(self)
-        self.comment_input.setMinimumHeight(60)
-        self.comment_input.setPlaceholderText("Write a comment... (Press Enter to submit)")
-        self.comment_input.setStyleSheet("""
-            QTextEdit {
-                background-color: #2d2d2d;
-                border: 2px solid #3d3d3d;
-                border-radius: 6px;
-                color: white;
-                padding: 10px;
-                font-size: 14px;
-            }
-        """)
-        comment_layout.addWidget(self.comment_input)
-        teacher_layout.addWidget(comment_section)
-        sidebar_layout.addWidget(self.teacher_controls)
-        self.teacher_controls.hide()
         content = QWidget()
         content_layout = QVBoxLayout(content)
         content_layout.setContentsMargins(20, 20, 20, 20)
@@ -538,6 +621,14 @@ class MainWindow(QMainWindow):
         canvas_container = QWidget()
         canvas_layout = QVBoxLayout(canvas_container)
         self.canvas = GraphCanvas(self.calculator)
+        self.plotted_lines = {}
+        self.live_artists = []
+        self.live_background = None
+        self.live_signature = None
+        # (spec, data) of the plot on the canvas, so toggling an overlay can reuse its samples
+        self.last_plot = None
+        self.live_plot_spec = None
+        self.canvas.mpl_connect('draw_event', self.on_canvas_draw)
         canvas_layout.addWidget(self.canvas)
         content_layout.addWidget(canvas_container)
         buttons_container = QWidget()
@@ -546,13 +637,13 @@ class MainWindow(QMainWindow):
         left_buttons = QWidget()
         left_layout = QHBoxLayout(left_buttons)
         left_layout.setSpacing(10)
-        
+
         # Special fire mode toggle button
         self.fire_btn = ModernButton("🔥 Fire Mode", fire_mode=True)
         self.fire_btn.setCheckable(True)
         self.fire_btn.clicked.connect(self.toggle_fire_button)
         left_layout.addWidget(self.fire_btn)
-        
+
         plot_btn = ModernButton("📈 Plot Graph")
         plot_btn.clicked.connect(self.plot_graph)
         left_layout.addWidget(plot_btn)
@@ -575,19 +666,8 @@ class MainWindow(QMainWindow):
         buttons_layout.addWidget(right_buttons)
         content_layout.addWidget(buttons_container)
         self.comments_list = QListWidget()
+        self.comments_list.setObjectName('commentsList')
         self.comments_list.setMinimumHeight(150)
-        self.comments_list.setStyleSheet("""
-            QListWidget {
-                background-color: #2d2d2d;
-                border: 2px solid #3d3d3d;
-                border-radius: 6px;
-                color: white;
-                font-size: 14px;
-            }
-            QListWidget::item {
-                padding: 10px;
-            }
-        """)
         content_layout.addWidget(self.comments_list)
         main_layout.addWidget(sidebar)
         main_layout.addWidget(content)
@@ -595,38 +675,114 @@ class MainWindow(QMainWindow):
         central_widget.setLayout(main_layout)
         self.setCentralWidget(central_widget)
         self.setPalette(DarkPalette())
-        
+
         # Add modern status bar
         status_bar = QStatusBar()
-        status_bar.setStyleSheet("""
-            QStatusBar {
-                background: qlineargradient(x1:0, y1:0, x2:1, y2:0,
-                                           stop:0 #2c3e50, stop:1 #34495e);
-                color: white;
-                font-size: 12px;
-                padding: 5px;
-                border-top: 2px solid #3498db;
-            }
-        """)
         self.setStatusBar(status_bar)
         status_bar.showMessage("Welcome to World-Class Graphing Calculator! 🚀", 5000)
 
+    def student_panel(self):
+        """The student's sidebar panel (graph history), built on first use"""
+        if self.student_controls is not None:
+            return self.student_controls
+        self.student_controls = QWidget()
+        student_layout = QVBoxLayout(self.student_controls)
+        student_layout.setSpacing(5)
+        student_history_container = QWidget()
+        student_history_layout = QVBoxLayout(student_history_container)
+        student_history_label = QLabel("My Graph History")
+        student_history_label.setObjectName('panelTitle')
+        student_history_layout.addWidget(student_history_label)
+        self.student_list = QListWidget()
+        self.student_list.setObjectName('graphList')
+        self.student_list.setMinimumHeight(200)
+        self.student_list.setItemDelegate(ThumbnailDelegate(self.thumbnail_cache, self.student_list))
+        self.student_list.itemClicked.connect(self.load_graph_from_history)
+        self.student_list.itemSelectionChanged.connect(self.on_graph_selection_changed)
+        student_history_layout.addWidget(self.student_list)
+        student_layout.addWidget(student_history_container)
+        self.student_controls.hide()
+        self.sidebar_layout.addWidget(self.student_controls)
+        return self.student_controls
+
+    def teacher_panel(self):
+        """The teacher's sidebar panel (student selector, search, graphs, comment box), built on first use"""
+        if self.teacher_controls is not None:
+            return self.teacher_controls
+        self.teacher_controls = QWidget()
+        teacher_layout = QVBoxLayout(self.teacher_controls)
+        teacher_layout.setSpacing(15)
+        teacher_label = QLabel("Teacher Controls")
+        teacher_label.setObjectName('teacherTitle')
+        teacher_layout.addWidget(teacher_label)
+        selector_section = QWidget()
+        selector_layout = QVBoxLayout(selector_section)
+        self.student_selector = QComboBox()
+        self.student_selector.setObjectName('studentSelector')
+        self.student_selector.setMinimumHeight(35)
+        self.student_selector.setEditable(True)
+        self.student_selector.currentIndexChanged.connect(self.load_selected_student_graphs)
+        selector_layout.addWidget(self.student_selector)
+        self.search_input = QLineEdit()
+        self.search_input.setObjectName('searchInput')
+        self.search_input.setMinimumHeight(35)
+        self.search_input.setPlaceholderText("Search graphs and comments...")
+        self.search_input.setClearButtonEnabled(True)
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(SEARCH_DELAY_MS)
+        self.search_timer.timeout.connect(self.run_search)
+        self.search_input.textChanged.connect(self.search_timer.start)
+        self.search_input.returnPressed.connect(self.run_search)
+        selector_layout.addWidget(self.search_input)
+        teacher_layout.addWidget(selector_section)
+        selected_student_section = QWidget()
+        selected_student_layout = QVBoxLayout(selected_student_section)
+        selected_student_label = QLabel("Student's Graphs")
+        selected_student_label.setObjectName('panelTitle')
+        selected_student_layout.addWidget(selected_student_label)
+        self.student_graph_list = QListWidget()
+        self.student_graph_list.setObjectName('graphList')
+        self.student_graph_list.setMinimumHeight(200)
+        # Ctrl/Shift-click selects several graphs to leave the same comment on
+        self.student_graph_list.setSelectionMode(QAbstractItemView.SelectionMode.ExtendedSelection)
+        self.student_graph_list.setItemDelegate(ThumbnailDelegate(self.thumbnail_cache, self.student_graph_list))
+        self.student_graph_list.itemClicked.connect(self.load_graph_from_history)
+        self.student_graph_list.itemSelectionChanged.connect(self.on_graph_selection_changed)
+        selected_student_layout.addWidget(self.student_graph_list)
+        teacher_layout.addWidget(selected_student_section)
+        comment_section = QWidget()
+        comment_layout = QVBoxLayout(comment_section)
+        comment_label = QLabel("Add Comment")
+        comment_label.setObjectName('commentTitle')
+        comment_layout.addWidget(comment_label)
+        self.comment_input = CommentInput(self)
+        self.comment_input.setObjectName('commentInput')
+        self.comment_input.setMinimumHeight(60)
+        self.comment_input.setPlaceholderText("Write a comment... (Press Enter to submit)")
+        comment_layout.addWidget(self.comment_input)
+        teacher_layout.addWidget(comment_section)
+        self.teacher_controls.hide()
+        self.sidebar_layout.addWidget(self.teacher_controls)
+        return self.teacher_controls
+
     def set_user(self, user: User):
         try:
             if not user:
                 raise ValueError("No user provided")
             self.current_user = user
             if user.role == 'teacher':
-                self.teacher_controls.show()
-                self.student_controls.hide()
-                self.student_selector.show()
+                if self.student_controls is not None:
+                    self.student_controls.hide()
+                self.teacher_panel().show()
                 self.load_student_list()
             elif user.role == 'student':
-                self.teacher_controls.hide()
-                self.student_controls.show()
-                self.student_selector.hide()
+                if self.teacher_controls is not None:
+                    self.teacher_controls.hide()
+                self.student_panel().show()
                 self.load_student_graphs()
             self.user_info.setText(f"Welcome, {user.full_name} ({user.role.capitalize()})")
+            self.change_watcher.start()
         except Exception as e:
             QMessageBox.critical(self, "Error", f"Error setting user: {str(e)}")
 
@@ -636,39 +792,11 @@ class MainWindow(QMainWindow):
         layout.setContentsMargins(0, 10, 0, 10)
         layout.setSpacing(10)
         history_label = QLabel("My Graph History")
-        history_label.setStyleSheet("""
-            QLabel {
-                color: white;
-                font-size: 16px;
-                font-weight: bold;
-                margin-bottom: 5px;
-            }
-        """)
+        history_label.setObjectName('panelTitle')
         layout.addWidget(history_label)
         graph_list = QListWidget()
+        graph_list.setObjectName('graphList')
         graph_list.setMinimumHeight(200)
-        graph_list.setStyleSheet("""
-            QListWidget {
-                background-color: #2d2d2d;
-                border: 2px solid #3d3d3d;
-                border-radius: 6px;
-                color: white;
-                font-size: 12px;
-                padding: 5px;
-            }
-            QListWidget::item {
-                padding: 8px;
-                border-bottom: 1px solid #3d3d3d;
-                margin: 2px 0px;
-            }
-            QListWidget::item:selected {
-                background-color: #2a82da;
-                border-radius: 4px;
-            }
-            QListWidget::item:hover {
-                background-color: #353535;
-            }
-        """)
         graph_list.setWordWrap(True)
         graph_list.setSizeAdjustPolicy(QListWidget.SizeAdjustPolicy.AdjustToContents)
         layout.addWidget(graph_list)
@@ -689,33 +817,27 @@ class MainWindow(QMainWindow):
             return
 
         self.setCursor(Qt.CursorShape.WaitCursor)  # Show loading cursor
-        try:
-            # Initialize the database
-            db = AdvancedDatabase()
+        # Get graphs based on user role
+        if self.current_user.role == "teacher":
+            self.db.get_graph_table(channel='all_graphs', callback=self.show_loaded_graphs,
+                                    errback=self.on_load_graphs_error)
+        else:  # Student role
+            self.db.get_graph_table(self.current_user.id, channel='all_graphs',
+                                    callback=self.show_loaded_graphs, errback=self.on_load_graphs_error)
 
-            # Get graphs based on user role
+    def show_loaded_graphs(self, graphs):
+        self.setCursor(Qt.CursorShape.ArrowCursor)  # Restore normal cursor
+        if not self.current_user:
+            return
+        if not graphs:
             if self.current_user.role == "teacher":
-                graphs = db.get_all_graphs()
-                if not graphs:
-                    QMessageBox.information(
-                        self,
-                        "No Data",
-                        "No graphs found in the database"
-                    )
-                    return
-            else:  # Student role
-                graphs = db.get_user_graphs(self.current_user.id)
-                if not graphs:
-                    QMessageBox.information(
-                        self,
-                        "No Data",
-                        f"No graphs found for user {self.current_user.username}"
-                    )
-                    return
-
+                QMessageBox.information(self, "No Data", "No graphs found in the database")
+            else:
+                QMessageBox.information(self, "No Data", f"No graphs found for user {self.current_user.username}")
+            return
+        try:
             # Update UI
             self.update_graph_display(graphs)
-
         except Exception as e:
             QMessageBox.critical(
                 self,
@@ -723,18 +845,54 @@ class MainWindow(QMainWindow):
                 f"An unexpected error occurred: {str(e)}\nPlease try again or contact support."
             )
             logging.error(f"Unexpected error in load_graphs: {str(e)}")
-            raise
 
-        finally:
-            self.setCursor(Qt.CursorShape.ArrowCursor)  # Restore normal cursor
+    def update_graph_display(self, table):
+        """List a GraphTable in the role's graph list, newest first, reading its columns directly"""
+        self.graph_table = table.sort('created_at', descending=True)
+        if self.current_user.role == 'teacher':
+            graph_list = self.student_graph_list
+            self.student_graph_source = None
+            details = self.graph_table.column('username')
+        else:
+            graph_list = self.student_list
+            created = self.graph_table.column('created_at').astype('datetime64[s]')
+            details = np.char.replace(np.datetime_as_string(created, unit='s'), 'T', ' ')
+        graph_list.clear()
+        for graph_id, name, detail in zip(self.graph_table.ids(), self.graph_table.column('name'), details):
+            item = QListWidgetItem(f"{name} ({detail})")
+            item.setData(Qt.ItemDataRole.UserRole, int(graph_id))
+            graph_list.addItem(item)
+        self.request_thumbnails(self.graph_table)
+
+    def graph_for_item(self, item):
+        """The graph behind a list item, looked up by id in the loaded GraphTable or by name"""
+        graph_id = item.data(Qt.ItemDataRole.UserRole)
+        if self.graph_table is not None and graph_id is not None:
+            position = self.graph_table.index_of(graph_id)
+            if position is not None:
+                return self.graph_table.row(position)
+        if graph_id in self.search_results:
+            return self.search_results[graph_id]
+        return self.student_graph_data.get(item.text().split(' (')[0])
+
+    def on_load_graphs_error(self, error):
+        self.setCursor(Qt.CursorShape.ArrowCursor)
+        QMessageBox.critical(
+            self,
+            "Unexpected Error",
+            f"An unexpected error occurred: {str(error)}\nPlease try again or contact support."
+        )
 
     def load_student_graphs(self):
         if not self.current_user or self.current_user.role != 'student':
             return
         print(f"Loading graphs for user: {self.current_user.username}")
+        self.db.get_user_graphs(
+            self.current_user.id, channel='student_graphs', callback=self.show_student_graphs,
+            errback=lambda e: QMessageBox.critical(self, "Error", f"Error loading graphs: {str(e)}"))
+
+    def show_student_graphs(self, graphs):
         try:
-            db = AdvancedDatabase()
-            graphs = db.get_user_graphs(self.current_user.id)
             print(f"Fetched {len(graphs)} graphs")
             self.student_list.clear()
             self.student_graph_data = {}
@@ -750,6 +908,7 @@ class MainWindow(QMainWindow):
                     self.student_list.addItem(item)
                     self.student_graph_data[graph_name] = graph
                 print(f"Added {self.student_list.count()} items to list")
+                self.request_thumbnails(graphs)
                 if self.student_list.count() > 0:
                     self.student_list.setCurrentRow(0)
             else:
@@ -763,14 +922,12 @@ class MainWindow(QMainWindow):
 
     def on_graph_selection_changed(self):
         try:
-            selected_items = self.student_graph_list.selectedItems()
+            selected_items = self.student_graph_list.selectedItems() if self.student_graph_list is not None else []
             if not selected_items:
                 selected_items = self.history_list.selectedItems()
             if selected_items:
-                item = selected_items[0]
-                graph_name = item.text().split(' (')[0]
-                if graph_name in self.student_graph_data:
-                    graph_data = self.student_graph_data[graph_name]
+                graph_data = self.graph_for_item(selected_items[0])
+                if graph_data:
                     graph_id = graph_data.get('id')
                     if graph_id:
                         self.update_comments(graph_id)
@@ -790,9 +947,8 @@ class MainWindow(QMainWindow):
 
     def load_graph_from_history(self, item):
         try:
-            graph_name = item.text().split(' (')[0]
-            if graph_name in self.student_graph_data:
-                graph_data = self.student_graph_data[graph_name]
+            graph_data = self.graph_for_item(item)
+            if graph_data:
                 self.expr_input.setText(graph_data.get('expression', ''))
                 self.second_expr_input.setText(graph_data.get('expression2', ''))
                 if 'x_min' in graph_data:
@@ -802,17 +958,54 @@ class MainWindow(QMainWindow):
                 graph_id = graph_data.get('id')
                 if graph_id:
                     self.update_comments(graph_id)
-                self.plot_graph()
+                    self.open_saved_graph(graph_id)
+                else:
+                    self.plot_graph()
         except Exception as e:
             QMessageBox.critical(self, "Error", f"Error loading graph: {str(e)}")
             logging.error(f"Error loading graph from history: {str(e)}")
 
+    def open_saved_graph(self, graph_id):
+        """Draw a saved graph from its stored samples, computing and storing them on a miss"""
+        # Filling in the inputs scheduled a live plot; the saved graph replaces it
+        self.live_plot_timer.stop()
+        self.live_plot_generation += 1
+        spec = self.current_plot_spec()
+        if spec is None or not self.store_samples:
+            self.plot_graph()
+            return
+        key = plot_samples.param_hash(spec, self.calculator.precision)
+        expression = spec['expression']
+        self.db.get_samples(
+            graph_id, key, expression_engine.ENGINE_VERSION, channel='samples',
+            callback=lambda blob: self.show_samples(graph_id, expression, key, blob),
+            errback=lambda e: self.plot_graph())
+
+    def show_samples(self, graph_id, expression, key, blob):
+        spec = self.current_plot_spec()
+        if (spec is None or spec['expression'] != expression
+                or plot_samples.param_hash(spec, self.calculator.precision) != key):
+            return  # the inputs changed while the samples were loading
+        if blob is not None:
+            try:
+                with PLOT_STAGE_SECONDS.time(stage='decode'):
+                    data = plot_samples.relabel(plot_samples.decode(blob), expression)
+                self.render_plot(data)
+                self.statusBar().showMessage("✓ Plot Loaded", 2000)
+                return
+            except Exception as e:
+                logging.error(f"Discarding stored samples of graph {graph_id}: {str(e)}")
+        data = self.plot_graph()
+        if data is not None:
+            self.db.save_samples(graph_id, key, expression_engine.ENGINE_VERSION, plot_samples.encode(data))
+
     def setup_student_view(self):
         if self.current_user and self.current_user.role == 'student':
-            self.teacher_controls.hide()
+            if self.teacher_controls is not None:
+                self.teacher_controls.hide()
             self.load_student_graphs()
         else:
-            self.teacher_controls.show()
+            self.teacher_panel().show()
 
     def save_graph_image(self):
         try:
@@ -833,18 +1026,38 @@ class MainWindow(QMainWindow):
     def load_student_list(self):
         if not self.current_user or self.current_user.role != 'teacher':
             return
+        self.db.get_class_overview(
+            channel='students', callback=self.show_student_list,
+            errback=lambda e: QMessageBox.critical(self, "Error", f"Error loading student list: {str(e)}"))
+
+    def show_student_list(self, students):
         try:
-            db = AdvancedDatabase()
-            students = db.get_all_students()
             self.student_selector.clear()
             if students:
-                self.student_list = students
-                self.student_selector.addItems([student[1] for student in students])
+                self.student_selector.addItems([student['username'] for student in students])
+                self.show_student_summaries(students)
             else:
                 QMessageBox.information(self, "Info", "No students found in database")
         except Exception as e:
             QMessageBox.critical(self, "Error", f"Error loading student list: {str(e)}")
 
+    def refresh_student_summaries(self):
+        """Re-read the class overview and update the selector's tooltips without reloading it"""
+        self.db.get_class_overview(channel='student_summaries', callback=self.show_student_summaries)
+
+    def show_student_summaries(self, students):
+        summaries = {student['username']: student for student in students}
+        for index in range(self.student_selector.count()):
+            student = summaries.get(self.student_selector.itemText(index))
+            if student is None:
+                continue
+            last_activity = student['last_activity'] or 'never'
+            self.student_selector.setItemData(
+                index,
+                f"{student['full_name']}: {student['graph_count']} graphs, "
+                f"{student['uncommented_count']} without comments, last saved {last_activity}",
+                Qt.ItemDataRole.ToolTipRole)
+
     def handle_logout(self):
         try:
             if self.current_user:
@@ -853,23 +1066,38 @@ class MainWindow(QMainWindow):
                     self.calculator.save_graphs(filename)
                 except Exception as e:
                     QMessageBox.warning(self, "Warning", f"Could not save graphs: {str(e)}")
+            self.change_watcher.stop()
             self.current_user = None
+            self.graph_table = None
             self.calculator.clear_graphs()
             self.update_history()
             self.user_info.setText("Not logged in")
-            self.teacher_controls.hide()
+            if self.teacher_controls is not None:
+                self.teacher_controls.hide()
             self.expr_input.clear()
             self.second_expr_input.clear()
+            self.live_artists = []
+            self.live_background = None
+            self.last_plot = None
             self.canvas.axes.clear()
             self.canvas.draw()
             from auth_system import AuthWindow
             self.auth_window = AuthWindow()
             self.auth_window.login_successful.connect(self.set_user)
+            self.auth_window.login_successful.connect(self.show)
             self.auth_window.show()
-            self.close()
+            # Hidden rather than closed: the next login reuses this window and its database
+            self.hide()
         except Exception as e:
             QMessageBox.critical(self, "Error", f"Error during logout: {str(e)}")
 
+    def closeEvent(self, event):
+        """Release the database thread and connections when the window is closed for good"""
+        _open_windows.discard(self)
+        self.change_watcher.stop()
+        self.db.close()
+        super().closeEvent(event)
+
     def update_history(self):
         try:
             if hasattr(self, 'history_list'):
@@ -906,6 +1134,52 @@ class MainWindow(QMainWindow):
         except Exception as e:
             QMessageBox.critical(self, "Error", f"Error toggling fire mode: {str(e)}")
     
+    def selected_overlays(self):
+        """Overlay keys for the checked derivative/integral boxes"""
+        overlays = set()
+        if self.derivative_checkbox.isChecked():
+            overlays.add(expression_engine.OVERLAY_DERIVATIVE)
+        if self.second_derivative_checkbox.isChecked():
+            overlays.add(expression_engine.OVERLAY_SECOND_DERIVATIVE)
+        if self.integral_checkbox.isChecked():
+            overlays.add(expression_engine.OVERLAY_INTEGRAL)
+        return overlays
+
+    def toggle_precision(self, state):
+        """Switch sample precision between float64 and float32"""
+        single = (state == Qt.CheckState.Checked.value)
+        self.calculator.precision = 'float32' if single else 'float64'
+        self.statusBar().showMessage(f"Sampling in {self.calculator.precision}", 2000)
+
+    def refresh_overlays(self, state):
+        """Redraw the current graph when an overlay is toggled, computing only the overlays it lacks"""
+        spec = self.current_plot_spec()
+        if spec is None:
+            return
+        if self.last_plot is None or not self.same_plot_inputs(spec, self.last_plot[0]):
+            self.plot_graph()
+            return
+        data = self.last_plot[1]
+        curves = {role: values for role, label, values in data['curves']}
+        if 'main' not in curves:
+            return  # overlays are only drawn for a real-valued function
+        overlays = {key: values for key, values in data['overlays'].items() if key in spec['overlays']}
+        missing = spec['overlays'] - set(overlays)
+        try:
+            if missing:
+                overlays.update(self.calculator.evaluate_overlays(data['expression'], data['x'], curves['main'],
+                                                                  missing))
+            data = dict(data, overlays=overlays)
+            self.render_plot(data)
+            self.last_plot = (self.last_plot[0], data)
+        except Exception as e:
+            QMessageBox.critical(self, "Error", f"Error updating overlays: {str(e)}")
+
+    def same_plot_inputs(self, spec, other):
+        """Whether two plot specs sample the same curves; overlays and solving aside"""
+        keys = ('expression', 'second_expr', 'x_min', 'x_max', 'scale_type', 'variable')
+        return all(spec[key] == other[key] for key in keys)
+
     def sync_fire_button_from_checkbox(self, state):
         """Sync fire button state when checkbox is toggled"""
         try:
@@ -916,12 +1190,62 @@ class MainWindow(QMainWindow):
         except Exception as e:
             pass  # Silently fail to avoid disrupting checkbox toggle
 
+    def request_thumbnails(self, graphs):
+        """Use stored previews where they are current and render the rest in the background"""
+        missing = []
+        for graph in graphs:
+            graph_id = graph.get('id')
+            if not graph_id:
+                continue
+            cached = self.thumbnail_cache.get(graph_id)
+            if cached is None or cached[0] != thumbnails.param_hash(graph):
+                missing.append(graph)
+        if not missing:
+            return
+        self.db.get_thumbnails([(graph['id'], thumbnails.param_hash(graph)) for graph in missing],
+                               callback=lambda stored: self.show_stored_thumbnails(missing, stored))
+
+    def show_stored_thumbnails(self, missing, stored):
+        for graph in missing:
+            graph_hash = thumbnails.param_hash(graph)
+            entry = stored.get(graph['id'])
+            if entry and entry[0] == graph_hash:
+                self.set_thumbnail(graph['id'], graph_hash, entry[1])
+            elif (graph['id'], graph_hash) not in self.pending_thumbnails:
+                self.pending_thumbnails.add((graph['id'], graph_hash))
+                self.thumbnail_pool.start(ThumbnailWorker(dict(graph), self.thumbnail_signals))
+        self.refresh_graph_lists()
+
+    def set_thumbnail(self, graph_id, graph_hash, image):
+        pixmap = QPixmap()
+        if pixmap.loadFromData(image, "PNG"):
+            self.thumbnail_cache[graph_id] = (graph_hash, pixmap)
+
+    def on_thumbnail_ready(self, graph_id, graph_hash, image):
+        self.pending_thumbnails.discard((graph_id, graph_hash))
+        self.db.save_thumbnail(graph_id, graph_hash, image)
+        self.set_thumbnail(graph_id, graph_hash, image)
+        self.refresh_graph_lists()
+
+    def refresh_graph_lists(self):
+        """Repaint the graph lists so their delegates pick up new thumbnails"""
+        for graph_list in (self.student_list, self.history_list, self.student_graph_list):
+            if isinstance(graph_list, QListWidget):
+                graph_list.viewport().update()
+
     def update_comments(self, graph_id):
         if not graph_id:
             return
+        self.comments_graph_id = graph_id
+        self.db.get_graph_comments(
+            graph_id, channel='comments', callback=self.show_comments,
+            errback=lambda e: QMessageBox.critical(self, "Error", f"Error loading comments: {str(e)}"))
+
+    def show_comments(self, comments):
+        if comments == self.shown_comments and self.comments_list.count():
+            return  # e.g. the change watcher re-reading after our own comment
+        self.shown_comments = comments
         try:
-            db = AdvancedDatabase()
-            comments = db.get_graph_comments(graph_id)
             self.comments_list.clear()
             if comments:
                 for comment in comments:
@@ -947,7 +1271,7 @@ class MainWindow(QMainWindow):
 
     def load_selected_student_graphs(self):
         """Load graphs for the selected student (teacher-specific)."""
-        if not hasattr(self, 'student_selector') or self.current_user.role != 'teacher':
+        if self.student_selector is None or self.current_user.role != 'teacher':
             return
 
         selected_student = self.student_selector.currentText()
@@ -956,17 +1280,61 @@ class MainWindow(QMainWindow):
             return
 
         self.setCursor(Qt.CursorShape.WaitCursor)  # Show loading cursor
-        try:
-            db = AdvancedDatabase()
-            graphs = db.get_student_graphs(selected_student)
+        self.db.get_student_graphs(
+            selected_student, channel='selected_student_graphs',
+            callback=lambda graphs: self.show_selected_student_graphs(selected_student, graphs),
+            errback=self.on_selected_student_graphs_error)
+
+    def on_selected_student_graphs_error(self, error):
+        self.setCursor(Qt.CursorShape.ArrowCursor)
+        QMessageBox.critical(self, "Error", f"Error loading student graphs: {str(error)}")
+
+    def run_search(self):
+        """Search all graphs and comments for the search box text; empty text restores the student's graphs"""
+        self.search_timer.stop()
+        text = self.search_input.text().strip()
+        if not text:
+            self.search_results = {}
+            if self.student_selector.currentText():
+                self.load_selected_student_graphs()
+            return
+        self.db.search(
+            text, channel='search', callback=self.show_search_results,
+            errback=lambda e: QMessageBox.critical(self, "Error", f"Error searching: {str(e)}"))
 
+    def show_search_results(self, results):
+        self.student_graph_list.clear()
+        self.search_results = {}
+        self.student_graph_source = None
+        for graph in results:
+            if graph['id'] in self.search_results:
+                continue  # matched by name and by a comment
+            item = QListWidgetItem(f"{graph['name']} ({graph['username']}) - {graph['snippet']}")
+            item.setData(Qt.ItemDataRole.UserRole, graph['id'])
+            item.setToolTip(graph['expression'])
+            self.student_graph_list.addItem(item)
+            self.search_results[graph['id']] = graph
+        if self.search_results:
+            self.request_thumbnails(list(self.search_results.values()))
+        else:
+            placeholder = QListWidgetItem("No matches")
+            placeholder.setFlags(placeholder.flags() & ~Qt.ItemFlag.ItemIsEnabled)
+            self.student_graph_list.addItem(placeholder)
+
+    def show_selected_student_graphs(self, selected_student, graphs):
+        try:
             self.student_graph_list.clear()
             self.student_graph_data = {}
+            self.search_results = {}
+            self.student_graph_source = selected_student
 
             if graphs:
                 for graph in graphs:
-                    self.student_graph_list.addItem(graph['name'])
+                    item = QListWidgetItem(graph['name'])
+                    item.setData(Qt.ItemDataRole.UserRole, graph['id'])
+                    self.student_graph_list.addItem(item)
                     self.student_graph_data[graph['name']] = graph
+                self.request_thumbnails(graphs)
             else:
                 QMessageBox.information(self, "Info", f"No graphs found for {selected_student}")
         except Exception as e:
@@ -974,8 +1342,96 @@ class MainWindow(QMainWindow):
         finally:
             self.setCursor(Qt.CursorShape.ArrowCursor)
 
+    def on_users_changed(self):
+        if self.current_user and self.current_user.role == 'teacher':
+            self.db.get_class_overview(channel='student_changes', callback=self.sync_student_list)
+
+    def sync_student_list(self, students):
+        """Add and remove students in the selector without reloading the selected student's graphs"""
+        selected = self.student_selector.currentText()
+        usernames = [student['username'] for student in students]
+        self.student_selector.blockSignals(True)
+        for index in reversed(range(self.student_selector.count())):
+            if self.student_selector.itemText(index) not in usernames:
+                self.student_selector.removeItem(index)
+        existing = {self.student_selector.itemText(index) for index in range(self.student_selector.count())}
+        for index, username in enumerate(usernames):
+            if username not in existing:
+                self.student_selector.insertItem(index, username)
+        self.student_selector.blockSignals(False)
+        self.show_student_summaries(students)
+        if self.student_selector.currentText() != selected:
+            self.load_selected_student_graphs()
+
+    def on_graphs_changed(self):
+        """Graphs were saved or deleted: update the graph list on screen in place"""
+        if not self.current_user:
+            return
+        if self.current_user.role == 'teacher':
+            self.refresh_student_summaries()
+            student = self.student_graph_source
+            if student:
+                self.db.get_student_graphs(
+                    student, channel='student_graph_changes',
+                    callback=lambda graphs: self.sync_selected_student_graphs(student, graphs))
+        else:
+            self.db.get_user_graphs(self.current_user.id, channel='student_graph_changes',
+                                    callback=self.sync_student_graphs)
+
+    def on_comments_changed(self):
+        if not self.current_user:
+            return
+        if self.comments_graph_id:
+            self.update_comments(self.comments_graph_id)
+        if self.current_user.role == 'teacher':
+            self.refresh_student_summaries()
+
+    def sync_selected_student_graphs(self, student, graphs):
+        if student != self.student_graph_source:
+            return  # the teacher has moved on to another student or a search
+        self.student_graph_data = {graph['name']: graph for graph in graphs}
+        self.sync_graph_items(self.student_graph_list, [(graph['id'], graph['name']) for graph in graphs])
+        self.request_thumbnails(graphs)
+
+    def sync_student_graphs(self, graphs):
+        if not self.current_user or self.current_user.role != 'student':
+            return
+        if not graphs:
+            self.show_student_graphs(graphs)
+            return
+        self.student_graph_data = {graph.get('name', 'Unnamed Graph'): graph for graph in graphs}
+        self.sync_graph_items(self.student_list, [
+            (graph.get('id'), f"{graph.get('name', 'Unnamed Graph')} ({graph.get('created_at', 'No date')})")
+            for graph in graphs
+        ])
+        self.request_thumbnails(graphs)
+
+    def sync_graph_items(self, graph_list, entries):
+        """Make graph_list show entries [(graph_id, text)] in order, touching only the items that differ"""
+        wanted = dict(entries)
+        for row in reversed(range(graph_list.count())):
+            # Also drops placeholders, which carry no id
+            if graph_list.item(row).data(Qt.ItemDataRole.UserRole) not in wanted:
+                graph_list.takeItem(row)
+        items = {graph_list.item(row).data(Qt.ItemDataRole.UserRole): graph_list.item(row)
+                 for row in range(graph_list.count())}
+        for row, (graph_id, text) in enumerate(entries):
+            item = items.get(graph_id)
+            if item is None:
+                item = QListWidgetItem(text)
+                item.setData(Qt.ItemDataRole.UserRole, graph_id)
+                graph_list.insertItem(row, item)
+                continue
+            if item.text() != text:
+                item.setText(text)
+            if graph_list.row(item) != row:
+                graph_list.insertItem(row, graph_list.takeItem(graph_list.row(item)))
+
     def clear_graph(self):
         try:
+            self.live_artists = []
+            self.live_background = None
+            self.last_plot = None
             self.canvas.axes.clear()
             self.canvas.axes.grid(True, linestyle='--', alpha=0.5)
             self.canvas.draw()
@@ -983,242 +1439,270 @@ class MainWindow(QMainWindow):
             QMessageBox.critical(self, "Error", f"Error clearing graph: {str(e)}")
 
     # --------------------- UPDATED PLOT GRAPH METHOD ---------------------
+    def current_plot_spec(self, solve_equations=True):
+        """Read the plot inputs as compute_plot arguments, or None when there is nothing to plot"""
+        expression = self.expr_input.text().strip()
+        second_expr = self.second_expr_input.text().strip()
+
+        # If the first expression is empty but the second is provided, use it as the main expression.
+        if not expression:
+            if not second_expr:
+                return None
+            expression, second_expr = second_expr, ""
+
+        return {
+            'expression': expression,
+            'second_expr': second_expr,
+            'x_min': self.min_value.value(),
+            'x_max': self.max_value.value(),
+            'scale_type': self.scale_type.currentText().lower(),
+            'variable': self.var_selector.currentText().strip(),
+            'overlays': self.selected_overlays(),
+            'solve_equations': solve_equations
+        }
+
     def plot_graph(self):
         try:
-            self.canvas.axes.clear()
-            self.canvas.axes.grid(True, linestyle='--', alpha=0.5)
-            # Read both expressions from the input fields
-            expression = self.expr_input.text().strip()
-            second_expr = self.second_expr_input.text().strip()
+            # Any live plot pending or in flight is older than this one
+            self.live_plot_timer.stop()
+            self.live_plot_generation += 1
+            spec = self.current_plot_spec()
+            if spec is None:
+                QMessageBox.warning(self, "Error", "Please enter an expression or equation")
+                return
+
+            data = self.calculator.compute_plot(**spec)
+            self.last_plot = (spec, data)
+            if data['intersection_error']:
+                QMessageBox.critical(self, "Error", f"Error computing intersections: {data['intersection_error']}")
+            # Both sides are drawn even without a real root in range, so the user can see why
+            self.render_plot(data)
 
-            # If the first expression is empty but the second is provided, use it as the main expression.
-            if not expression:
-                if second_expr:
-                    expression = second_expr
-                    second_expr = ""  # clear second_expr as it is now primary
-                else:
-                    QMessageBox.warning(self, "Error", "Please enter an expression or equation")
-                    return
-
-            # Get range and scale values
-            x_min = self.min_value.value()
-            x_max = self.max_value.value()
-            y_min = self.min_value.value()  # For simplicity, reusing for y-axis
-            y_max = self.max_value.value()
-            scale_type = self.scale_type.currentText().lower()
-            variable = self.var_selector.currentText().strip()
-
-            # Set up transformations for implicit multiplication
-            transformations = standard_transformations + (implicit_multiplication_application, convert_xor,)
-
-            # Equation mode if "=" is in the main expression
-            if "=" in expression:
-                left_side, right_side = expression.split("=", 1)
-                var_sym = symbols(variable)
-                left_expr = parse_expr(left_side, transformations=transformations)
-                right_expr = parse_expr(right_side, transformations=transformations)
-                solutions = solve(left_expr - right_expr, var_sym)
-                if not solutions:
-                    QMessageBox.information(self, "No Solution", "No solution found for the equation.")
-                    return
-
-                if scale_type == 'log':
-                    x_min = max(1e-10, x_min)
-                    x_values = np.logspace(np.log10(x_min), np.log10(x_max), 1000)
-                    self.canvas.axes.set_xscale('log')
-                else:
-                    x_values = np.linspace(x_min, x_max, 1000)
-
-                f_left = lambdify(var_sym, left_expr, modules=["numpy"])
-                f_right = lambdify(var_sym, right_expr, modules=["numpy"])
-                y_left = f_left(x_values)
-                y_right = f_right(x_values)
-                self.canvas.axes.plot(x_values, y_left, label=left_side.strip(), color='#1f77b4', linewidth=2)
-                self.canvas.axes.plot(x_values, y_right, label=right_side.strip(), color='#ff7f0e', linewidth=2)
-
-                for sol in solutions:
-                    try:
-                        sol_val = float(sol)
-                        if x_min <= sol_val <= x_max:
-                            self.canvas.axes.axvline(x=sol_val, color='green', linestyle='--', linewidth=2,
-                                                     label=f'Solution: {sol_val:.2f}')
-                            self.canvas.axes.annotate(f"{sol_val:.2f}",
-                                                      xy=(sol_val, y_max*0.1),
-                                                      xytext=(sol_val, y_max*0.2),
-                                                      arrowprops=dict(arrowstyle="->", color='green'),
-                                                      color='green')
-                    except Exception:
-                        continue
-            else:
-                # Normal function plotting for the main expression
-                if scale_type == 'log':
-                    x_min = max(1e-10, x_min)
-                    x_values = np.logspace(np.log10(x_min), np.log10(x_max), 1000)
-                    self.canvas.axes.set_xscale('log')
-                else:
-                    x_values = np.linspace(x_min, x_max, 1000)
-
-                def advanced_eval(x, expr):
-                    try:
-                        math_funcs = {
-                            'ln': np.log,
-                            'log': np.log10,
-                            'sin': np.sin,
-                            'cos': np.cos,
-                            'tan': np.tan,
-                            'sqrt': np.sqrt,
-                            'exp': np.exp,
-                            'abs': np.abs,
-                            'sinh': np.sinh,
-                            'cosh': np.cosh,
-                            'tanh': np.tanh,
-                            'asin': np.arcsin,
-                            'acos': np.arccos,
-                            'atan': np.arctan,
-                            'sec': lambda l: 1 / np.cos(x),
-                            'csc': lambda l: 1 / np.sin(x),
-                            'cot': lambda l: 1 / np.tan(x),
-                            'gamma': special.gamma,
-                            'erf': special.erf,
-                            'erfc': special.erfc,
-                            'beta': special.beta,
-                            'factorial': special.factorial,
-                            'pi': np.pi,
-                            'e': np.e,
-                            'inf': np.inf,
-                            'golden': (1 + np.sqrt(5)) / 2
-                        }
-                        expr_sympy = parse_expr(expr, transformations=transformations)
-                        f = lambdify('x', expr_sympy, modules=['numpy', math_funcs])
-                        return f(x)
-                    except Exception as b:
-                        raise ValueError(f"Error evaluating expression: {str(b)}")
-                # Evaluate and plot the main expression
-                y_values = np.vectorize(lambda x: advanced_eval(x, expression))(x_values)
-                
-                # Check if fire mode is enabled
-                fire_mode = self.fire_mode_checkbox.isChecked()
-                millisecond_mode = self.millisecond_mode_checkbox.isChecked()
-                
-                # Handle millisecond mode for time-based plotting
-                if millisecond_mode:
-                    # Convert x-axis to millisecond timestamps
-                    start_time = time.time() * 1000  # current time in ms
-                    x_labels = [f"{start_time + (i * (x_max - x_min) / len(x_values)):.3f} ms" 
-                               for i in range(len(x_values))]
-                    self.canvas.axes.set_xlabel("Time (milliseconds)", fontsize=11, 
-                                               color='#ffa500' if fire_mode else '#ecf0f1')
-                
-                if np.iscomplexobj(y_values):
-                    if fire_mode:
-                        self.canvas.axes.plot(x_values, y_values.real, label=f"Re({expression})", 
-                                            linewidth=3, color='#ff4500')
-                        self.canvas.axes.plot(x_values, y_values.imag, label=f"Im({expression})", 
-                                            linewidth=3, linestyle='--', color='#ffa500')
-                    else:
-                        self.canvas.axes.plot(x_values, y_values.real, label=f"Re({expression})", 
-                                            linewidth=2.5, color='#3498db')
-                        self.canvas.axes.plot(x_values, y_values.imag, label=f"Im({expression})", 
-                                            linewidth=2.5, linestyle='--', color='#e74c3c')
-                else:
-                    mask = np.isfinite(y_values)
-                    x_values_filtered = x_values[mask]
-                    y_values_filtered = y_values[mask]
-                    
-                    if fire_mode:
-                        # Use fire gradient colors
-                        colors = self.calculator.create_fire_gradient_colors(len(x_values_filtered))
-                        for i in range(len(x_values_filtered) - 1):
-                            self.canvas.axes.plot(x_values_filtered[i:i+2], y_values_filtered[i:i+2], 
-                                                color=colors[i], linewidth=3, alpha=0.9)
-                        # Add a label for the legend (only once)
-                        self.canvas.axes.plot([], [], label=expression, linewidth=3, color='#ff4500')
-                    else:
-                        self.canvas.axes.plot(x_values_filtered, y_values_filtered, 
-                                            label=expression, linewidth=2.5, color='#3498db')
-
-                # If a second expression is provided, plot it as well
-                if second_expr:
-                    y2_values = np.vectorize(lambda x: advanced_eval(x, second_expr))(x_values_filtered if 'x_values_filtered' in locals() else x_values)
-                    if fire_mode:
-                        self.canvas.axes.plot(x_values_filtered if 'x_values_filtered' in locals() else x_values, 
-                                            y2_values, label=second_expr, linewidth=3, color='#ffa500')
-                    else:
-                        self.canvas.axes.plot(x_values_filtered if 'x_values_filtered' in locals() else x_values, 
-                                            y2_values, label=second_expr, linewidth=2.5, color='#e74c3c')
-                    # Compute intersections symbolically
-                    try:
-                        var_sym = symbols(variable)
-                        expr1 = parse_expr(expression, transformations=transformations)
-                        expr2 = parse_expr(second_expr, transformations=transformations)
-                        intersections = solve(expr1 - expr2, var_sym)
-                        for sol in intersections:
-                            try:
-                                sol_val = float(sol)
-                                if x_min <= sol_val <= x_max:
-                                    self.canvas.axes.axvline(x=sol_val, color='purple', linestyle='--', linewidth=2,
-                                                             label=f'Intersection: {sol_val:.2f}')
-                                    f1 = lambdify(var_sym, expr1, modules=['numpy'])
-                                    self.canvas.axes.annotate(f"{sol_val:.2f}",
-                                                              xy=(sol_val, f1(sol_val)),
-                                                              xytext=(sol_val, f1(sol_val)+0.5),
-                                                              arrowprops=dict(arrowstyle="->", color='purple'),
-                                                              color='purple')
-                            except Exception:
-                                continue
-                    except Exception as e:
-                        QMessageBox.critical(self, "Error", f"Error computing intersections: {str(e)}")
-
-            self.canvas.axes.set_xlim(x_min, x_max)
-            self.canvas.axes.set_ylim(y_min, y_max)
-            
-            # Get fire mode status for styling
-            fire_mode = self.fire_mode_checkbox.isChecked()
-            millisecond_mode = self.millisecond_mode_checkbox.isChecked()
-            
-            # Apply styling based on mode
-            label_color = '#ffa500' if fire_mode else '#ecf0f1'
-            if not millisecond_mode:
-                self.canvas.axes.set_xlabel(variable, fontsize=11, color=label_color, fontweight='bold')
-            self.canvas.axes.set_ylabel("y", fontsize=11, color=label_color, fontweight='bold')
-            
-            # Enhanced legend
-            legend = self.canvas.axes.legend(fontsize=10, facecolor='#2c3e50' if not fire_mode else '#3d0000',
-                                            edgecolor=label_color, loc='best')
-            legend.get_frame().set_alpha(0.9)
-            for text in legend.get_texts():
-                text.set_color(label_color)
-            
-            # Modern title with gradient effect simulation
-            title_text = f"Graph of {expression}"
-            if fire_mode:
-                title_text = f"🔥 {title_text} 🔥"
-            if millisecond_mode:
-                title_text = f"⏱️ {title_text}"
-            self.canvas.axes.set_title(title_text, pad=15, fontsize=13, 
-                                      color=label_color, fontweight='bold')
-            
-            # Enhanced axis lines
-            axis_color = '#ff4500' if fire_mode else '#3498db'
-            if x_min <= 0 <= x_max:
-                self.canvas.axes.axvline(x=0, color=axis_color, linestyle='-', alpha=0.4, linewidth=2)
-            if y_min <= 0 <= y_max:
-                self.canvas.axes.axhline(y=0, color=axis_color, linestyle='-', alpha=0.4, linewidth=2)
-            
-            self.canvas.axes.grid(True, which='both', linestyle='--', alpha=0.3)
-            self.canvas.draw()
-            
             # Update status bar
-            if fire_mode:
+            if data['mode'] == 'equation' and not data['solutions']:
+                self.statusBar().showMessage("No solution in range", 4000)
+            elif self.fire_mode_checkbox.isChecked():
                 self.statusBar().showMessage("🔥 Fire Mode Plot Complete!", 2000)
-            elif millisecond_mode:
+            elif self.millisecond_mode_checkbox.isChecked():
                 self.statusBar().showMessage("⏱️ Millisecond Mode Plot Complete!", 2000)
             else:
                 self.statusBar().showMessage("✓ Plot Complete!", 2000)
+            return data
         except ValueError as e:
             QMessageBox.critical(self, "Error", f"Error plotting graph: {str(e)}")
         except Exception as e:
             QMessageBox.critical(self, "Error", f"Unexpected error: {str(e)}")
+
+    def queue_depths(self):
+        """Outstanding work per background queue, for the metrics registry"""
+        return {('database',): self.db.pending(),
+                ('thumbnails',): len(self.pending_thumbnails),
+                ('live_plot',): self.plot_pool.activeThreadCount()}
+
+    def render_plot(self, data, live=False):
+        """Draw a plot computed by GraphingCalculator.compute_plot"""
+        with PLOT_STAGE_SECONDS.time(stage='render_live' if live else 'render'):
+            self._render_plot(data, live)
+
+    def _render_plot(self, data, live=False):
+        axes = self.canvas.axes
+        self.live_artists = []
+        self.live_background = None
+        axes.clear()
+        axes.grid(True, linestyle='--', alpha=0.5)
+        self.plotted_lines = {}
+
+        x_values = data['x']
+        x_min, x_max = data['x_min'], data['x_max']
+        y_min = self.min_value.value()  # For simplicity, reusing for y-axis
+        y_max = self.max_value.value()
+        expression = data['expression']
+        variable = data['variable']
+        curves = {role: (label, values) for role, label, values in data['curves']}
+
+        # Get fire mode status for styling
+        fire_mode = self.fire_mode_checkbox.isChecked()
+        millisecond_mode = self.millisecond_mode_checkbox.isChecked()
+
+        if data['log_scale']:
+            axes.set_xscale('log')
+
+        if data['mode'] == 'equation':
+            for role, color in (('left', '#1f77b4'), ('right', '#ff7f0e')):
+                label, values = curves[role]
+                self.plotted_lines[role], = axes.plot(x_values, values, label=label, color=color, linewidth=2)
+            for sol_val in data['solutions']:
+                axes.axvline(x=sol_val, color='green', linestyle='--', linewidth=2,
+                             label=f'Solution: {sol_val:.2f}')
+                axes.annotate(f"{sol_val:.2f}",
+                              xy=(sol_val, y_max*0.1),
+                              xytext=(sol_val, y_max*0.2),
+                              arrowprops=dict(arrowstyle="->", color='green'),
+                              color='green')
+        else:
+            # Handle millisecond mode for time-based plotting
+            if millisecond_mode:
+                axes.set_xlabel("Time (milliseconds)", fontsize=11,
+                                color='#ffa500' if fire_mode else '#ecf0f1')
+
+            if 'real' in curves:
+                real_label, real_values = curves['real']
+                imag_label, imag_values = curves['imag']
+                if fire_mode:
+                    axes.plot(x_values, real_values, label=real_label, linewidth=3, color='#ff4500')
+                    axes.plot(x_values, imag_values, label=imag_label, linewidth=3, linestyle='--', color='#ffa500')
+                else:
+                    self.plotted_lines['real'], = axes.plot(x_values, real_values, label=real_label,
+                                                            linewidth=2.5, color='#3498db')
+                    self.plotted_lines['imag'], = axes.plot(x_values, imag_values, label=imag_label,
+                                                            linewidth=2.5, linestyle='--', color='#e74c3c')
+            else:
+                label, y_values = curves['main']
+                if fire_mode:
+                    # Use fire gradient colors, one segment per sample interval
+                    colors = self.calculator.create_fire_gradient_colors(len(x_values))
+                    points = np.column_stack([x_values, y_values])
+                    segments = np.stack([points[:-1], points[1:]], axis=1)
+                    axes.add_collection(LineCollection(segments, colors=colors[:-1], linewidths=3, alpha=0.9))
+                    # Add a label for the legend (only once)
+                    axes.plot([], [], label=label, linewidth=3, color='#ff4500')
+                else:
+                    self.plotted_lines['main'], = axes.plot(x_values, y_values, label=label,
+                                                            linewidth=2.5, color='#3498db')
+
+                # Derivative / integral overlays reuse the samples computed above
+                for key, values in data['overlays'].items():
+                    overlay_label, color, fire_color = OVERLAY_STYLES[key]
+                    self.plotted_lines[key], = axes.plot(x_values, values, label=overlay_label, linewidth=2,
+                                                         linestyle=':', color=fire_color if fire_mode else color)
+
+            # If a second expression is provided, plot it as well
+            if 'second' in curves:
+                label, y2_values = curves['second']
+                if fire_mode:
+                    axes.plot(x_values, y2_values, label=label, linewidth=3, color='#ffa500')
+                else:
+                    self.plotted_lines['second'], = axes.plot(x_values, y2_values, label=label,
+                                                              linewidth=2.5, color='#e74c3c')
+                for sol_val, sol_y in data['intersections']:
+                    axes.axvline(x=sol_val, color='purple', linestyle='--', linewidth=2,
+                                 label=f'Intersection: {sol_val:.2f}')
+                    axes.annotate(f"{sol_val:.2f}",
+                                  xy=(sol_val, sol_y),
+                                  xytext=(sol_val, sol_y+0.5),
+                                  arrowprops=dict(arrowstyle="->", color='purple'),
+                                  color='purple')
+
+        axes.set_xlim(x_min, x_max)
+        axes.set_ylim(y_min, y_max)
+
+        # Apply styling based on mode
+        label_color = '#ffa500' if fire_mode else '#ecf0f1'
+        if not millisecond_mode:
+            axes.set_xlabel(variable, fontsize=11, color=label_color, fontweight='bold')
+        axes.set_ylabel("y", fontsize=11, color=label_color, fontweight='bold')
+
+        # Enhanced legend
+        legend = axes.legend(fontsize=10, facecolor='#2c3e50' if not fire_mode else '#3d0000',
+                             edgecolor=label_color, loc='best')
+        legend.get_frame().set_alpha(0.9)
+        for text in legend.get_texts():
+            text.set_color(label_color)
+
+        axes.set_title(self.plot_title(expression), pad=15, fontsize=13,
+                       color=label_color, fontweight='bold')
+
+        # Enhanced axis lines
+        axis_color = '#ff4500' if fire_mode else '#3498db'
+        if x_min <= 0 <= x_max:
+            axes.axvline(x=0, color=axis_color, linestyle='-', alpha=0.4, linewidth=2)
+        if y_min <= 0 <= y_max:
+            axes.axhline(y=0, color=axis_color, linestyle='-', alpha=0.4, linewidth=2)
+
+        axes.grid(True, which='both', linestyle='--', alpha=0.3)
+        if live and not fire_mode:
+            # Later keystrokes with the same layout only redraw these over a cached background
+            self.live_artists = list(self.plotted_lines.values()) + [legend, axes.title]
+            for artist in self.live_artists:
+                artist.set_animated(True)
+            self.live_signature = self.plot_signature(data)
+        self.canvas.draw()
+
+    def plot_title(self, expression):
+        # Modern title with gradient effect simulation
+        title_text = f"Graph of {expression}"
+        if self.fire_mode_checkbox.isChecked():
+            title_text = f"🔥 {title_text} 🔥"
+        if self.millisecond_mode_checkbox.isChecked():
+            title_text = f"⏱️ {title_text}"
+        return title_text
+
+    def plot_signature(self, data):
+        """Everything besides curve values and labels that decides how a plot is laid out"""
+        return (data['mode'], tuple(role for role, label, values in data['curves']),
+                tuple(sorted(data['overlays'])), data['log_scale'], data['x_min'], data['x_max'],
+                data['variable'], self.min_value.value(), self.max_value.value(),
+                self.fire_mode_checkbox.isChecked(), self.millisecond_mode_checkbox.isChecked())
+
+    def on_canvas_draw(self, event):
+        """After a full redraw, keep the background for blitting and paint the live artists on top"""
+        if not self.live_artists:
+            return
+        self.live_background = self.canvas.copy_from_bbox(self.canvas.figure.bbox)
+        for artist in self.live_artists:
+            self.canvas.axes.draw_artist(artist)
+
+    def update_live_plot(self, data):
+        """Blit new curve data over the cached background; False when a full render is needed"""
+        if self.live_background is None or self.plot_signature(data) != self.live_signature:
+            return False
+        with PLOT_STAGE_SECONDS.time(stage='blit'):
+            self._blit_live_plot(data)
+        return True
+
+    def _blit_live_plot(self, data):
+        curves = {role: (label, values) for role, label, values in data['curves']}
+        for role, line in self.plotted_lines.items():
+            if role in curves:
+                label, values = curves[role]
+            else:
+                label, values = OVERLAY_STYLES[role][0], data['overlays'][role]
+            line.set_data(data['x'], values)
+            line.set_label(label)
+        legend = self.live_artists[-2]
+        for text, line in zip(legend.get_texts(), self.plotted_lines.values()):
+            text.set_text(line.get_label())
+        title = self.live_artists[-1]
+        title.set_text(self.plot_title(data['expression']))
+        self.canvas.restore_region(self.live_background)
+        for artist in self.live_artists:
+            self.canvas.axes.draw_artist(artist)
+        self.canvas.blit(self.canvas.figure.bbox)
+
+    def schedule_live_plot(self):
+        """Restart the debounce timer after each edit of the expression inputs"""
+        if self.live_plot_checkbox.isChecked():
+            self.live_plot_timer.start()
+
+    def start_live_plot(self):
+        """Evaluate the current input on the plot worker, superseding any queued job"""
+        spec = self.current_plot_spec(solve_equations=False)
+        if spec is None:
+            return
+        self.live_plot_generation += 1
+        self.plot_pool.clear()
+        self.live_plot_spec = spec
+        self.plot_pool.start(PlotWorker(self.calculator, spec, self.live_plot_generation, self.plot_signals))
+
+    def on_live_plot_ready(self, generation, data):
+        if generation != self.live_plot_generation:
+            return  # a newer keystroke or an explicit plot has superseded this one
+        try:
+            if not self.update_live_plot(data):
+                self.render_plot(data, live=True)
+            self.last_plot = (self.live_plot_spec, data)
+        except Exception as e:
+            logging.debug(f"Skipping live plot: {str(e)}")
     # ---------------------------------------------------------------------
 
     def save_graph(self):
@@ -1243,12 +1727,11 @@ class MainWindow(QMainWindow):
                  'y_max': self.max_value.value(),
                 'scale_type': self.scale_type.currentText().lower()
             }
-            db = AdvancedDatabase()
             print(f"Debug - User ID: {self.current_user.id}")
             print(f"Debug - Graph Data: {graph_data}")
-            db.save_graph_state(self.current_user.id, graph_data)
-            self.update_history()
-            QMessageBox.information(self, "Success", "Graph saved successfully!")
+            self.db.save_graph_state(
+                self.current_user.id, graph_data, callback=self.on_graph_saved,
+                errback=lambda e: QMessageBox.critical(self, "Error", f"Error saving graph: {str(e)}"))
         except AttributeError as e:
             QMessageBox.critical(self, "Error",
                                  "Some graph properties are not properly initialized. Please check all values.")
@@ -1257,6 +1740,10 @@ class MainWindow(QMainWindow):
             QMessageBox.critical(self, "Error", f"Error saving graph: {str(e)}")
             print(f"Debug - General Error: {str(e)}")
 
+    def on_graph_saved(self, graph_id):
+        self.update_history()
+        QMessageBox.information(self, "Success", "Graph saved successfully!")
+
     def add_comment(self):
         if not self.current_user or self.current_user.role != 'teacher':
             QMessageBox.warning(self, "Error", "Only teachers can add comments")
@@ -1264,22 +1751,37 @@ class MainWindow(QMainWindow):
         comment_text = self.comment_input.toPlainText().strip()
         if not comment_text:
             return
-        selected_items = self.student_graph_list.selectedItems()
-        if not selected_items:
-            QMessageBox.warning(self, "Error", "Please select a graph to comment on")
-            return
         try:
-            graph_name = selected_items[0].text()
-            graph_data = self.student_graph_data[graph_name]
-            db = AdvancedDatabase()
-            db.add_comment(graph_data['id'], self.current_user.id, comment_text)
-            self.comment_input.clear()
-            self.update_comments(graph_name)
-            QMessageBox.information(self, "Success", "Comment added successfully!")
+            graph_ids = []
+            for item in self.student_graph_list.selectedItems():
+                graph_data = self.graph_for_item(item)
+                if graph_data and graph_data.get('id') and graph_data['id'] not in graph_ids:
+                    graph_ids.append(graph_data['id'])
+            if not graph_ids:
+                QMessageBox.warning(self, "Error", "Please select a graph to comment on")
+                return
+            # One transaction for every selected graph, however many there are
+            self.db.add_comments(
+                [(graph_id, self.current_user.id, comment_text) for graph_id in graph_ids],
+                callback=lambda result: self.on_comment_added(graph_ids),
+                errback=lambda e: QMessageBox.critical(self, "Error", f"Error adding comment: {str(e)}"))
         except Exception as e:
             QMessageBox.critical(self, "Error", f"Error adding comment: {str(e)}")
 
+    def on_comment_added(self, graph_ids):
+        self.comment_input.clear()
+        current = self.student_graph_list.currentItem()
+        graph_data = self.graph_for_item(current) if current else None
+        self.update_comments(graph_data['id'] if graph_data and graph_data.get('id') in graph_ids else graph_ids[0])
+        self.refresh_student_summaries()
+        if len(graph_ids) == 1:
+            QMessageBox.information(self, "Success", "Comment added successfully!")
+        else:
+            QMessageBox.information(self, "Success", f"Comment added to {len(graph_ids)} graphs!")
+
 def main():
+    metrics.configure_from_env()
+    query_profiler.configure_from_env()
     app = QApplication(sys.argv)
     calculator = GraphingCalculator()
     window = MainWindow(calculator)
@@ -0,0 +1,277 @@
+# metrics.py
+"""
+In-process metrics in the Prometheus text format.
+
+Modules declare counters, gauges and histograms on REGISTRY at import time and
+update them as they work. Nothing is recorded until the registry is enabled,
+which happens when it is exported:
+
+    CALCULATOR_METRICS_PORT=9464 python main.py      # http://127.0.0.1:9464/metrics
+    CALCULATOR_METRICS_FILE=metrics.prom python main.py  # rewritten every 15 s
+
+While disabled every update returns after a single attribute check.
+"""
+import bisect
+import logging
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs += [f'{name}="{_escape(value)}"' for name, value in extra]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = 'untyped'
+
+    def __init__(self, registry, name, help_text, labelnames=()):
+        self.registry = registry
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def header(self):
+        return [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        if not self.registry.enabled:
+            return
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self):
+        with self.lock:
+            items = sorted(self.values.items())
+        return self.header() + [f'{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}'
+                                for key, value in items]
+
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        if not self.registry.enabled:
+            return
+        with self.lock:
+            self.values[self._key(labels)] = value
+
+
+class CallbackGauge(_Metric):
+    """A gauge (or counter) whose value is read from a function at export time"""
+
+    def __init__(self, registry, name, help_text, function, kind='gauge', labelnames=()):
+        super().__init__(registry, name, help_text, labelnames)
+        self.function = function
+        self.kind = kind
+
+    def render(self):
+        try:
+            value = self.function()
+        except Exception as e:
+            logging.debug(f"Metric {self.name} unavailable: {str(e)}")
+            return []
+        # A function can report several label sets as {label values tuple: value}
+        items = sorted(value.items()) if isinstance(value, dict) else [((), value)]
+        return self.header() + [f'{self.name}{_format_labels(self.labelnames, key)} {_format_value(v)}'
+                                for key, v in items]
+
+
+class _Timer:
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+        return False
+
+
+class _NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, registry, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(registry, name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        if not self.registry.enabled:
+            return
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            entry = self.values.get(key)
+            if entry is None:
+                entry = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def time(self, **labels):
+        """Context manager observing the duration of its block"""
+        if not self.registry.enabled:
+            return _NULL_TIMER
+        return _Timer(self, labels)
+
+    def render(self):
+        with self.lock:
+            items = sorted((key, (list(entry[0]), entry[1], entry[2])) for key, entry in self.values.items())
+        lines = self.header()
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames, key, [('le', _format_value(bound))])
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f'{self.name}_sum{labels} {_format_value(total)}')
+            lines.append(f'{self.name}_count{labels} {count}')
+        return lines
+
+
+class Registry:
+    """Named metrics, exported together; updates are ignored until enabled"""
+
+    def __init__(self):
+        self.enabled = False
+        self.metrics = {}
+        self.lock = threading.Lock()
+
+    def _register(self, cls, name, *args, **kwargs):
+        with self.lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = self.metrics[name] = cls(self, name, *args, **kwargs)
+            return metric
+
+    def counter(self, name, help_text, labelnames=()):
+        return self._register(Counter, name, help_text, labelnames)
+
+    def gauge(self, name, help_text, labelnames=()):
+        return self._register(Gauge, name, help_text, labelnames)
+
+    def histogram(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram, name, help_text, labelnames, buckets)
+
+    def callback(self, name, help_text, function, kind='gauge', labelnames=()):
+        """Export function()'s value as name; registering the name again replaces the function"""
+        with self.lock:
+            self.metrics[name] = CallbackGauge(self, name, help_text, function, kind, labelnames)
+            return self.metrics[name]
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format"""
+        with self.lock:
+            metrics = [self.metrics[name] for name in sorted(self.metrics)]
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+        body = REGISTRY.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_http_server(port, host='127.0.0.1'):
+    """Enable the registry and serve it at http://host:port/metrics from a daemon thread"""
+    REGISTRY.enabled = True
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='metrics-http', daemon=True).start()
+    logging.info(f"Serving metrics on http://{host}:{server.server_port}/metrics")
+    return server
+
+
+def write_file(path):
+    """Atomically replace path with the current metrics"""
+    tmp_path = path + '.part'
+    with open(tmp_path, 'w') as f:
+        f.write(REGISTRY.render())
+    os.replace(tmp_path, path)
+
+
+def start_file_writer(path, interval=15.0):
+    """Enable the registry and rewrite path every interval seconds (e.g. for node_exporter's textfile collector)"""
+    REGISTRY.enabled = True
+    stop = threading.Event()
+
+    def run():
+        while not stop.wait(interval):
+            try:
+                write_file(path)
+            except OSError as e:
+                logging.error(f"Error writing metrics to {path}: {str(e)}")
+
+    threading.Thread(target=run, name='metrics-file', daemon=True).start()
+    return stop
+
+
+def configure_from_env(environ=os.environ):
+    """Start the exporters requested by CALCULATOR_METRICS_PORT / CALCULATOR_METRICS_FILE"""
+    port = environ.get('CALCULATOR_METRICS_PORT')
+    if port:
+        try:
+            start_http_server(int(port))
+        except (OSError, ValueError) as e:
+            logging.error(f"Could not start metrics server on port {port}: {str(e)}")
+    path = environ.get('CALCULATOR_METRICS_FILE')
+    if path:
+        interval = float(environ.get('CALCULATOR_METRICS_INTERVAL', 15))
+        start_file_writer(path, interval)
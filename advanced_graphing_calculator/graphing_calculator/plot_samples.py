@@ -0,0 +1,64 @@
+# plot_samples.py
+import hashlib
+import io
+import json
+
+import numpy as np
+
+import expression_engine
+
+# Spec fields that change what compute_plot returns, besides the expression itself,
+# which the database keys samples by (its content hash, so equal expressions share them)
+SPEC_FIELDS = ('second_expr', 'variable', 'x_min', 'x_max', 'scale_type',
+               'overlays', 'solve_equations', 'num_points')
+
+
+def param_hash(spec, precision='float64'):
+    """Hash of the other compute_plot arguments (and sample precision) a stored plot was made with"""
+    key = {field: spec.get(field) for field in SPEC_FIELDS}
+    key['overlays'] = sorted(key['overlays'] or ())
+    key['num_points'] = key['num_points'] or 1000
+    key['precision'] = precision
+    return hashlib.sha1(json.dumps(key, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def encode(data):
+    """Pack a compute_plot result into a compressed blob: float arrays as-is, the rest as JSON"""
+    arrays = {'x': np.asarray(data['x'])}
+    for i, (_, _, values) in enumerate(data['curves']):
+        arrays[f'curve_{i}'] = np.asarray(values)
+    for key, values in data['overlays'].items():
+        arrays[f'overlay_{key}'] = np.asarray(values)
+    meta = {key: value for key, value in data.items() if key not in ('x', 'curves', 'overlays')}
+    meta['curves'] = [(role, label) for role, label, _ in data['curves']]
+    meta['overlays'] = list(data['overlays'])
+    meta['engine_version'] = expression_engine.ENGINE_VERSION
+    arrays['meta'] = np.frombuffer(json.dumps(meta).encode('utf-8'), dtype=np.uint8)
+    buffer = io.BytesIO()
+    np.savez_compressed(buffer, **arrays)
+    return buffer.getvalue()
+
+
+def relabel(data, expression):
+    """Label decoded samples, possibly computed for another spelling of the expression, as compute_plot would"""
+    data['expression'] = expression
+    if data.get('mode') == 'equation':
+        left, right = expression.split('=', 1)
+        labels = {'left': left.strip(), 'right': right.strip()}
+    else:
+        labels = {'main': expression, 'real': f"Re({expression})", 'imag': f"Im({expression})"}
+    data['curves'] = [(role, labels.get(role, label), values) for role, label, values in data['curves']]
+    return data
+
+
+def decode(blob):
+    """Rebuild the compute_plot result stored by encode"""
+    with np.load(io.BytesIO(blob), allow_pickle=False) as stored:
+        meta = json.loads(stored['meta'].tobytes().decode('utf-8'))
+        data = dict(meta)
+        data['x'] = stored['x']
+        data['curves'] = [(role, label, stored[f'curve_{i}'])
+                          for i, (role, label) in enumerate(meta['curves'])]
+        data['overlays'] = {key: stored[f'overlay_{key}'] for key in meta['overlays']}
+    data['intersections'] = [tuple(point) for point in meta['intersections']]
+    return data
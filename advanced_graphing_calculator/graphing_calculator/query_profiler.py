@@ -0,0 +1,278 @@
+# query_profiler.py
+"""
+Statement-level profiling for AdvancedDatabase.
+
+Connections opened with a QueryProfiler use ProfiledConnection, whose cursors
+time every statement from execute() until its result set is exhausted (or the
+cursor is reused or closed). For each statement the profiler records the SQL,
+the shape of its bound parameters (types only, never values), the duration,
+rows returned or changed, and the SQLite VM steps taken, counted through the
+progress handler, as a measure of rows scanned. Statements slower than the
+threshold go to the 'calculator.slow_queries' logger with their
+EXPLAIN QUERY PLAN.
+
+    CALCULATOR_SLOW_QUERY_MS=50 CALCULATOR_SLOW_QUERY_LOG=slow.log python app.py
+"""
+import atexit
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import weakref
+
+# The progress handler fires every this many SQLite VM instructions
+PROGRESS_STEPS = 100
+
+slow_log = logging.getLogger('calculator.slow_queries')
+
+# Profiler used by AdvancedDatabase instances created without one
+DEFAULT = None
+
+_IN_LIST = re.compile(r'\bIN\s*\(\s*\?(\s*,\s*\?)*\s*\)', re.IGNORECASE)
+
+
+def normalize(sql):
+    """Statement text with whitespace collapsed and IN (?, ?, ...) lists folded to one entry"""
+    return _IN_LIST.sub('IN (?, ...)', ' '.join(sql.split()))
+
+
+def parameter_shape(parameters):
+    """Types of the bound parameters, e.g. '(int, str)' or '{name: str}'"""
+    if isinstance(parameters, dict):
+        return '{' + ', '.join(f'{key}: {type(value).__name__}' for key, value in parameters.items()) + '}'
+    parameters = tuple(parameters or ())
+    if len(parameters) > 8 and len({type(value) for value in parameters}) == 1:
+        return f'({type(parameters[0]).__name__} x {len(parameters)})'
+    return '(' + ', '.join(type(value).__name__ for value in parameters) + ')'
+
+
+class StatementStats:
+    __slots__ = ('calls', 'total', 'max', 'rows', 'steps', 'shapes')
+
+    def __init__(self):
+        self.calls = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.rows = 0
+        self.steps = 0
+        self.shapes = set()
+
+
+class QueryProfiler:
+    """Aggregates per-statement timings and logs the slow ones"""
+    def __init__(self, slow_threshold_ms=100.0, explain=True):
+        self.slow_threshold = slow_threshold_ms / 1000.0
+        self.explain = explain
+        self.statements = {}  # normalized SQL -> StatementStats
+        self.slow_count = 0
+        self.lock = threading.Lock()
+
+    def connect(self, db_file, **kwargs):
+        """sqlite3.connect returning a ProfiledConnection that reports to this profiler"""
+        conn = sqlite3.connect(db_file, factory=ProfiledConnection, **kwargs)
+        conn.profiler = self
+        return conn
+
+    def record(self, conn, sql, parameters, duration, rows, steps):
+        key = normalize(sql)
+        with self.lock:
+            stats = self.statements.get(key)
+            if stats is None:
+                stats = self.statements[key] = StatementStats()
+            stats.calls += 1
+            stats.total += duration
+            stats.max = max(stats.max, duration)
+            stats.rows += max(rows, 0)
+            stats.steps += steps
+            stats.shapes.add(parameter_shape(parameters))
+        if duration >= self.slow_threshold:
+            with self.lock:
+                self.slow_count += 1
+            plan = self.query_plan(conn, sql, parameters) if self.explain else ''
+            slow_log.warning(f"Slow query ({duration * 1000:.1f} ms, {rows} rows, {steps} steps, "
+                             f"params {parameter_shape(parameters)}): {key}{plan}")
+
+    def query_plan(self, conn, sql, parameters):
+        """EXPLAIN QUERY PLAN of sql as indented text, or '' if it cannot be explained"""
+        if not sql.lstrip().upper().startswith(('SELECT', 'WITH', 'INSERT', 'UPDATE', 'DELETE', 'REPLACE')):
+            return ''
+        try:
+            # A plain cursor, so explaining is not profiled itself
+            cursor = sqlite3.Cursor(conn)
+            rows = cursor.execute('EXPLAIN QUERY PLAN ' + sql, parameters).fetchall()
+            cursor.close()
+        except sqlite3.Error as e:
+            return f"\n    (no plan: {str(e)})"
+        depth = {0: 0}
+        lines = []
+        for node_id, parent, _, detail in rows:
+            depth[node_id] = depth.get(parent, 0) + 1
+            lines.append('    ' + '  ' * depth[node_id] + detail)
+        return '\n' + '\n'.join(lines)
+
+    def top_statements(self, limit=10, key='total'):
+        """(sql, StatementStats) pairs, largest first by total, max, calls, rows or steps"""
+        with self.lock:
+            items = list(self.statements.items())
+        items.sort(key=lambda item: getattr(item[1], key), reverse=True)
+        return items[:limit]
+
+    def report(self, limit=10):
+        """Text table of the statements with the most total time"""
+        lines = [f"{'calls':>7} {'total ms':>10} {'mean ms':>9} {'max ms':>9} {'rows':>9} {'steps':>10}  statement"]
+        for sql, stats in self.top_statements(limit):
+            lines.append(f"{stats.calls:>7} {stats.total * 1000:>10.1f} {stats.total * 1000 / stats.calls:>9.2f} "
+                         f"{stats.max * 1000:>9.2f} {stats.rows:>9} {stats.steps:>10}  {sql[:120]}")
+        return '\n'.join(lines)
+
+    def reset(self):
+        with self.lock:
+            self.statements.clear()
+            self.slow_count = 0
+
+
+class ProfiledCursor(sqlite3.Cursor):
+    """Cursor that reports each statement to the connection's profiler once its results are consumed"""
+    _pending = None
+
+    def execute(self, sql, parameters=()):
+        self._finish()
+        conn = self.connection
+        steps = conn.steps
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self._pending = [sql, parameters, time.perf_counter() - start, 0, steps]
+            if self.description is None:
+                self._finish()  # no result set to wait for
+
+    def executemany(self, sql, seq_of_parameters):
+        self._finish()
+        seq_of_parameters = list(seq_of_parameters)
+        steps = self.connection.steps
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            self._pending = [sql, seq_of_parameters[0] if seq_of_parameters else (),
+                             time.perf_counter() - start, 0, steps]
+            self._finish()
+
+    def _fetched(self, start, rows, exhausted):
+        pending = self._pending
+        if pending is not None:
+            pending[2] += time.perf_counter() - start
+            pending[3] += rows
+            if exhausted:
+                self._finish()
+
+    def fetchone(self):
+        start = time.perf_counter()
+        row = super().fetchone()
+        self._fetched(start, row is not None, row is None)
+        return row
+
+    def fetchmany(self, size=None):
+        size = self.arraysize if size is None else size
+        start = time.perf_counter()
+        rows = super().fetchmany(size)
+        self._fetched(start, len(rows), len(rows) < size)
+        return rows
+
+    def fetchall(self):
+        start = time.perf_counter()
+        rows = super().fetchall()
+        self._fetched(start, len(rows), True)
+        return rows
+
+    def __next__(self):
+        start = time.perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self._fetched(start, 0, True)
+            raise
+        self._fetched(start, 1, False)
+        return row
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def __del__(self):
+        # One-off cursors (conn.execute(...).fetchone()) are dropped without being exhausted
+        try:
+            self._finish()
+        except Exception:
+            pass
+
+    def _finish(self):
+        pending, self._pending = self._pending, None
+        if pending is None:
+            return
+        sql, parameters, duration, rows, steps = pending
+        conn = self.connection
+        if self.description is None:
+            rows = self.rowcount
+        conn.profiler.record(conn, sql, parameters, duration, rows, conn.steps - steps)
+
+
+class ProfiledConnection(sqlite3.Connection):
+    """Connection whose cursors are ProfiledCursors; VM steps are counted by the progress handler"""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.profiler = None
+        self.steps = 0
+        self._cursors = weakref.WeakSet()
+        self.set_progress_handler(self._progress, PROGRESS_STEPS)
+
+    def _progress(self):
+        self.steps += PROGRESS_STEPS
+        return 0
+
+    def cursor(self, factory=ProfiledCursor):
+        cursor = super().cursor(factory)
+        if isinstance(cursor, ProfiledCursor):
+            self._cursors.add(cursor)
+        return cursor
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def _finish_cursors(self):
+        for cursor in list(self._cursors):
+            cursor._finish()
+
+    def commit(self):
+        self._finish_cursors()
+        super().commit()
+
+    def close(self):
+        self._finish_cursors()
+        super().close()
+
+
+def configure_from_env(environ=os.environ):
+    """Install a DEFAULT profiler when CALCULATOR_SLOW_QUERY_MS is set; log its report at exit"""
+    global DEFAULT
+    threshold = environ.get('CALCULATOR_SLOW_QUERY_MS')
+    if not threshold:
+        return None
+    try:
+        DEFAULT = QueryProfiler(float(threshold))
+    except ValueError:
+        logging.error(f"Invalid CALCULATOR_SLOW_QUERY_MS: {threshold}")
+        return None
+    path = environ.get('CALCULATOR_SLOW_QUERY_LOG')
+    if path:
+        handler = logging.FileHandler(path)
+        handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+        slow_log.addHandler(handler)
+    atexit.register(lambda: slow_log.warning("Top statements by total time:\n" + DEFAULT.report()))
+    return DEFAULT
@@ -0,0 +1,146 @@
+# startup_benchmark.py
+"""
+Time from login to a usable main window, on Qt's offscreen platform.
+
+Each run calls CalculatorApp.handle_login with a fresh MainWindow, like the
+first login of a session, and records two points: shown (the window is built,
+visible and painted) and loaded (the role's student list or graph list has
+arrived from the database as well). A synthetic class from dataset_generator
+is used unless --db is given; either way the runs work on a temporary copy.
+
+    python startup_benchmark.py --runs 20
+    python startup_benchmark.py --db big.db --role teacher --json after.json
+"""
+import argparse
+import json
+import os
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+from app import CalculatorApp
+from auth_system import User
+import dataset_generator
+
+
+def first_user(db_file, role):
+    """The role's user with the lowest id"""
+    conn = sqlite3.connect(db_file)
+    try:
+        row = conn.execute('''
+            SELECT id, username, role, full_name, email FROM users
+            WHERE role = ? ORDER BY id LIMIT 1
+        ''', (role,)).fetchone()
+    finally:
+        conn.close()
+    if row is None:
+        raise ValueError(f"No {role} in {db_file}")
+    return User(row[1], '', row[2], row[3], row[4], row[0])
+
+
+def time_login(calculator_app, user, timeout=30.0):
+    """(shown, loaded) seconds for one login with a new main window"""
+    app = calculator_app.app
+    calculator_app.main_window = None
+    start = time.perf_counter()
+    calculator_app.handle_login(user)
+    window = calculator_app.main_window
+    app.processEvents()
+    shown = time.perf_counter() - start
+    deadline = start + timeout
+    while window.db.pending() and time.perf_counter() < deadline:
+        app.processEvents()
+        time.sleep(0.0005)
+    # Deliver the last results to their callbacks
+    app.processEvents()
+    loaded = time.perf_counter() - start
+    window.change_watcher.stop()
+    settle(app, window)
+    window.close()
+    window.deleteLater()
+    app.processEvents()
+    return shown, loaded
+
+
+def settle(app, window):
+    """Let background previews and their database saves finish so they don't overlap the next run"""
+    idle_rounds = 0
+    while idle_rounds < 3:
+        window.thumbnail_pool.waitForDone()
+        app.processEvents()
+        busy = window.db.pending() or window.thumbnail_pool.activeThreadCount()
+        idle_rounds = 0 if busy else idle_rounds + 1
+        time.sleep(0.001)
+
+
+def summarize(times):
+    times_ms = [t * 1000 for t in times]
+    return {
+        'first_ms': times_ms[0],
+        'median_ms': statistics.median(times_ms[1:] or times_ms),
+        'min_ms': min(times_ms)
+    }
+
+
+def run(db_file, roles, runs):
+    """Results per role: first-run and warm median/min for shown and loaded"""
+    # MainWindow opens calculator.db in the working directory
+    os.chdir(os.path.dirname(db_file))
+    calculator_app = CalculatorApp()
+    results = {}
+    for role in roles:
+        user = first_user(db_file, role)
+        shown, loaded = zip(*(time_login(calculator_app, user) for _ in range(runs)))
+        results[role] = {'shown': summarize(shown), 'loaded': summarize(loaded)}
+    return results
+
+
+def format_report(results):
+    lines = [f"{'role':<10} {'point':<8} {'first ms':>10} {'median ms':>10} {'min ms':>10}"]
+    for role, points in results.items():
+        for point, stats in points.items():
+            lines.append(f"{role:<10} {point:<8} {stats['first_ms']:>10.1f} "
+                         f"{stats['median_ms']:>10.1f} {stats['min_ms']:>10.1f}")
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark login to a usable main window (offscreen)")
+    parser.add_argument('--db', help="Database to copy (default: a generated class)")
+    parser.add_argument('--students', type=int, default=200, help="Students in the generated class")
+    parser.add_argument('--graphs', type=float, default=20, help="Mean graphs per generated student")
+    parser.add_argument('--role', choices=('teacher', 'student', 'both'), default='both')
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--json', help="Also write the results to this file")
+    args = parser.parse_args()
+
+    json_path = os.path.abspath(args.json) if args.json else None
+    workdir = tempfile.mkdtemp(prefix='startup-benchmark-')
+    try:
+        db_file = os.path.join(workdir, 'calculator.db')
+        if args.db:
+            shutil.copyfile(args.db, db_file)
+        else:
+            dataset_generator.generate(db_file, students=args.students, graphs_per_student=args.graphs)
+        roles = ('teacher', 'student') if args.role == 'both' else (args.role,)
+        try:
+            results = run(db_file, roles, max(args.runs, 1))
+        except ValueError as e:
+            print(str(e), file=sys.stderr)
+            return 1
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    print(format_report(results))
+    if json_path:
+        with open(json_path, 'w') as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,100 @@
+# thumbnails.py
+import hashlib
+import struct
+import zlib
+
+import numpy as np
+
+import expression_engine
+
+THUMBNAIL_WIDTH = 96
+THUMBNAIL_HEIGHT = 48
+LINE_COLOR = (52, 152, 219)
+SECOND_LINE_COLOR = (255, 127, 14)  # right side of an equation, as in the main plot
+AXIS_COLOR = (236, 240, 241)
+
+# Bump whenever previews would be drawn differently; stored ones are then redrawn
+THUMBNAIL_VERSION = 2
+
+
+def param_hash(graph_data):
+    """Hash of the view settings of a saved graph; the database keys previews by expression too"""
+    key = "|".join([str(THUMBNAIL_VERSION)] + [str(graph_data.get(field)) for field in
+                                               ('variable', 'x_min', 'x_max', 'scale_type')])
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+def encode_png(rgba):
+    """Encode an (h, w, 4) uint8 array as a zlib-compressed PNG"""
+    height, width, _ = rgba.shape
+    raw = np.zeros((height, width * 4 + 1), dtype=np.uint8)  # leading 0 = no filter
+    raw[:, 1:] = rgba.reshape(height, -1)
+
+    def chunk(tag, data):
+        return (struct.pack('>I', len(data)) + tag + data +
+                struct.pack('>I', zlib.crc32(tag + data) & 0xffffffff))
+
+    return (b'\x89PNG\r\n\x1a\n' +
+            chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 6, 0, 0, 0)) +
+            chunk(b'IDAT', zlib.compress(raw.tobytes(), 9)) +
+            chunk(b'IEND', b''))
+
+
+def rasterize(curves, width, height):
+    """
+    Draw (y, color) curves of width consecutive segments (width + 1 real samples
+    each) into an RGBA array, all on one vertical scale
+    """
+    image = np.zeros((height, width, 4), dtype=np.uint8)
+    finite_values = np.concatenate([y[np.isfinite(y)] for y, _ in curves] or [np.empty(0)])
+    if not finite_values.size:
+        return image
+
+    # Clip outliers so poles don't flatten the rest of the curve
+    low, high = np.percentile(finite_values, [2, 98])
+    if high - low < 1e-12:
+        low, high = low - 1.0, high + 1.0
+
+    grid = np.arange(height)[:, None]
+    if low <= 0 <= high:
+        zero_row = int(round(high / (high - low) * (height - 1)))
+        image[zero_row, :, :3] = AXIS_COLOR
+        image[zero_row, :, 3] = 60
+
+    for y, color in curves:
+        finite = np.isfinite(y)
+        rows = (high - y) / (high - low) * (height - 1)
+        start, end = rows[:-1], rows[1:]
+        top = np.floor(np.minimum(start, end))
+        bottom = np.ceil(np.maximum(start, end))
+        # Skip segments that are non-finite or jump across the whole image (asymptotes)
+        valid = finite[:-1] & finite[1:] & (bottom - top < height)
+        mask = (grid >= top) & (grid <= bottom) & valid
+        image[mask, :3] = color
+        image[mask, 3] = 255
+    return image
+
+
+def render_thumbnail(graph_data, width=THUMBNAIL_WIDTH, height=THUMBNAIL_HEIGHT):
+    """Render a saved graph to PNG bytes without touching matplotlib or Qt"""
+    x_min = float(graph_data.get('x_min') if graph_data.get('x_min') is not None else -10)
+    x_max = float(graph_data.get('x_max') if graph_data.get('x_max') is not None else 10)
+    if graph_data.get('scale_type') == 'log':
+        x_min = max(1e-10, x_min)
+        x = np.logspace(np.log10(x_min), np.log10(x_max), width + 1)
+    else:
+        x = np.linspace(x_min, x_max, width + 1)
+
+    # Both sides of an equation are drawn; a side that cannot be evaluated
+    # (such as the y of "y = x^2") is left out
+    variable = graph_data.get('variable') or 'x'
+    sides = (graph_data.get('expression') or '').split('=', 1)
+    curves = []
+    for side in sides:
+        try:
+            with np.errstate(all='ignore'):
+                y = expression_engine.compile_expression(side.strip(), variable)(x)
+                curves.append(np.real(np.asarray(y)).astype(float))
+        except Exception:
+            continue
+    return encode_png(rasterize(list(zip(curves, (LINE_COLOR, SECOND_LINE_COLOR))), width, height))
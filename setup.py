@@ -41,6 +41,9 @@ setup(
         'sympy>=1.12,<2.0.0',
         'matplotlib>=3.7.0,<4.0.0',
     ],
+    extras_require={
+        'jit': ['numba>=0.58'],
+    },
     entry_points={
         'console_scripts': [
             'graphing-calculator=advanced_graphing_calculator.graphing_calculator.app:main',
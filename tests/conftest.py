@@ -0,0 +1,11 @@
+# conftest.py
+import os
+import sys
+import tempfile
+
+# The application modules import each other by bare name, as when run from their directory
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                'advanced_graphing_calculator', 'graphing_calculator'))
+
+# Keep generated code and compiled kernels out of the user's cache
+os.environ.setdefault('GRAPHING_CALCULATOR_CACHE', tempfile.mkdtemp(prefix='graphing-calculator-tests-'))
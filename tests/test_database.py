@@ -0,0 +1,180 @@
+# test_database.py
+import sqlite3
+import threading
+
+import pytest
+
+from database import AdvancedDatabase, FrozenDict, WriteQueue
+
+
+@pytest.fixture
+def db(tmp_path):
+    database = AdvancedDatabase(str(tmp_path / 'calculator.db'))
+    yield database
+    database.close()
+
+
+def add_student(db, username):
+    db.add_user(username, 'secret', 'student', username.title(), f'{username}@example.com')
+    return db.get_user_id(username)
+
+
+def save_graph(db, user_id, name, expression='x^2'):
+    return db.save_graph_state(user_id, {
+        'name': name, 'expression': expression, 'variable': 'x',
+        'x_min': -10, 'x_max': 10, 'y_min': -10, 'y_max': 10, 'scale_type': 'linear'
+    })
+
+
+def test_cached_results_are_frozen_and_shared(db):
+    user_id = add_student(db, 'ada')
+    save_graph(db, user_id, 'parabola')
+
+    graphs = db.get_user_graphs(user_id)
+    assert isinstance(graphs, tuple)
+    assert isinstance(graphs[0], FrozenDict)
+    with pytest.raises(TypeError):
+        graphs[0]['name'] = 'changed'
+    with pytest.raises(TypeError):
+        graphs[0].update(name='changed')
+    # A hit returns the very same object, and copies are plain and modifiable
+    assert db.get_user_graphs(user_id) is graphs
+    copy = dict(graphs[0])
+    copy['name'] = 'changed'
+    assert db.get_user_graphs(user_id)[0]['name'] == 'parabola'
+
+
+def test_keyword_arguments_share_the_cache_entry(db):
+    user_id = add_student(db, 'ada')
+    assert db.get_user_graphs(user_id=user_id) is db.get_user_graphs(user_id)
+
+
+def test_own_write_invalidates_cached_reads(db):
+    user_id = add_student(db, 'ada')
+    save_graph(db, user_id, 'first')
+    assert [g['name'] for g in db.get_user_graphs(user_id)] == ['first']
+
+    save_graph(db, user_id, 'second')
+    assert sorted(g['name'] for g in db.get_user_graphs(user_id)) == ['first', 'second']
+    assert db.get_student_summary(user_id)['graph_count'] == 2
+
+
+def test_other_connection_write_invalidates_cached_reads(db):
+    add_student(db, 'ada')
+    assert [s[1] for s in db.get_all_students()] == ['ada']
+    generation = db.query_cache.generation
+
+    conn = sqlite3.connect(db.db_file)
+    conn.execute("INSERT INTO users (username, password, role, full_name, email) "
+                 "VALUES ('bob', 'secret', 'student', 'Bob', 'bob@example.com')")
+    conn.commit()
+    conn.close()
+
+    assert sorted(s[1] for s in db.get_all_students()) == ['ada', 'bob']
+    assert db.query_cache.generation > generation
+
+
+def test_result_read_before_a_write_is_not_cached(db):
+    user_id = add_student(db, 'ada')
+    key = ('get_user_graphs', user_id)
+    generation = db.check_data_version()
+    save_graph(db, user_id, 'parabola')
+    # A result read before the write finished is dropped rather than cached
+    db.query_cache.put(key, (), generation)
+    assert db.query_cache.get(key) == (False, None)
+    assert [g['name'] for g in db.get_user_graphs(user_id)] == ['parabola']
+
+
+def test_failed_write_rolls_back_only_its_own_job(tmp_path):
+    conn = sqlite3.connect(str(tmp_path / 'writes.db'), check_same_thread=False)
+    conn.execute('CREATE TABLE items (name TEXT UNIQUE)')
+    conn.commit()
+    # A long window puts all three jobs in one transaction
+    writer = WriteQueue(conn, threading.Lock(), window=1.0)
+
+    def insert(c, *names):
+        c.executemany('INSERT INTO items (name) VALUES (?)', [(name,) for name in names])
+        return len(names)
+
+    first = writer.submit(insert, 'a')
+    failing = writer.submit(insert, 'b', 'a')  # 'b' is inserted, then 'a' violates UNIQUE
+    last = writer.submit(insert, 'c')
+    assert first.result() == 1
+    with pytest.raises(sqlite3.IntegrityError):
+        failing.result()
+    assert last.result() == 1
+    writer.close()
+
+    assert writer.batches == 1
+    assert [row[0] for row in conn.execute('SELECT name FROM items ORDER BY name')] == ['a', 'c']
+    conn.close()
+
+
+def test_search_index_follows_inserts_updates_and_deletes(db):
+    if not db.has_search:
+        pytest.skip('SQLite built without FTS5')
+    user_id = add_student(db, 'ada')
+    graph_id = save_graph(db, user_id, 'parabola')
+    db.add_comment(graph_id, db.get_user_id('teacher1'), 'Nice vertex')
+    assert [(r['id'], r['source']) for r in db.search('parab')] == [(graph_id, 'graph')]
+    assert [(r['id'], r['source']) for r in db.search('vertex')] == [(graph_id, 'comment')]
+
+    conn = sqlite3.connect(db.db_file)
+    conn.execute("UPDATE graphs SET name = 'hyperbola' WHERE id = ?", (graph_id,))
+    conn.commit()
+    assert db.search('parab') == []
+    assert [r['id'] for r in db.search('hyperbola')] == [graph_id]
+
+    conn.execute('DELETE FROM comments WHERE graph_id = ?', (graph_id,))
+    conn.execute('DELETE FROM graphs WHERE id = ?', (graph_id,))
+    conn.commit()
+    conn.close()
+    assert db.search('hyperbola') == []
+    assert db.search('vertex') == []
+
+
+def summary_row(db, user_id):
+    summary = db.get_student_summary(user_id)
+    return (summary['graph_count'], summary['comment_count'], summary['uncommented_count'],
+            summary['last_activity'], summary['last_comment_at'])
+
+
+def test_deletes_recompute_student_summary(db):
+    user_id = add_student(db, 'ada')
+    teacher_id = db.get_user_id('teacher1')
+    conn = sqlite3.connect(db.db_file)
+    graph_ids = []
+    for name, created_at in (('old', '2024-01-01 10:00:00'), ('new', '2024-01-02 10:00:00')):
+        cursor = conn.execute("INSERT INTO graphs (user_id, name, expression, variable, created_at) "
+                              "VALUES (?, ?, 'x', 'x', ?)", (user_id, name, created_at))
+        graph_ids.append(cursor.lastrowid)
+    old_graph, new_graph = graph_ids
+    comments = [(old_graph, 'first', '2024-01-03 10:00:00'), (old_graph, 'second', '2024-01-05 10:00:00'),
+                (new_graph, 'third', '2024-01-04 10:00:00')]
+    comment_ids = [conn.execute("INSERT INTO comments (graph_id, teacher_id, comment_text, created_at) "
+                                "VALUES (?, ?, ?, ?)", (graph_id, teacher_id, text, created_at)).lastrowid
+                   for graph_id, text, created_at in comments]
+    conn.commit()
+    assert summary_row(db, user_id) == (2, 3, 0, '2024-01-02 10:00:00', '2024-01-05 10:00:00')
+
+    # The newest comment goes: the student's last comment is the next newest
+    conn.execute('DELETE FROM comments WHERE id = ?', (comment_ids[1],))
+    conn.commit()
+    assert summary_row(db, user_id) == (2, 2, 0, '2024-01-02 10:00:00', '2024-01-04 10:00:00')
+
+    # The newest graph goes with its comment
+    conn.execute('DELETE FROM comments WHERE graph_id = ?', (new_graph,))
+    conn.execute('DELETE FROM graphs WHERE id = ?', (new_graph,))
+    conn.commit()
+    assert summary_row(db, user_id) == (1, 1, 0, '2024-01-01 10:00:00', '2024-01-03 10:00:00')
+
+    # The last comment goes: the remaining graph is uncommented again
+    conn.execute('DELETE FROM comments WHERE id = ?', (comment_ids[0],))
+    conn.commit()
+    conn.close()
+    assert summary_row(db, user_id) == (1, 0, 1, '2024-01-01 10:00:00', None)
+
+    # The triggers agree with a full rebuild
+    maintained = summary_row(db, user_id)
+    db.rebuild_summaries()
+    assert summary_row(db, user_id) == maintained
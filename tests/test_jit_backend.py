@@ -0,0 +1,123 @@
+# test_jit_backend.py
+import importlib
+import sys
+
+import numpy as np
+import pytest
+
+import expression_engine
+import jit_backend
+
+# Expressions the kernel must reproduce: polynomials and rational functions, then
+# transcendental functions including the helpers defined in jit_backend.PRELUDE
+ARITHMETIC = [
+    'x^2 + 3*x - 1',
+    '2*x^5 - 4*x^3 + x - 7',
+    '(x + 1)*(x - 2)/(x^2 + 1)',
+    '1/x',
+    '7',
+    'pi*x + E',
+]
+TRANSCENDENTAL = [
+    'sin(x)*exp(-x^2/10)',
+    'ln(abs(x) + 1)',
+    'sqrt(abs(x))',
+    'sqrt(x)',
+    'tanh(x) + cosh(x/5)',
+    'sec(x) + csc(x) - cot(x)',
+    'atan(x) + asin(x/20) + acos(x/20)',
+    'log(x^2 + 1)/log(10)',
+    'floor(x) + abs(x)',
+]
+# Complex results and functions Numba cannot compile (scipy.special) stay on NumPy
+FALLBACK = [
+    'x + I',
+    'gamma(x)',
+    'erf(x)',
+]
+
+
+def numpy_reference(text, x):
+    compiled = expression_engine.compile_expression(text)
+    with np.errstate(all='ignore'):
+        return np.broadcast_to(compiled.func(x), x.shape)
+
+
+def kernel_for(text, cache_dir):
+    compiled = expression_engine.compile_expression(text)
+    return jit_backend.compile_kernel(text, compiled.source, compiled.func, str(cache_dir))
+
+
+@pytest.fixture
+def numba_required():
+    pytest.importorskip('numba')
+    if not jit_backend.available():
+        pytest.skip("jit_backend was imported without Numba")
+
+
+@pytest.mark.parametrize('text', ARITHMETIC + TRANSCENDENTAL)
+def test_kernel_matches_numpy(numba_required, tmp_path, text):
+    evaluate = kernel_for(text, tmp_path)
+    assert evaluate is not None
+    x = np.concatenate([np.linspace(-50.0, 50.0, 10007), jit_backend.probe_points()])
+    actual = np.empty_like(x)
+    with np.errstate(all='ignore'):
+        evaluate(x, actual)
+    np.testing.assert_allclose(actual, numpy_reference(text, x),
+                               rtol=jit_backend.RTOL, atol=jit_backend.ATOL, equal_nan=True)
+
+
+@pytest.mark.parametrize('text', FALLBACK)
+def test_unsupported_expressions_fall_back(numba_required, tmp_path, text):
+    assert kernel_for(text, tmp_path) is None
+
+
+def test_kernel_is_reused_from_disk(numba_required, tmp_path):
+    first = kernel_for('x^3 - 2*x', tmp_path)
+    second = kernel_for('x^3 - 2*x', tmp_path)
+    assert first is not None and second is not None
+    assert len(list(tmp_path.glob('jit_*.py'))) == 1
+
+
+def test_disagreeing_kernel_is_rejected():
+    def wrong(x, out):
+        out[:] = x + 1e-6
+
+    assert not jit_backend.agrees(wrong, lambda x: x)
+    assert jit_backend.agrees(lambda x, out: np.copyto(out, x), lambda x: x)
+
+
+@pytest.mark.parametrize('text', ['x^2 - 4', 'sin(x)/x', 'x + I'])
+def test_jit_grid_matches_numpy_grid(numba_required, text):
+    compiled = expression_engine.CompiledExpression(text)
+    x_numpy, numpy_outputs = expression_engine.evaluate_grid(compiled, -10, 10, 50000, block_size=4096)
+    x_jit, jit_outputs = expression_engine.evaluate_grid(compiled, -10, 10, 50000, block_size=4096,
+                                                         backend='jit')
+    np.testing.assert_array_equal(x_jit, x_numpy)
+    assert len(jit_outputs) == len(numpy_outputs) == 1
+    assert jit_outputs[0].dtype == numpy_outputs[0].dtype
+    np.testing.assert_allclose(jit_outputs[0], numpy_outputs[0],
+                               rtol=jit_backend.RTOL, atol=jit_backend.ATOL, equal_nan=True)
+
+
+@pytest.fixture
+def without_numba(monkeypatch):
+    """jit_backend re-imported as if Numba were not installed"""
+    monkeypatch.setitem(sys.modules, 'numba', None)
+    module = importlib.reload(jit_backend)
+    yield module
+    monkeypatch.undo()
+    importlib.reload(jit_backend)
+
+
+def test_missing_numba_falls_back_silently(without_numba, tmp_path, caplog):
+    assert not without_numba.available()
+    compiled = expression_engine.compile_expression('x^2 + 1')
+    assert without_numba.compile_kernel('x^2 + 1', compiled.source, compiled.func, str(tmp_path)) is None
+    assert list(tmp_path.iterdir()) == []
+
+    fresh = expression_engine.CompiledExpression('x^2 + 1')
+    assert fresh.jit_kernel() is None
+    x, outputs = expression_engine.evaluate_grid(fresh, -3, 3, 1001, backend='jit')
+    np.testing.assert_allclose(outputs[0], x ** 2 + 1)
+    assert not [record for record in caplog.records if record.levelname in ('WARNING', 'ERROR')]